@@ -1,10 +1,9 @@
-"""Wrapper for LLMs' API. Need transformers>=4.31.0 to use Llama-2."""
+"""Wrapper for LLMs' API. Need transformers>=4.31.0 to use Llama-2.
+
+The API clients and transformers are imported when a model is created, so importing this module stays cheap.
+"""
 import os
-import openai
-from litellm import completion
-import torch
 from copy import deepcopy
-from transformers import pipeline, AutoTokenizer, AutoModel
 
 class LLM:
     def __init__(self, api_type, model_name_or_path, system_instruction=None, generation_kwargs=None):
@@ -76,20 +75,23 @@ class OpenAI_API(BaseLLM):
     def __init__(self, model_name_or_path) -> None:
         # make sure you set the OPENAI_API_KEY environment variable by ``export OPENAI_API_KEY=YOUR_API_KEY`` in command line
         # or you can set through ``os.environ['OPENAI_API_KEY'] = YOUR_API_KEY`` in the code
+        import openai
         openai.api_key = os.getenv("OPENAI_API_KEY")
         if openai.api_key is None:
             raise ValueError('OPENAI_API_KEY is not set')
         self.model_name_or_path = model_name_or_path
     
     def chat(self, messages, **kwargs) -> str:
-        completion = completion(
+        from litellm import completion
+        response = completion(
             model=self.model_name_or_path,
             messages=messages,
             **kwargs
         )
-        return completion.choices[0].message['content']
+        return response.choices[0].message['content']
     
     def generate(self, system_instruction, prompt, **kwargs) -> str:
+        import openai
         completion = openai.ChatCompletion.create(
             model=self.model_name_or_path,
             messages=[
@@ -104,6 +106,7 @@ class ChatGLM2(BaseLLM):
     DEFAULT_SYSTEM_INSTRUCTION = "You are a helpful assistant."
 
     def __init__(self, model_name_or_path):
+        from transformers import AutoTokenizer, AutoModel
         self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, trust_remote_code=True)
         self.model = AutoModel.from_pretrained(model_name_or_path, trust_remote_code=True).half().cuda()
         self.model = self.model.eval()
@@ -130,6 +133,8 @@ class HFModels(BaseLLM):
 
     def __init__(self, model_name_or_path) -> None:
         # login through command line "huggingface-cli login" to assess some models such as LLaMa-2
+        import torch
+        from transformers import pipeline, AutoTokenizer
         self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
         """Need transformers>=4.31.0 to use Llama-2."""
         self.pipeline = pipeline(
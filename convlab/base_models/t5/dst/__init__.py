@@ -1 +1,6 @@
-from convlab.base_models.t5.dst.dst import T5DST
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'T5DST': 'convlab.base_models.t5.dst.dst',
+})
+__all__ = ['T5DST']
@@ -1 +1,6 @@
-from convlab.base_models.t5.nlg.nlg import T5NLG
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'T5NLG': 'convlab.base_models.t5.nlg.nlg',
+})
+__all__ = ['T5NLG']
@@ -1 +1,6 @@
-from convlab.base_models.t5.nlu.nlu import T5NLU
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'T5NLU': 'convlab.base_models.t5.nlu.nlu',
+})
+__all__ = ['T5NLU']
@@ -12,6 +12,13 @@ E.g:
     "port": 8787,           // (not default), Backend service open port
     "app_name": "convlab"      // (not default), Service access interface path name
     "session_time_out": 300 // (default as 600), The longest life cycle (seconds) in which a session is idle
+    "async_mode": false,    // (default as false), Serve module calls through the asyncio engine
+    "expire_interval": 10,  // (default as 10), async mode: seconds between background clearing of expired sessions
+    "max_batch_size": 8,    // (default as 8), async mode: max requests coalesced into a micro-batch, for models with a batched forward
+    "batch_wait_ms": 5,     // (default as 5), async mode: how long a micro-batch waits for more requests, for models with a batched forward
+    "max_turns": 20,        // (default as null), Number of last turns of a session that can be rolled back, null for all
+    "spill_dir": "/tmp/s",  // (default as null), Directory where idle sessions are stored when too many are open
+    "max_sessions_in_memory": 100  // (default as null), Max number of sessions kept in memory when `spill_dir` is set
   },
 
   "nlu":                    // (Can not be empty), models list of nlu module
@@ -78,6 +85,13 @@ def load_config_file(filepath: str = None) -> dict:
     # check net
     conf['net'].setdefault('app_name', '')
     conf['net'].setdefault('session_time_out', 600)
+    conf['net'].setdefault('async_mode', False)
+    conf['net'].setdefault('expire_interval', 10)
+    conf['net'].setdefault('max_batch_size', 8)
+    conf['net'].setdefault('batch_wait_ms', 5)
+    conf['net'].setdefault('max_turns', None)
+    conf['net'].setdefault('spill_dir', None)
+    conf['net'].setdefault('max_sessions_in_memory', None)
     assert isinstance(conf['net'].get('port', None), int), 'Incorrect key \'net\'->\'port\' in config file \'%s\'' % filepath
     assert isinstance(conf['net'].get('app_name', None), str), 'Incorrect key \'net\'->\'app_name\' in config file \'%s\'' % filepath
 
@@ -2,3 +2,4 @@
 # -*- coding: utf-8 -*-
 from deploy.ctrl.module import ModuleCtrl
 from deploy.ctrl.session import SessionCtrl
+from deploy.ctrl.engine import AsyncEngine
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio serving engine.
+
+An event loop runs in a background thread. Every model gets a dispatcher with `max_core` workers, one per
+model instance. Each request runs on its own free instance; only models with a batched forward
+(`ModelCtrl.supports_batch`) coalesce requests that arrive close together into a micro-batch, which runs in
+one call on one instance. Request threads (flask / gunicorn) submit module calls into the loop and wait for
+their result, so different sessions are served concurrently while every model still runs at most `max_core`
+calls at a time.
+"""
+import asyncio
+import logging
+import threading as th
+from concurrent.futures import ThreadPoolExecutor
+from deploy.utils import DeployError
+
+
+class ModelDispatcher(object):
+    def __init__(self, model_ctrl, method: str, loop, max_batch_size: int = 8, batch_wait: float = 0.005):
+        self.model_ctrl = model_ctrl
+        self.method = method
+        self.loop = loop
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_wait = batch_wait
+        self.batched = self.max_batch_size > 1 and model_ctrl.supports_batch(method)
+        self.executor = ThreadPoolExecutor(max_workers=model_ctrl.max_core,
+                                           thread_name_prefix='model-%s' % model_ctrl.model_id)
+        self.queue = asyncio.Queue()
+        self.workers = [loop.create_task(self.__worker()) for _ in range(model_ctrl.max_core)]
+
+    async def submit(self, cache, isfirst, params, input_nl, input_act):
+        future = self.loop.create_future()
+        await self.queue.put(((cache, isfirst, params, input_nl, input_act), future))
+        return await future
+
+    async def __collect_batch(self):
+        batch = [await self.queue.get()]
+        deadline = self.loop.time() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def __run_batch(self, requests):
+        if len(requests) == 1:
+            try:
+                return [self.model_ctrl.run(self.method, *requests[0])]
+            except DeployError as e:
+                return [e]
+        return self.model_ctrl.run_batch(self.method, requests)
+
+    async def __worker(self):
+        while True:
+            if self.batched:
+                batch = await self.__collect_batch()
+            else:
+                # no batched forward: every request goes to its own free instance right away
+                batch = [await self.queue.get()]
+            requests = [request for request, _ in batch]
+            try:
+                results = await self.loop.run_in_executor(self.executor, self.__run_batch, requests)
+            except Exception as e:
+                results = [DeployError('running error:%s' % str(e), model=self.model_ctrl.model_id) for _ in batch]
+            for (_, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.executor.shutdown(wait=False)
+
+
+class AsyncEngine(object):
+    def __init__(self, max_batch_size: int = 8, batch_wait_ms: float = 5):
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000.
+        self.dispatchers = {}
+        self.periodic_tasks = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = th.Thread(target=self.__run_loop, name='async-engine', daemon=True)
+        self.thread.start()
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def __call_in_loop(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def __get_dispatcher(self, model_ctrl, method):
+        key = (id(model_ctrl), method)
+        if key not in self.dispatchers:
+            self.dispatchers[key] = ModelDispatcher(model_ctrl, method, self.loop, self.max_batch_size,
+                                                    self.batch_wait)
+        return self.dispatchers[key]
+
+    async def __run(self, model_ctrl, method, cache, isfirst, params, input_nl, input_act):
+        dispatcher = await self.__get_dispatcher(model_ctrl, method)
+        return await dispatcher.submit(cache, isfirst, params, input_nl, input_act)
+
+    def run(self, model_ctrl, method, cache, isfirst, params, input_nl, input_act):
+        """Blocking call from a request thread, same signature and result as `ModelCtrl.run`."""
+        return self.__call_in_loop(self.__run(model_ctrl, method, cache, isfirst, params, input_nl, input_act))
+
+    def run_periodic(self, func, interval: float):
+        """Call `func` every `interval` seconds in the default executor, e.g. to drop expired sessions."""
+        async def periodic():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.loop.run_in_executor(None, func)
+                except Exception:
+                    logging.exception('periodic task %s failed', getattr(func, '__name__', func))
+
+        async def start():
+            self.periodic_tasks.append(self.loop.create_task(periodic()))
+
+        self.__call_in_loop(start())
+
+    async def __close(self):
+        for task in self.periodic_tasks:
+            task.cancel()
+        await asyncio.gather(*self.periodic_tasks, return_exceptions=True)
+        for dispatcher in self.dispatchers.values():
+            await dispatcher.close()
+        self.dispatchers.clear()
+
+    def close(self):
+        self.__call_in_loop(self.__close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+if __name__ == '__main__':
+    pass
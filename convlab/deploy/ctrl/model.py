@@ -4,7 +4,7 @@
 """
 
 """
-import copy
+import logging
 from deploy.utils import MyLock, ResourceLock, DeployError
 
 
@@ -77,10 +77,50 @@ class ModelCtrl(object):
 
     def run(self, method, cache, isfirst, params, input_nl, input_act):
         res_idx = self.res_lock.res_catch()
-        print('+++++ catch res ' + str(res_idx) + ' ' + self.model_id)
+        logging.debug('+++++ catch res %d %s', res_idx, self.model_id)
+        try:
+            ret_data, new_cache = self.__run_on(self.models[res_idx], method, cache, isfirst, params, input_nl,
+                                                input_act)
+        finally:
+            logging.debug('----- leave res %d %s', res_idx, self.model_id)
+            self.res_lock.res_leave(res_idx)
+
+        return ret_data, new_cache
+
+    def supports_batch(self, method):
+        """Whether the model class has a batched forward `<method>_batch` (see `run_batch`)."""
+        return callable(getattr(self.model_class, '%s_batch' % method, None))
+
+    def run_batch(self, method, requests):
+        """
+        Run several requests in one call of the batched forward of a single model instance.
+        The model method `<method>_batch(requests)` takes the requests as below and returns one (ret_data, new_cache)
+        tuple, or the exception raised for that request, per request.
+        :param method: str, method of the model to call
+        :param requests: list of (cache, isfirst, params, input_nl, input_act) tuples, as the arguments of `run`
+        :return: list of (ret_data, new_cache) tuples, or the DeployError raised by that request
+        """
+        res_idx = self.res_lock.res_catch()
+        logging.debug('+++++ catch res %d %s for %d requests', res_idx, self.model_id, len(requests))
         try:
-            # get model
             model = self.models[res_idx]
+            if model is None:
+                raise DeployError('Model has not started yet.', model=self.model_id)
+            try:
+                results = getattr(model, '%s_batch' % method)(requests)
+            except Exception as e:
+                if not isinstance(e, DeployError):
+                    e = DeployError('running error:%s' % str(e), model=self.model_id)
+                return [e for _ in requests]
+            return [result if not isinstance(result, Exception) or isinstance(result, DeployError)
+                    else DeployError('running error:%s' % str(result), model=self.model_id) for result in results]
+        finally:
+            logging.debug('----- leave res %d %s', res_idx, self.model_id)
+            self.res_lock.res_leave(res_idx)
+
+    def __run_on(self, model, method, cache, isfirst, params, input_nl, input_act):
+        try:
+            # get model
             if model is None:
                 raise DeployError('Model has not started yet.', model=self.model_id)
 
@@ -99,17 +139,14 @@ class ModelCtrl(object):
             # process
             ret_data = getattr(model, method)(*params)
 
-            # save cache
-            new_cache = copy.deepcopy(getattr(model, 'to_cache')())
+            # save cache, to_cache returns a copy of the model state (e.g. DST.to_cache)
+            new_cache = getattr(model, 'to_cache')()
 
         except Exception as e:
             if not isinstance(e, DeployError):
                 raise DeployError('running error:%s' % str(e), model=self.model_id)
             else:
                 raise e
-        finally:
-            print('----- leave res ' + str(res_idx) + ' ' + self.model_id)
-            self.res_lock.res_leave(res_idx)
 
         return ret_data, new_cache
 
@@ -11,12 +11,14 @@ from deploy.utils import DeployError
 class ModuleCtrl(object):
     mod2method = {'nlu': 'predict', 'dst': 'update', 'policy': 'predict', 'nlg': 'generate'}
 
-    def __init__(self, module_name: str, infos: dict):
+    def __init__(self, module_name: str, infos: dict, engine=None):
         assert module_name in self.mod2method.keys(), 'Unknow module name \'%s\'' % module_name
         self.module_name = module_name
         self.method = self.mod2method[self.module_name]
         self.infos = copy.deepcopy(infos)
         self.models = {mid: ModelCtrl(mid, **self.infos[mid]) for mid in self.infos.keys()}
+        # AsyncEngine in async serving mode, calls then go through its per-model dispatchers
+        self.engine = engine
 
     def add_used_num(self, model_id: str):
         try:
@@ -33,7 +35,14 @@ class ModuleCtrl(object):
 
     def run(self, model_id, cache, isfirst, params, input_nl, input_act):
         try:
-            ret = self.models[model_id].run(self.method, cache, isfirst, params, input_nl, input_act)
+            model = self.models[model_id]
+        except (TypeError, KeyError):
+            raise DeployError('Unknow model id \'%s\'' % model_id, module=self.module_name)
+        try:
+            if self.engine is not None:
+                ret = self.engine.run(model, self.method, cache, isfirst, params, input_nl, input_act)
+            else:
+                ret = model.run(self.method, cache, isfirst, params, input_nl, input_act)
         except TypeError:
             raise DeployError('Unknow model id \'%s\'' % model_id, module=self.module_name)
         return ret
@@ -4,25 +4,61 @@
 """
 
 """
+import os
+import pickle
 import uuid
-from deploy.utils import MyLock, ExpireDict
+from deploy.utils import MyLock, ExpireDict, DeployError
+from deploy.utils.snapshot import diff, patch
 
 
 class SessionCtrl(object):
+    # parts of a turn that only the last turn keeps in full, the module caches and the module returns
+    FULL_KEYS = ('cache', 'return')
 
-    def __init__(self, max_items=None, expire_sec=None):
+    def __init__(self, max_items=None, expire_sec=None, max_turns=None, spill_dir=None, max_in_memory=None):
+        """
+        :param max_items: int, max number of sessions
+        :param expire_sec: int, seconds a session may stay idle
+        :param max_turns: int, number of last turns whose module caches and returns are kept for rollback, None for all
+        :param spill_dir: str, directory where idle sessions are pickled when more than `max_in_memory` are open
+        :param max_in_memory: int, max number of sessions kept in memory when `spill_dir` is set
+        """
         self.sessions = ExpireDict(max_items, expire_sec)
         # self.sessions = ExpireDict(2, expire_sec)
         self.lock = MyLock()
+        self.max_turns = max_turns
+        self.spill_dir = spill_dir
+        self.max_in_memory = max_in_memory
+        # tokens of sessions fetched by a request and not yet set back, these are never spilled
+        self.checked_out = set()
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
 
     def get_session(self, token) -> dict:
-        return self.sessions[token]
+        with self.lock:
+            self.checked_out.add(token)
+            session = self.sessions[token]
+            if 'spilled' in session:
+                session = self.__load_spilled(token)
+        self.__spill_idle()
+        return session
 
     def set_session(self, token, data):
-        self.sessions[token] = data
+        with self.lock:
+            old = self.sessions.get(token)
+            if old is not None and 'spilled' in old:
+                self.__remove_spilled(old)
+            self.sessions[token] = data
+            self.checked_out.discard(token)
+        self.__spill_idle()
 
     def pop_session(self, token) -> dict:
-        return self.sessions.pop(token)
+        with self.lock:
+            session = self.sessions.pop(token)
+            self.checked_out.discard(token)
+            if 'spilled' in session:
+                self.__remove_spilled(session)
+        return session
 
     def has_token(self, token) -> bool:
         return token in self.sessions.keys()
@@ -31,10 +67,99 @@ class SessionCtrl(object):
         with self.lock:
             token = self.__new_token()
             self.sessions[token] = self.__new_data(nlu, dst, policy, nlg)
+        self.__spill_idle()
         return token
 
     def pop_expire_session(self):
-        return self.sessions.pop_expire()
+        with self.lock:
+            expire_session = self.sessions.pop_expire()
+            for token, session in expire_session.items():
+                self.checked_out.discard(token)
+                if 'spilled' in session:
+                    self.__remove_spilled(session)
+        return expire_session
+
+    def push_turn(self, session, turn):
+        """
+        Append a turn to a session. Only the new last turn keeps its module caches and returns in full, the
+        previous one keeps the deltas back to its own, and turns older than `max_turns` drop them.
+        """
+        turns = session['turns']
+        if turns:
+            last_turn = turns[-1]
+            for key in self.FULL_KEYS:
+                last_turn['%s_delta' % key] = diff(turn[key], last_turn[key])
+                last_turn[key] = None
+        turns.append(turn)
+        if self.max_turns is not None:
+            for old_turn in turns[:-self.max_turns - 1]:
+                for key in self.FULL_KEYS:
+                    old_turn['%s_delta' % key] = None
+
+    def pop_turns(self, session, num=1):
+        """
+        Remove the last `num` turns of a session and restore the module caches and returns of the new last turn.
+        :return: list, the removed turns
+        """
+        turns = session['turns']
+        if num <= 0:
+            return []
+        if num >= len(turns):
+            # nothing is left to restore
+            popped = turns[:]
+            del turns[:]
+            return popped
+        if any(turn.get('cache_delta') is None for turn in turns[-num - 1:-1]):
+            raise DeployError('Can not roll back more than %d turns.' % self.max_turns)
+
+        restored = {}
+        for key in self.FULL_KEYS:
+            value = turns[-1][key]
+            for turn in turns[-num - 1:-1][::-1]:
+                value = patch(value, turn['%s_delta' % key])
+            restored[key] = value
+        popped = turns[-num:]
+        del turns[-num:]
+        if turns:
+            for key in self.FULL_KEYS:
+                turns[-1][key] = restored[key]
+                turns[-1]['%s_delta' % key] = None
+        return popped
+
+    def __spill_path(self, token):
+        return os.path.join(self.spill_dir, '%s.pkl' % token)
+
+    def __spill_idle(self):
+        # pickle the least recently used sessions until at most `max_in_memory` are left in memory, sessions a
+        # request has checked out stay in memory
+        if self.spill_dir is None or self.max_in_memory is None:
+            return
+        with self.lock:
+            in_memory = [(stamp, token) for token, (stamp, value) in list(self.sessions.values.items())
+                         if 'spilled' not in value and token not in self.checked_out]
+            if len(in_memory) <= self.max_in_memory:
+                return
+            for _, token in sorted(in_memory)[:len(in_memory) - self.max_in_memory]:
+                session = self.sessions.values[token][1]
+                path = self.__spill_path(token)
+                with open(path, 'wb') as f:
+                    pickle.dump(session, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self.sessions.replace(token, {'model_map': session['model_map'], 'spilled': path})
+
+    def __load_spilled(self, token):
+        session = self.sessions[token]
+        if 'spilled' not in session:  # loaded by another thread meanwhile
+            return session
+        with open(session['spilled'], 'rb') as f:
+            data = pickle.load(f)
+        self.__remove_spilled(session)
+        self.sessions.replace(token, data)
+        return self.sessions[token]
+
+    @staticmethod
+    def __remove_spilled(session):
+        if os.path.exists(session['spilled']):
+            os.remove(session['spilled'])
 
     def __new_data(self, nlu, dst, policy, nlg):
         return {
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Check rollback and spilling of SessionCtrl.
+
+    cd convlab && python -m pytest deploy/ctrl/test_session.py
+"""
+import os
+import tempfile
+
+from deploy.ctrl.session import SessionCtrl
+
+
+def make_turn(i):
+    history = [['user', str(j)] for j in range(i + 1)]
+    return {'data': str(i), 'cache': {'dst': {'history': history}}, 'return': {'dst': {'turn': i}}}
+
+
+def test_full_rollback_with_max_turns():
+    ctrl = SessionCtrl(max_turns=1)
+    token = ctrl.new_session('nlu', 'dst', 'policy', 'nlg')
+    session = ctrl.get_session(token)
+    for i in range(4):
+        ctrl.push_turn(session, make_turn(i))
+    ctrl.pop_turns(session, 1)
+    assert session['turns'][-1]['return'] == {'dst': {'turn': 2}}
+    popped = ctrl.pop_turns(session, 3)
+    assert [turn['data'] for turn in popped] == ['0', '1', '2']
+    assert session['turns'] == []
+
+
+def test_checked_out_session_is_not_spilled():
+    with tempfile.TemporaryDirectory() as spill_dir:
+        ctrl = SessionCtrl(spill_dir=spill_dir, max_in_memory=1)
+        token = ctrl.new_session('nlu', 'dst', 'policy', 'nlg')
+        session = ctrl.get_session(token)
+        other = ctrl.new_session('nlu', 'dst', 'policy', 'nlg')
+        assert 'spilled' not in ctrl.sessions[token]
+        ctrl.push_turn(session, make_turn(0))
+        ctrl.set_session(token, session)
+        # the other session is spilled instead, and nothing is left on disk for the one set back
+        assert 'spilled' in ctrl.sessions[other]
+        assert os.listdir(spill_dir) == ['%s.pkl' % other]
+        assert ctrl.get_session(other)['turns'] == []
+        assert ctrl.get_session(token)['turns'][0]['data'] == '0'
+
+
+if __name__ == '__main__':
+    test_full_rollback_with_max_turns()
+    test_checked_out_session_is_not_spilled()
+    print('session tests passed')
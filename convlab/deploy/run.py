@@ -51,8 +51,9 @@ def net_function(fun):
     params = get_params_from_request(request)
     ret = {}
     try:
-        # clear expire session every time
-        del_tokens = ctrl_server.on_clear_expire()
+        # clear expire session every time, unless a background task does it
+        if not ctrl_server.expire_in_background or fun == 'clear_expire':
+            del_tokens = ctrl_server.on_clear_expire()
 
         if fun == 'models':
             ret = ctrl_server.on_models()
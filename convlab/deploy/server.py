@@ -6,7 +6,7 @@ Backend service response service class
 """
 import json
 import copy
-from deploy.ctrl import ModuleCtrl, SessionCtrl
+from deploy.ctrl import ModuleCtrl, SessionCtrl, AsyncEngine
 from deploy.utils import DeployError
 
 MODULES = ['nlu', 'dst', 'policy', 'nlg']
@@ -21,8 +21,20 @@ class ServerCtrl(object):
             'policy': copy.deepcopy(kwargs['policy']),
             'nlg': copy.deepcopy(kwargs['nlg'])
         }
-        self.modules = {mdl: ModuleCtrl(mdl, self.module_conf[mdl]) for mdl in self.module_conf.keys()}
-        self.sessions = SessionCtrl(expire_sec=self.net_conf['session_time_out'])
+        self.engine = None
+        if self.net_conf.get('async_mode', False):
+            self.engine = AsyncEngine(max_batch_size=self.net_conf.get('max_batch_size', 8),
+                                      batch_wait_ms=self.net_conf.get('batch_wait_ms', 5))
+        self.modules = {mdl: ModuleCtrl(mdl, self.module_conf[mdl], self.engine) for mdl in self.module_conf.keys()}
+        self.sessions = SessionCtrl(expire_sec=self.net_conf['session_time_out'],
+                                    max_turns=self.net_conf.get('max_turns', None),
+                                    spill_dir=self.net_conf.get('spill_dir', None),
+                                    max_in_memory=self.net_conf.get('max_sessions_in_memory', None))
+
+        # in async mode expired sessions are cleared by a background task instead of on every request
+        self.expire_in_background = self.engine is not None
+        if self.expire_in_background:
+            self.engine.run_periodic(self.on_clear_expire, self.net_conf.get('expire_interval', 10))
 
     def on_models(self):
         ret = {}
@@ -84,7 +96,7 @@ class ServerCtrl(object):
                               input_module=input_module,
                               data=data,
                               modified_output=modified_output)
-        session['turns'].append(cur_turn)
+        self.sessions.push_turn(session, cur_turn)
         self.sessions.set_session(token, session)
 
         return ServerCtrl._response_from_session(session['turns'])
@@ -97,8 +109,7 @@ class ServerCtrl(object):
         if not session['turns']:
             raise DeployError('This is the first turn in this session.')
 
-        last_turn = session['turns'][-1]
-        session['turns'] = session['turns'][:-1]
+        last_turn = self.sessions.pop_turns(session, 1)[0]
 
         for (key, value) in modified_output.items():
             last_turn['modified_output'][key] = value
@@ -109,7 +120,7 @@ class ServerCtrl(object):
                               input_module=last_turn['input_module'],
                               data=last_turn['data'],
                               modified_output=last_turn['modified_output'])
-        session['turns'].append(cur_turn)
+        self.sessions.push_turn(session, cur_turn)
         self.sessions.set_session(token, session)
 
         return ServerCtrl._response_from_session(session['turns'])
@@ -119,7 +130,7 @@ class ServerCtrl(object):
             raise DeployError('No such token:\'%s\'' % token)
         session = self.sessions.get_session(token)
 
-        session['turns'] = session['turns'][:-back_turns]
+        self.sessions.pop_turns(session, int(back_turns))
         self.sessions.set_session(token, session)
 
         return ServerCtrl._response_from_session(session['turns'])
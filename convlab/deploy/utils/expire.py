@@ -46,6 +46,11 @@ class ExpireDict(object):
             self.__delitem(key)
         return ret
 
+    def replace(self, key, value):
+        """set the value of an existing key without refreshing its time stamp"""
+        with self.lock:
+            self.values[key][1] = value
+
     def pop_expire(self):
         with self.lock:
             ret = {}
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Deltas between module caches of consecutive turns.
+
+A session only keeps the cache of its last turn in full. Every earlier turn keeps the delta that turns
+the cache of the following turn back into its own, so rolling back applies deltas from the last turn
+backwards. Caches mostly grow by appending to lists (e.g. the dst history), which makes these deltas a
+truncation and keeps them small.
+
+Deltas are lists:
+    ['k']                        keep the value
+    ['r', value]                 replace by value
+    ['d', {key: delta}, [keys]]  update some keys of a dict and remove others
+    ['t', length]                truncate a list
+    ['e', items]                 extend a list
+    ['l', {index: delta}]        update some items of a list of the same length
+"""
+import copy
+
+KEEP = ['k']
+
+
+def _equal(a, b) -> bool:
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    try:
+        return bool(a == b)
+    except Exception:  # e.g. arrays or tensors with more than one element
+        return False
+
+
+def diff(src, dst):
+    """
+    Compute the delta that turns `src` into `dst`.
+    :param src: the cache to start from
+    :param dst: the cache to arrive at, values taken from it are deep copied
+    :return: list, delta
+    """
+    if type(src) is dict and type(dst) is dict:
+        changes = {}
+        for key, value in dst.items():
+            if key in src:
+                delta = diff(src[key], value)
+                if delta != KEEP:
+                    changes[key] = delta
+            else:
+                changes[key] = ['r', copy.deepcopy(value)]
+        removed = [key for key in src if key not in dst]
+        if not changes and not removed:
+            return KEEP
+        return ['d', changes, removed]
+
+    if type(src) is list and type(dst) is list:
+        if len(dst) < len(src) and all(_equal(a, b) for a, b in zip(src, dst)):
+            return ['t', len(dst)]
+        if len(dst) > len(src) and all(_equal(a, b) for a, b in zip(src, dst)):
+            return ['e', copy.deepcopy(dst[len(src):])]
+        if len(dst) == len(src):
+            changes = {}
+            for idx, (a, b) in enumerate(zip(src, dst)):
+                delta = diff(a, b)
+                if delta != KEEP:
+                    changes[idx] = delta
+            return ['l', changes] if changes else KEEP
+        return ['r', copy.deepcopy(dst)]
+
+    if _equal(src, dst):
+        return KEEP
+    return ['r', copy.deepcopy(dst)]
+
+
+def patch(value, delta):
+    """
+    Apply a delta computed by `diff`. `value` is not modified, but the result may share unchanged parts with it.
+    :param value: the cache `delta` was computed from
+    :param delta: list, delta
+    :return: the patched cache
+    """
+    op = delta[0]
+    if op == 'k':
+        return value
+    if op == 'r':
+        return copy.deepcopy(delta[1])
+    if op == 'd':
+        ret = dict(value)
+        for key, sub_delta in delta[1].items():
+            ret[key] = patch(value.get(key), sub_delta)
+        for key in delta[2]:
+            ret.pop(key, None)
+        return ret
+    if op == 't':
+        return value[:delta[1]]
+    if op == 'e':
+        return value + copy.deepcopy(delta[1])
+    if op == 'l':
+        ret = list(value)
+        for idx, sub_delta in delta[1].items():
+            ret[idx] = patch(value[idx], sub_delta)
+        return ret
+    raise ValueError('Unknown delta operation \'%s\'' % op)
+
+
+if __name__ == '__main__':
+    old = {'history': [['usr', 'hi'], ['sys', 'hello']], 'belief_state': {'hotel': {'area': ''}}}
+    new = {'history': [['usr', 'hi'], ['sys', 'hello'], ['usr', 'a hotel in the north']],
+           'belief_state': {'hotel': {'area': 'north'}}}
+    delta = diff(new, old)
+    print(delta)
+    assert patch(new, delta) == old
@@ -1 +1,6 @@
-from convlab.dst.comer.multiwoz.comer import ComerTracker as COMER
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'COMER': ('convlab.dst.comer.multiwoz.comer', 'ComerTracker'),
+})
+__all__ = ['COMER']
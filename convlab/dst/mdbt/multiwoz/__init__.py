@@ -1 +1,6 @@
-from convlab.dst.mdbt.multiwoz.dst import MultiWozMDBT as MDBT
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'MDBT': ('convlab.dst.mdbt.multiwoz.dst', 'MultiWozMDBT'),
+})
+__all__ = ['MDBT']
@@ -1,5 +1,29 @@
+import atexit
 import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
 from difflib import SequenceMatcher
+from functools import lru_cache
+
+LOG_FILE = 'fuzzy_recognition.log'
+# failed normalizations are written to LOG_FILE in batches of LOG_BUFFER_SIZE lines and at exit
+LOG_BUFFER_SIZE = 100
+# resolved raw values kept per value set
+CACHE_SIZE = 10000
+# value sets with a normalization index kept in memory
+MAX_VALUE_SETS = 8
+
+_log_buffer = []
+_log_lock = threading.Lock()
+_index_lock = threading.Lock()
+_value_set_indexes = OrderedDict()
+
+_TIME_PATTERN = re.compile(r"(\d{1,2}:\d{1,2})")
+_TRAINID_PATTERN = re.compile(r"TR(\d{4})")
+_POUNDS_PATTERN = re.compile(r"(\d{1,2},\d{1,2} pounds)")
+_POUND_PATTERN = re.compile(r"(\d{1,2} pounds)")
+_DURATION_PATTERN = re.compile(r"(\d{1,2} minutes)")
 
 
 def str_similar(a, b):
@@ -7,9 +31,24 @@ def str_similar(a, b):
 
 
 def _log(info):
-    with open('fuzzy_recognition.log', 'a+') as f:
-        f.write('{}\n'.format(info))
-    f.close()
+    with _log_lock:
+        _log_buffer.append('{}\n'.format(info))
+        if len(_log_buffer) < LOG_BUFFER_SIZE:
+            return
+    flush_log()
+
+
+def flush_log():
+    """Write the buffered failed normalizations to LOG_FILE."""
+    with _log_lock:
+        if not _log_buffer:
+            return
+        with open(LOG_FILE, 'a+') as f:
+            f.writelines(_log_buffer)
+        _log_buffer.clear()
+
+
+atexit.register(flush_log)
 
 
 def minDistance(word1, word2):
@@ -35,9 +74,35 @@ def minDistance(word1, word2):
     return value
 
 
+def within_distance(word1, word2, max_distance):
+    """Whether minDistance(word1, word2) <= max_distance, computed on the diagonal band of width max_distance."""
+    size1 = len(word1)
+    size2 = len(word2)
+    if abs(size1 - size2) > max_distance:
+        return False
+    over = max_distance + 1
+    tmp = [min(j, over) for j in range(size2 + 1)]
+    for i in range(size1):
+        row = [over] * (size2 + 1)
+        row[0] = min(i + 1, over)
+        for j in range(max(0, i - max_distance), min(size2, i + max_distance + 1)):
+            if word1[i] == word2[j]:
+                value = tmp[j]
+            else:
+                value = 1 + min(tmp[j], tmp[j + 1], row[j])
+            row[j + 1] = min(value, over)
+        if min(row) > max_distance:
+            return False
+        tmp = row
+    return tmp[size2] <= max_distance
+
+
 def normalize_value(value_set, domain, slot, value):
     """Normalized the value produced by NLU module to map it to the ontology value space.
 
+    The value lists of `value_set` are indexed on first use and resolved values are cached, so `value_set` should not
+    be modified afterwards.
+
     Args:
         value_set (dict):
             The value set of task ontology.
@@ -50,42 +115,154 @@ def normalize_value(value_set, domain, slot, value):
     Returns:
         value (str): The normalized value, which fits with the domain ontology.
     """
-    slot = slot.lower()
-    value = value.lower()
-    value = ' '.join(value.split())
-    try:
-        assert domain in value_set
-    except:
-        raise Exception('domain <{}> not found in value set'.format(domain))
-    if slot not in value_set[domain]:
-        return value
-        # raise Exception(
-        #     'slot <{}> not found in db_values[{}]'.format(
-        #         slot, domain))
-    value_list = value_set[domain][slot]
-    # exact match or containing match
-    v = _match_or_contain(value, value_list)
-    if v is not None:
-        return v
-    # some transfomations
-    cand_values = _transform_value(value)
-    for cv in cand_values:
-        v = _match_or_contain(cv, value_list)
-        if v is not None:
-            return v
-    # special value matching
-    v = special_match(domain, slot, value)
-    if v is not None:
-        return v
-    if v != 'dontcare':
+    value, failed = _value_set_index(value_set).normalize(domain, slot, value)
+    if failed:
         _log(
             'Failed: domain {} slot {} value {}, raw value returned.'.format(
                 domain,
-                slot,
+                slot.lower(),
                 value))
     return value
 
 
+def _value_set_index(value_set):
+    # the index holds a reference to its value set, so the id is not reused while the index is kept
+    with _index_lock:
+        index = _value_set_indexes.get(id(value_set))
+        if index is None or index.value_set is not value_set:
+            index = _ValueSetIndex(value_set)
+            _value_set_indexes[id(value_set)] = index
+            if len(_value_set_indexes) > MAX_VALUE_SETS:
+                _value_set_indexes.popitem(last=False)
+        else:
+            _value_set_indexes.move_to_end(id(value_set))
+        return index
+
+
+class _ValueSetIndex:
+    """Normalization of the values of one value set, with a _ValueIndex per (domain, slot) and a LRU cache."""
+
+    def __init__(self, value_set):
+        self.value_set = value_set
+        self.value_indexes = {}
+        self.normalize = lru_cache(maxsize=CACHE_SIZE)(self._normalize)
+
+    def _value_index(self, domain, slot):
+        key = (domain, slot)
+        if key not in self.value_indexes:
+            self.value_indexes[key] = _ValueIndex(self.value_set[domain][slot])
+        return self.value_indexes[key]
+
+    def _normalize(self, domain, slot, value):
+        """
+        Returns:
+            value (str): The normalized value.
+            failed (bool): True if the value could not be matched and the raw value is returned.
+        """
+        slot = slot.lower()
+        value = value.lower()
+        value = ' '.join(value.split())
+        try:
+            assert domain in self.value_set
+        except:
+            raise Exception('domain <{}> not found in value set'.format(domain))
+        if slot not in self.value_set[domain]:
+            return value, False
+            # raise Exception(
+            #     'slot <{}> not found in db_values[{}]'.format(
+            #         slot, domain))
+        value_index = self._value_index(domain, slot)
+        # exact match or containing match
+        v = value_index.match_or_contain(value)
+        if v is not None:
+            return v, False
+        # some transfomations
+        cand_values = _transform_value(value)
+        for cv in cand_values:
+            v = value_index.match_or_contain(cv)
+            if v is not None:
+                return v, False
+        # special value matching
+        v = special_match(domain, slot, value)
+        if v is not None:
+            return v, False
+        return value, True
+
+
+class _ValueIndex:
+    """
+    Index of a value list that gives the same result as `_match_or_contain` without scanning the list:
+        - a set for the exact match
+        - the first position of every value, to look up the substrings of a value that are in the list
+        - the values joined by new lines, to find the first value that contains a value with one `str.find`
+        - the value lengths, to only compute the edit distance to values that could be close enough
+    """
+
+    def __init__(self, value_list):
+        self.value_list = value_list
+        try:
+            self.values = set(value_list)
+        except TypeError:  # unhashable values only match by equality
+            self.values = None
+        self.first_position = {}
+        self.lengths = set()
+        offsets, texts, length = [], [], 0
+        for idx, v in enumerate(value_list):
+            if not isinstance(v, str):
+                continue
+            self.first_position.setdefault(v, idx)
+            self.lengths.add(len(v))
+            offsets.append(length)
+            texts.append(v)
+            length += len(v) + 1
+        self.lengths = sorted(self.lengths)
+        self.offsets = offsets
+        self.text_positions = [idx for idx, v in enumerate(value_list) if isinstance(v, str)]
+        self.text = '\n'.join(texts)
+
+    def _is_value(self, value):
+        if self.values is None:
+            return value in self.value_list
+        return value in self.values
+
+    def _first_contained(self, value):
+        # position of the first value in the list that is a substring of `value`
+        first = None
+        for length in self.lengths:
+            if length > len(value):
+                break
+            for start in range(len(value) - length + 1):
+                idx = self.first_position.get(value[start:start + length])
+                if idx is not None and (first is None or idx < first):
+                    first = idx
+        return first
+
+    def _first_containing(self, value):
+        # position of the first value in the list that contains `value`
+        if '\n' in value or not self.offsets:
+            return None
+        found = self.text.find(value)
+        if found < 0:
+            return None
+        return self.text_positions[bisect_right(self.offsets, found) - 1]
+
+    def match_or_contain(self, value):
+        """match value by exact match or containing"""
+        if self._is_value(value):
+            return value
+        positions = [idx for idx in (self._first_contained(value), self._first_containing(value)) if idx is not None]
+        if positions:
+            return self.value_list[min(positions)]
+        # fuzzy match, when len(value) is large and distance(v1, v2) is small
+        if len(value) < 10:
+            return None
+        max_distance = 2 if len(value) < 15 else 3
+        for v in self.value_list:
+            if isinstance(v, str) and v and within_distance(value, v, max_distance):
+                return v
+        return None
+
+
 def _transform_value(value):
     cand_list = []
     # a 's -> a's
@@ -136,7 +313,7 @@ def special_match(domain, slot, value):
 
 def _match_time(value):
     """Return the time (leaveby, arriveat) in value, None if no time in value."""
-    mat = re.search(r"(\d{1,2}:\d{1,2})", value)
+    mat = _TIME_PATTERN.search(value)
     if mat is not None and len(mat.groups()) > 0:
         return mat.groups()[0]
     return None
@@ -144,7 +321,7 @@ def _match_time(value):
 
 def _match_trainid(value):
     """Return the trainID in value, None if no trainID."""
-    mat = re.search(r"TR(\d{4})", value)
+    mat = _TRAINID_PATTERN.search(value)
     if mat is not None and len(mat.groups()) > 0:
         return mat.groups()[0]
     return None
@@ -152,10 +329,10 @@ def _match_trainid(value):
 
 def _match_pound_price(value):
     """Return the price with pounds in value, None if no trainID."""
-    mat = re.search(r"(\d{1,2},\d{1,2} pounds)", value)
+    mat = _POUNDS_PATTERN.search(value)
     if mat is not None and len(mat.groups()) > 0:
         return mat.groups()[0]
-    mat = re.search(r"(\d{1,2} pounds)", value)
+    mat = _POUND_PATTERN.search(value)
     if mat is not None and len(mat.groups()) > 0:
         return mat.groups()[0]
     if "1 pound" in value.lower():
@@ -167,7 +344,7 @@ def _match_pound_price(value):
 
 def _match_duration(value):
     """Return the durations (by minute) in value, None if no trainID."""
-    mat = re.search(r"(\d{1,2} minutes)", value)
+    mat = _DURATION_PATTERN.search(value)
     if mat is not None and len(mat.groups()) > 0:
         return mat.groups()[0]
     return None
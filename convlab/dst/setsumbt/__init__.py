@@ -1 +1,6 @@
-from convlab.dst.setsumbt.tracker import SetSUMBTTracker
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'SetSUMBTTracker': 'convlab.dst.setsumbt.tracker',
+})
+__all__ = ['SetSUMBTTracker']
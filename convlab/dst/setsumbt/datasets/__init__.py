@@ -1,4 +1,14 @@
-from convlab.dst.setsumbt.datasets.unified_format import get_dataloader, change_batch_size, dataloader_sample_dialogues
-from convlab.dst.setsumbt.datasets.metrics import (JointGoalAccuracy, BeliefStateUncertainty,
-                                                   ActPredictionAccuracy, Metrics)
-from convlab.dst.setsumbt.datasets.distillation import get_dataloader as get_distillation_dataloader
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'get_dataloader': 'convlab.dst.setsumbt.datasets.unified_format',
+    'change_batch_size': 'convlab.dst.setsumbt.datasets.unified_format',
+    'dataloader_sample_dialogues': 'convlab.dst.setsumbt.datasets.unified_format',
+    'JointGoalAccuracy': 'convlab.dst.setsumbt.datasets.metrics',
+    'BeliefStateUncertainty': 'convlab.dst.setsumbt.datasets.metrics',
+    'ActPredictionAccuracy': 'convlab.dst.setsumbt.datasets.metrics',
+    'Metrics': 'convlab.dst.setsumbt.datasets.metrics',
+    'get_distillation_dataloader': ('convlab.dst.setsumbt.datasets.distillation', 'get_dataloader'),
+})
+__all__ = ['get_dataloader', 'change_batch_size', 'dataloader_sample_dialogues', 'JointGoalAccuracy',
+           'BeliefStateUncertainty', 'ActPredictionAccuracy', 'Metrics', 'get_distillation_dataloader']
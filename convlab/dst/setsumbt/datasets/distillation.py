@@ -22,6 +22,7 @@ from torch.utils.data import DataLoader, RandomSampler, SequentialSampler
 
 from convlab.dst.setsumbt.datasets.unified_format import UnifiedFormatDataset
 from convlab.dst.setsumbt.datasets.utils import IdTensor
+from convlab.dst.setsumbt.utils.ensemble import load_predictions
 
 DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
 
@@ -45,7 +46,7 @@ def get_dataloader(ensemble_path:str, set_type: str = 'train', batch_size: int =
     dataset = torch.load(path).dataset
 
     path = os.path.join(ensemble_path, 'predictions', f"{set_type}.data")
-    data = torch.load(path)
+    data = load_predictions(path)
 
     dialogue_ids = data.pop('dialogue_ids')
 
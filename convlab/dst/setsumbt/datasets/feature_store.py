@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 DSML Group, Heinrich Heine University, Düsseldorf
+# Authors: Carel van Niekerk (niekerk@hhu.de)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""On-disk store of preprocessed SetSUMBT dataset features"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy
+import torch
+
+from convlab.dst.setsumbt.datasets.utils import IdTensor
+
+FEATURE_STORE_VERSION = 1
+
+
+def feature_store_key(**params) -> str:
+    """
+    Content key of a feature store, the hash of everything that determines the stored features.
+
+    Args:
+        params: Dataset, tokenizer and ontology encoder settings and digests of the data and encoder weights
+
+    Returns:
+        key (str): Hex digest identifying the features
+    """
+    params['version'] = FEATURE_STORE_VERSION
+    return json_digest(params)
+
+
+def json_digest(data) -> str:
+    """
+    Hash of JSON serialisable data, e.g. the dialogues and ontology a store is built from.
+
+    Args:
+        data: JSON serialisable data
+
+    Returns:
+        digest (str): Hex digest of the data
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def weights_digest(model: torch.nn.Module) -> str:
+    """
+    Hash of the weights of a model, so that a model retrained and saved at the same path gets a new store.
+
+    Args:
+        model (torch.nn.Module): Model, e.g. the ontology encoder
+
+    Returns:
+        digest (str): Hex digest of the names, shapes, types and values of all parameters and buffers
+    """
+    digest = hashlib.sha1()
+    for name, tensor in sorted(model.state_dict().items()):
+        tensor = tensor.detach().cpu().contiguous()
+        digest.update(f'{name}:{tuple(tensor.shape)}:{tensor.dtype}'.encode('utf-8'))
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """
+    Directory of preprocessed dataset features: one .npy file per feature (input ids, masks, labels and dialogue
+    ids), the ontology and the ontology embeddings. Stored features are loaded as memory mapped tensors, so datasets
+    built from the same store in several processes (e.g. ensemble members) share the data and only read what they
+    use. Stores are written to a temporary directory and renamed, so they are never seen half written.
+
+    Attributes:
+        path (str): Directory of the store
+    """
+    def __init__(self, root: str, key: str):
+        """
+        Args:
+            root (str): Directory containing the feature stores
+            key (str): Content key of the store (see feature_store_key)
+        """
+        self.path = os.path.join(os.path.abspath(root), key)
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, 'meta.json'))
+
+    def save(self, features: dict, ontology: dict, ontology_embeddings: dict):
+        """
+        Write the features, unless the store exists already.
+
+        Args:
+            features (dict): Dataset features as returned by the tokenizer encode function
+            ontology (dict): Ontology of the dataset
+            ontology_embeddings (dict): Slot description embeddings, candidate embeddings and requestable flag for
+                each domain-slot
+        """
+        if self.exists():
+            return
+        root = os.path.dirname(self.path)
+        os.makedirs(root, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+        try:
+            meta = {'features': {}, 'ontology': ontology, 'ontology_embeddings': self._save_ontology_embeddings(
+                tmp_path, ontology_embeddings)}
+            for label, feature in features.items():
+                if feature is None:
+                    meta['features'][label] = None
+                    continue
+                if isinstance(feature, IdTensor):
+                    values, kind = feature.values, 'ids'
+                else:
+                    values, kind = feature.numpy(), 'tensor'
+                numpy.save(os.path.join(tmp_path, f'{label}.npy'), values)
+                meta['features'][label] = kind
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as writer:
+                json.dump(meta, writer)
+            try:
+                os.rename(tmp_path, self.path)
+            except OSError:
+                # Stored concurrently by another process
+                if not self.exists():
+                    raise
+        finally:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+
+    @staticmethod
+    def _save_ontology_embeddings(path: str, ontology_embeddings: dict) -> dict:
+        """
+        Save all slot embeddings in one array and all value candidate embeddings in another.
+
+        Returns:
+            meta (dict): Slots with their requestable flag and range of value candidates
+        """
+        slots = list(ontology_embeddings)
+        meta = {'slots': slots, 'requestable': [], 'value_offsets': []}
+        if not slots:
+            return meta
+        numpy.save(os.path.join(path, 'slot_embeddings.npy'),
+                   torch.stack([ontology_embeddings[slot][0] for slot in slots]).numpy())
+        value_embeddings, offset = [], 0
+        for slot in slots:
+            _, values, requestable = ontology_embeddings[slot]
+            meta['requestable'].append(bool(requestable))
+            if values is None:
+                meta['value_offsets'].append(None)
+            else:
+                meta['value_offsets'].append([offset, offset + values.size(0)])
+                offset += values.size(0)
+                value_embeddings.append(values)
+        if value_embeddings:
+            numpy.save(os.path.join(path, 'value_embeddings.npy'), torch.cat(value_embeddings).numpy())
+        return meta
+
+    def _load_array(self, name: str):
+        # Copy on write mapping, the tensors are writable without changing the store
+        return numpy.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='c')
+
+    def load(self) -> tuple:
+        """
+        Load the stored features as memory mapped tensors.
+
+        Returns:
+            features (dict): Dataset features
+            ontology (dict): Ontology of the dataset
+            ontology_embeddings (dict): Slot description embeddings, candidate embeddings and requestable flag for
+                each domain-slot
+        """
+        with open(os.path.join(self.path, 'meta.json')) as reader:
+            meta = json.load(reader)
+
+        features = dict()
+        for label, kind in meta['features'].items():
+            if kind is None:
+                features[label] = None
+            elif kind == 'ids':
+                ids = IdTensor([])
+                ids.values = self._load_array(label)
+                features[label] = ids
+            else:
+                features[label] = torch.from_numpy(self._load_array(label))
+
+        ontology_embeddings = dict()
+        embeddings_meta = meta['ontology_embeddings']
+        if embeddings_meta['slots']:
+            slot_embeddings = torch.from_numpy(self._load_array('slot_embeddings'))
+            value_embeddings = None
+            if any(offsets is not None for offsets in embeddings_meta['value_offsets']):
+                value_embeddings = torch.from_numpy(self._load_array('value_embeddings'))
+            for idx, slot in enumerate(embeddings_meta['slots']):
+                offsets = embeddings_meta['value_offsets'][idx]
+                values = value_embeddings[offsets[0]:offsets[1]] if offsets is not None else None
+                ontology_embeddings[slot] = (slot_embeddings[idx], values, embeddings_meta['requestable'][idx])
+
+        return features, meta['ontology'], ontology_embeddings
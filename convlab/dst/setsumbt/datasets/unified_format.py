@@ -20,11 +20,12 @@ import transformers
 from torch.utils.data import Dataset, DataLoader, RandomSampler, SequentialSampler
 from transformers.tokenization_utils import PreTrainedTokenizer
 
-from convlab.util import load_dataset
+from convlab.util import load_dataset, load_ontology
 from convlab.dst.setsumbt.datasets.utils import (get_ontology_slots, ontology_add_values,
                                                  get_values_from_data, ontology_add_requestable_slots,
                                                  get_requestable_slots, load_dst_data, extract_dialogues,
                                                  combine_value_sets)
+from convlab.dst.setsumbt.datasets.feature_store import FeatureStore, feature_store_key, json_digest, weights_digest
 
 transformers.logging.set_verbosity_error()
 
@@ -39,6 +40,8 @@ class UnifiedFormatDataset(Dataset):
         ontology (dict): Set of all domain-slot-value triplets in the ontology of the model
         ontology_embeddings (dict): Set of all domain-slot-value triplets in the ontology of the model
         features (dict): Set of numeric features containing all inputs and labels formatted for the SetSUMBT model
+        feature_store (FeatureStore): Store of the features if they are loaded from one
+        indices (torch.Tensor): Ids of the dialogues in the feature store which form the dataset
     """
     def __init__(self,
                  dataset_name: str,
@@ -51,7 +54,8 @@ class UnifiedFormatDataset(Dataset):
                  seed: int = 0,
                  data: dict = None,
                  ontology: dict = None,
-                 ontology_embeddings: dict = None):
+                 ontology_embeddings: dict = None,
+                 feature_store_dir: str = None):
         """
         Args:
             dataset_name (str): Name of the dataset/s to load (multiple to be seperated by +)
@@ -65,13 +69,22 @@ class UnifiedFormatDataset(Dataset):
             data (dict): Dataset features for loading from dict
             ontology (dict): Ontology dict for loading from dict
             ontology_embeddings (dict): Ontology embeddings for loading from dict
+            feature_store_dir (str): Directory of feature stores, if provided the preprocessed features of the full
+                subset are stored there once and loaded from the store as memory mapped tensors afterwards
         """
+        self.feature_store = None
+        self.indices = None
         # Load data from dict if provided
         if data is not None:
             self.set_type = set_type
             self.ontology = ontology
             self.ontology_embeddings = ontology_embeddings
             self.features = data
+        # Load data from the feature store if a store directory is provided
+        elif feature_store_dir is not None:
+            self.set_type = set_type
+            self._load_feature_store(feature_store_dir, dataset_name, tokenizer, ontology_encoder, max_turns,
+                                     max_seq_len, train_ratio, seed)
         # Load data from dataset if data is not provided
         else:
             if '+' in dataset_name:
@@ -93,7 +106,7 @@ class UnifiedFormatDataset(Dataset):
                 for dataset_args_ in dataset_args:
                     dataset_args_['dial_ids_order'] = seed
                     dataset_args_['split2ratio'] = {'train': train_ratio, 'validation': train_ratio}
-            self.dataset_dicts = [load_dataset(**dataset_args_) for dataset_args_ in dataset_args]
+                self.dataset_dicts = [load_dataset(**dataset_args_) for dataset_args_ in dataset_args]
 
             data = [load_dst_data(dataset_dict, data_split=set_type, speaker='all',
                                   dialogue_acts=True, split_to_turn=False)
@@ -105,6 +118,72 @@ class UnifiedFormatDataset(Dataset):
                 data += extract_dialogues(data_, dataset_args[idx]["dataset_name"])
             self.features = tokenizer.encode(data, max_turns, max_seq_len)
 
+    def _load_feature_store(self, feature_store_dir: str, dataset_name: str, tokenizer: PreTrainedTokenizer,
+                            ontology_encoder, max_turns: int, max_seq_len: int, train_ratio: float, seed: int):
+        """
+        Load the features of the full subset from a feature store, preprocessing and storing them if they are not
+        stored yet, and select the dialogues of the training ratio.
+
+        Args:
+            feature_store_dir (str): Directory of feature stores
+            dataset_name (str): Name of the dataset/s to load (multiple to be seperated by +)
+            tokenizer (transformers tokenizer): Tokenizer for the encoder model used
+            ontology_encoder (transformers model): Ontology encoder model
+            max_turns (int): Maximum numbers of turns in a dialogue
+            max_seq_len (int): Maximum number of tokens in a dialogue turn
+            train_ratio (float): Fraction of training data to use during training
+            seed (int): Seed governing random order of ids for subsampling
+        """
+        # The key covers the content of the dialogues, ontology and encoder weights, so an updated dataset or an
+        # encoder retrained at the same path never reuses stale features
+        dataset_names = dataset_name.split('+') if '+' in dataset_name else [dataset_name]
+        data_digest = json_digest([[load_dataset(name), load_ontology(name)] for name in dataset_names])
+        encoder_args = getattr(ontology_encoder, 'args', None)
+        key = feature_store_key(dataset_name=dataset_name, set_type=self.set_type, max_turns=max_turns,
+                                max_seq_len=max_seq_len, tokenizer=tokenizer.name_or_path,
+                                vocab_size=len(tokenizer), ontology_encoder=ontology_encoder.name_or_path,
+                                data_digest=data_digest, encoder_digest=weights_digest(ontology_encoder),
+                                **{arg: getattr(encoder_args, arg, None)
+                                   for arg in ['use_descriptions', 'max_candidate_len', 'set_similarity',
+                                               'candidate_pooling']})
+        store = FeatureStore(feature_store_dir, key)
+        if not store.exists():
+            dataset = UnifiedFormatDataset(dataset_name, self.set_type, tokenizer, ontology_encoder, max_turns,
+                                           max_seq_len)
+            store.save(dataset.features, dataset.ontology, dataset.ontology_embeddings)
+            del dataset
+        self.feature_store = store
+        self.features, self.ontology, self.ontology_embeddings = store.load()
+        tokenizer.set_setsumbt_ontology(self.ontology)
+
+        if train_ratio != 1.0:
+            # Select the dialogues, in order, which load_dataset returns for the training ratio
+            store_ids = {dial_ids[0]: idx for idx, dial_ids in enumerate(self.features['dialogue_ids'].values)}
+            split2ratio = {'train': train_ratio, 'validation': train_ratio}
+            indices = []
+            for name in dataset_names:
+                dataset = load_dataset(name, dial_ids_order=seed, split2ratio=split2ratio)
+                for dial in dataset[self.set_type]:
+                    if dial['dialogue_id'] not in store_ids:
+                        raise ValueError(f"Dialogue {dial['dialogue_id']} not found in feature store {store.path}")
+                    indices.append(store_ids[dial['dialogue_id']])
+            self.indices = torch.tensor(indices)
+
+    def __getstate__(self):
+        # Datasets loaded from a feature store are pickled as a reference to the store
+        state = self.__dict__.copy()
+        if self.feature_store is not None:
+            for attr in ['features', 'ontology', 'ontology_embeddings']:
+                state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.feature_store is not None:
+            self.features, self.ontology, self.ontology_embeddings = self.feature_store.load()
+            if getattr(self, 'device', None) is not None:
+                self.to(self.device)
+
     def __getitem__(self, index: int) -> dict:
         """
         Obtain dialogues with specific ids from dataset
@@ -115,6 +194,10 @@ class UnifiedFormatDataset(Dataset):
         Returns:
             features (dict): All inputs and labels required to train the model
         """
+        if self.indices is not None:
+            index = self.indices[index]
+            index = index.item() if index.dim() == 0 else index
+
         feats = dict()
         for label in self.features:
             if self.features[label] is not None:
@@ -137,6 +220,8 @@ class UnifiedFormatDataset(Dataset):
         Returns:
             len (int): Number of dialogues in the dataset object
         """
+        if self.indices is not None:
+            return self.indices.size(0)
         return self.features['input_ids'].size(0)
 
     def resample(self, size: int = None) -> Dataset:
@@ -155,7 +240,11 @@ class UnifiedFormatDataset(Dataset):
             size = n_dialogues
 
         dialogues = torch.randint(low=0, high=n_dialogues, size=(size,))
-        self.features = self.__getitem__(dialogues)
+        if self.feature_store is not None:
+            # Reference the sampled dialogues in the store rather than copying them
+            self.indices = self.indices[dialogues] if self.indices is not None else dialogues
+        else:
+            self.features = self.__getitem__(dialogues)
         
         return self
 
@@ -169,6 +258,8 @@ class UnifiedFormatDataset(Dataset):
         self.device = device
         self.features = {label: self.features[label].to(device) for label in self.features
                          if self.features[label] is not None}
+        if self.indices is not None:
+            self.indices = self.indices.to(device)
 
     @classmethod
     def from_datadict(cls, set_type: str, data: dict, ontology: dict, ontology_embeddings: dict):
@@ -185,7 +276,8 @@ def get_dataloader(dataset_name: str,
                    device='cpu',
                    resampled_size: int = None,
                    train_ratio: float = 1.0,
-                   seed: int = 0) -> DataLoader:
+                   seed: int = 0,
+                   feature_store_dir: str = None) -> DataLoader:
     '''
     Module to create torch dataloaders
 
@@ -201,12 +293,13 @@ def get_dataloader(dataset_name: str,
         resampled_size (int): Number of dialogues to sample
         train_ratio (float): Ratio of training data to use for training
         seed (int): Seed governing random order of ids for subsampling
+        feature_store_dir (str): Directory of feature stores to reuse preprocessed features from
 
     Returns:
         loader (torch dataloader): Dataloader to train and evaluate the setsumbt model
     '''
     data = UnifiedFormatDataset(dataset_name, set_type, tokenizer, ontology_encoder, max_turns, max_seq_len,
-                                train_ratio=train_ratio, seed=seed)
+                                train_ratio=train_ratio, seed=seed, feature_store_dir=feature_store_dir)
     data.to(device)
 
     if resampled_size:
@@ -269,6 +269,7 @@ class SetSUMBTHead(Module):
                      'ensemble_smoothing': config.to_dict().get('ensemble_smoothing', 0.0)}
         self.loss = loss.load(config.loss_function)(**loss_args)
         self.temp = 1.0
+        self._candidate_cache = None
 
         # Intent and domain prediction heads
         if config.predict_actions:
@@ -327,6 +328,7 @@ class SetSUMBTHead(Module):
 
         self.config.num_slots = embeddings.size(0)
         self.slot_embeddings = Parameter(embeddings, requires_grad=False)
+        self._candidate_cache = None
 
     def add_value_candidates(self, slot: str, value_candidates: torch.Tensor, replace: bool = False):
         """
@@ -346,6 +348,61 @@ class SetSUMBTHead(Module):
 
         self.config.num_values[slot] = embeddings.size(0)
         setattr(self, slot + '_value_embeddings', Parameter(embeddings, requires_grad=False))
+        self._candidate_cache = None
+
+    def train(self, mode: bool = True):
+        self._candidate_cache = None
+        return super(SetSUMBTHead, self).train(mode)
+
+    def _pooled_candidate_embeddings(self, slot: str, device: torch.device) -> torch.Tensor:
+        """
+        Args:
+            slot: Slot name
+            device: Compute device
+
+        Returns:
+            candidate_embeddings: Value candidate embeddings of the slot, pooled if set similarity is used
+        """
+        candidate_embeddings = getattr(self, slot + '_value_embeddings').to(device)
+        if self.config.set_similarity:
+            candidate_embeddings = self.set_pooler(candidate_embeddings, (candidate_embeddings != 0.0).float())
+        return candidate_embeddings
+
+    def get_candidate_cache(self, device: torch.device) -> dict:
+        """
+        Value candidate embeddings of all informable slots for inference, computed once and kept until the
+        candidates, the set pooler or the model mode change.
+
+        Args:
+            device: Compute device
+
+        Returns:
+            cache: Dictionary containing the informable slots, their ids and number of values, the pooled
+                candidate embeddings of each slot and the fused candidate embeddings of all slots
+                [num_informable_slots, max_num_values, hidden_size] (zero padded) normalised to unit length
+        """
+        slots = list(self.config.informable_slot_ids)
+        params = [getattr(self, slot + '_value_embeddings') for slot in slots]
+        if self.config.set_similarity:
+            params += list(self.set_pooler.parameters())
+        key = (str(device), tuple(slots)) + tuple((p.data_ptr(), p._version) for p in params)
+
+        if self._candidate_cache is None or self._candidate_cache['key'] != key:
+            candidates = {slot: self._pooled_candidate_embeddings(slot, device) for slot in slots}
+            num_values = [candidates[slot].size(0) for slot in slots]
+            fused = torch.zeros(len(slots), max(num_values, default=0), self.config.hidden_size, device=device)
+            for i, slot in enumerate(slots):
+                fused[i, :num_values[i]] = candidates[slot]
+            fused = fused / fused.norm(dim=-1, keepdim=True).clamp_min(1e-8)
+
+            self._candidate_cache = {'key': key,
+                                     'slots': slots,
+                                     'slot_ids': torch.tensor([self.config.informable_slot_ids[slot]
+                                                               for slot in slots], device=device),
+                                     'num_values': num_values,
+                                     'candidates': candidates,
+                                     'fused_candidates': fused}
+        return self._candidate_cache
 
     def forward(self,
                 turn_embeddings: torch.Tensor,
@@ -407,7 +464,7 @@ class SetSUMBTHead(Module):
         # Slot utterance matching
         num_slots = self.slot_embeddings.size(0)
         slot_embeddings = self.slot_embeddings.reshape(-1, hidden_size)
-        slot_embeddings = slot_embeddings.unsqueeze(1).repeat((1, batch_size * dialogue_size, 1))
+        slot_embeddings = slot_embeddings.unsqueeze(1).expand(-1, batch_size * dialogue_size, -1)
         slot_embeddings = slot_embeddings.to(turn_embeddings.device)
 
         if self.config.set_similarity:
@@ -507,29 +564,46 @@ class SetSUMBTHead(Module):
         belief_state_probs = dict()
         belief_state_mutual_info = dict()
         belief_state_stats = dict()
-        for slot, slot_id in self.config.informable_slot_ids.items():
-            # Get slot belief embedding and value candidates
-            candidate_embeddings = getattr(self, slot + '_value_embeddings').to(turn_embeddings.device)
-            belief = belief_embedding[:, :, slot_id, :]
-            slot_size = candidate_embeddings.size(0)
-
-            belief = belief.unsqueeze(2).repeat((1, 1, slot_size, 1))
-            belief = belief.reshape(-1, self.config.hidden_size)
 
-            if self.config.set_similarity:
-                candidate_embeddings = self.set_pooler(candidate_embeddings, (candidate_embeddings != 0.0).float())
-            candidate_embeddings = candidate_embeddings.unsqueeze(0).unsqueeze(0).repeat((batch_size,
-                                                                                          dialogue_size, 1, 1))
-            candidate_embeddings = candidate_embeddings.reshape(-1, self.config.hidden_size)
-
-            # Score value candidates
-            if self.config.distance_measure == 'cosine':
-                logits = self.distance(belief, candidate_embeddings)
-                # *27 here rescales the cosine similarity for better learning
-                logits = logits.reshape(batch_size * dialogue_size, -1) * 27.0
-            elif self.config.distance_measure == 'euclidean':
-                logits = -1.0 * self.distance(belief, candidate_embeddings)
+        # At inference the value candidates are constant, their (pooled) embeddings are cached and the cosine
+        # similarities of all informable slots are computed at once using the fused candidate embeddings
+        candidate_cache, fused_logits = None, None
+        if not self.training and not torch.is_grad_enabled():
+            candidate_cache = self.get_candidate_cache(turn_embeddings.device)
+            if self.config.distance_measure == 'cosine' and candidate_cache['slots']:
+                belief = belief_embedding[:, :, candidate_cache['slot_ids'], :]
+                belief = belief / belief.norm(dim=-1, keepdim=True).clamp_min(1e-8)
+                # [batch_size, dialogue_size, num_informable_slots, max_num_values]
+                fused_logits = torch.einsum('btsh,svh->btsv', belief, candidate_cache['fused_candidates']) * 27.0
+
+        for i, (slot, slot_id) in enumerate(self.config.informable_slot_ids.items()):
+            if fused_logits is not None:
+                logits = fused_logits[:, :, i, :candidate_cache['num_values'][i]]
                 logits = logits.reshape(batch_size * dialogue_size, -1)
+            else:
+                # Get slot belief embedding and value candidates
+                if candidate_cache is not None:
+                    candidate_embeddings = candidate_cache['candidates'][slot]
+                else:
+                    candidate_embeddings = self._pooled_candidate_embeddings(slot, turn_embeddings.device)
+                belief = belief_embedding[:, :, slot_id, :]
+                slot_size = candidate_embeddings.size(0)
+
+                belief = belief.unsqueeze(2).repeat((1, 1, slot_size, 1))
+                belief = belief.reshape(-1, self.config.hidden_size)
+
+                candidate_embeddings = candidate_embeddings.unsqueeze(0).unsqueeze(0).repeat((batch_size,
+                                                                                              dialogue_size, 1, 1))
+                candidate_embeddings = candidate_embeddings.reshape(-1, self.config.hidden_size)
+
+                # Score value candidates
+                if self.config.distance_measure == 'cosine':
+                    logits = self.distance(belief, candidate_embeddings)
+                    # *27 here rescales the cosine similarity for better learning
+                    logits = logits.reshape(batch_size * dialogue_size, -1) * 27.0
+                elif self.config.distance_measure == 'euclidean':
+                    logits = -1.0 * self.distance(belief, candidate_embeddings)
+                    logits = logits.reshape(batch_size * dialogue_size, -1)
 
             # Calculate belief state
             probs_ = torch.softmax(logits.reshape(batch_size, dialogue_size, -1), -1)
@@ -249,48 +249,46 @@ class EnsembleSetSUMBT(Module):
         Returns:
 
         """
-        belief_state_probs = {slot: [] for slot in self.setsumbt.config.informable_slot_ids}
-        request_probs = {slot: [] for slot in self.setsumbt.config.requestable_slot_ids}
-        active_domain_probs = {dom: [] for dom in self.setsumbt.config.domain_ids}
-        general_act_probs = []
+        if reduction not in ['mean', 'none']:
+            raise (NameError('Not Implemented!'))
+
+        # Member predictions stay on the device of the model, with mean reduction only their running sum is kept,
+        # the ensemble prediction is moved to the cpu once
+        belief_state_probs, request_probs, active_domain_probs, general_act_probs = dict(), dict(), dict(), dict()
         loss = 0.0 if 'state_labels' in kwargs else None
-        for attr in [f'model_{i}' for i in range(self.config.ensemble_size)]:
-            # Prediction from each ensemble member
-            with torch.no_grad():
+        with torch.no_grad():
+            for attr in [f'model_{i}' for i in range(self.config.ensemble_size)]:
+                # Prediction from each ensemble member
                 _out = getattr(self, attr)(input_ids=input_ids,
                                            token_type_ids=token_type_ids,
                                            attention_mask=attention_mask,
                                            **kwargs)
-            if loss is not None:
-                loss += _out.loss
-            for slot in belief_state_probs:
-                belief_state_probs[slot].append(_out.belief_state[slot].unsqueeze(-2).detach().cpu())
-            if self.config.predict_actions:
-                for slot in request_probs:
-                    request_probs[slot].append(_out.request_probabilities[slot].unsqueeze(-1).detach().cpu())
-                for dom in active_domain_probs:
-                    active_domain_probs[dom].append(_out.active_domain_probabilities[dom].unsqueeze(-1).detach().cpu())
-                general_act_probs.append(_out.general_act_probabilities.unsqueeze(-2).detach().cpu())
-
-        belief_state_probs = {slot: torch.cat(l, -2) for slot, l in belief_state_probs.items()}
+                if loss is not None:
+                    loss += _out.loss
+                for slot in self.setsumbt.config.informable_slot_ids:
+                    self._add_member_probs(belief_state_probs, slot, _out.belief_state[slot], -2, reduction)
+                if self.config.predict_actions:
+                    for slot in self.setsumbt.config.requestable_slot_ids:
+                        self._add_member_probs(request_probs, slot, _out.request_probabilities[slot], -1, reduction)
+                    for dom in self.setsumbt.config.domain_ids:
+                        self._add_member_probs(active_domain_probs, dom, _out.active_domain_probabilities[dom], -1,
+                                               reduction)
+                    self._add_member_probs(general_act_probs, 'general', _out.general_act_probabilities, -2,
+                                           reduction)
+
+        # Apply reduction of ensemble to single posterior
+        belief_state_probs = {slot: self._reduce_member_probs(p, -2, reduction)
+                              for slot, p in belief_state_probs.items()}
         if self.config.predict_actions:
-            request_probs = {slot: torch.cat(l, -1) for slot, l in request_probs.items()}
-            active_domain_probs = {dom: torch.cat(l, -1) for dom, l in active_domain_probs.items()}
-            general_act_probs = torch.cat(general_act_probs, -2)
+            request_probs = {slot: self._reduce_member_probs(p, -1, reduction) for slot, p in request_probs.items()}
+            active_domain_probs = {dom: self._reduce_member_probs(p, -1, reduction)
+                                   for dom, p in active_domain_probs.items()}
+            general_act_probs = self._reduce_member_probs(general_act_probs['general'], -2, reduction)
         else:
             request_probs = {}
             active_domain_probs = {}
             general_act_probs = torch.tensor(0.0)
 
-        # Apply reduction of ensemble to single posterior
-        if reduction == 'mean':
-            belief_state_probs = {slot: l.mean(-2) for slot, l in belief_state_probs.items()}
-            request_probs = {slot: l.mean(-1) for slot, l in request_probs.items()}
-            active_domain_probs = {dom: l.mean(-1) for dom, l in active_domain_probs.items()}
-            general_act_probs = general_act_probs.mean(-2)
-        elif reduction != 'none':
-            raise (NameError('Not Implemented!'))
-
         if loss is not None:
             loss /= self.config.ensemble_size
 
@@ -302,6 +300,40 @@ class EnsembleSetSUMBT(Module):
 
         return output
 
+    @staticmethod
+    def _add_member_probs(member_probs: dict, key: str, probs: torch.Tensor, dim: int, reduction: str):
+        """
+        Add the predictive distribution of an ensemble member
+
+        Args:
+            member_probs: Sum (mean reduction) or list (no reduction) of member distributions per key
+            key: Slot, domain or general act key
+            probs: Member distribution
+            dim: Ensemble dimension of the stacked distributions
+            reduction: Reduction of ensemble member predictive distributions (mean, none)
+        """
+        probs = probs.detach()
+        if reduction == 'mean':
+            member_probs[key] = probs.clone() if key not in member_probs else member_probs[key].add_(probs)
+        else:
+            member_probs.setdefault(key, []).append(probs.unsqueeze(dim))
+
+    def _reduce_member_probs(self, member_probs, dim: int, reduction: str) -> torch.Tensor:
+        """
+        Reduce the member distributions of a key to the ensemble prediction on the cpu
+
+        Args:
+            member_probs: Sum (mean reduction) or list (no reduction) of member distributions
+            dim: Ensemble dimension of the stacked distributions
+            reduction: Reduction of ensemble member predictive distributions (mean, none)
+
+        Returns:
+            probs: Mean distribution or stacked member distributions
+        """
+        if reduction == 'mean':
+            return (member_probs / self.config.ensemble_size).cpu()
+        return torch.cat(member_probs, dim).cpu()
+
     @staticmethod
     def _get_checkpoint_path(path: str, idx: int):
         """
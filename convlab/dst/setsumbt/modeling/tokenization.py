@@ -125,38 +125,60 @@ def SetSUMBTTokenizer(parent_name):
             Returns:
                 dialogue_state (dict): The decoded dialogue state.
             """
+            values = {slot: probs.argmax().item() for slot, probs in belief_state.items()}
+            requests = None
+            if request_probs is not None:
+                requests = {slot: p.item() > 0.5 for slot, p in request_probs.items()}
+            active_domains = None
+            if active_domain_probs is not None:
+                active_domains = {dom: active_domain_probs.get(dom, torch.tensor(0.0)).item() > 0.5
+                                  for dom in self.ontology}
+            general_act = general_act_probs.argmax(-1).item() if general_act_probs is not None else None
+
+            return self._build_state(values, requests, active_domains, general_act)
+
+        def _build_state(self, values, requests=None, active_domains=None, general_act=None):
+            """
+            Construct a dialogue state from decoded predictions.
+
+            Args:
+                values (dict): The index of the predicted value of each informable slot.
+                requests (dict): Whether each requestable slot is requested.
+                active_domains (dict): Whether each ontology domain is active.
+                general_act (int): The predicted general action (none, bye, thank).
+
+            Returns:
+                dialogue_state (dict): The dialogue state.
+            """
             dialogue_state = {domain: {slot: '' for slot, slot_info in domain_info.items()
                                        if slot_info['possible_values'] != ["?"] and slot_info['possible_values']}
                               for domain, domain_info in self.ontology.items()}
 
-            for slot, probs in belief_state.items():
+            for slot, idx in values.items():
                 dom, slot = slot.split('-', 1)
                 val = self.ontology.get(dom, dict()).get(slot, dict()).get('possible_values', [])
-                val = val[probs.argmax().item()] if val else 'none'
+                val = val[idx] if val else 'none'
                 if val != 'none':
                     if dom in dialogue_state:
                         if slot in dialogue_state[dom]:
                             dialogue_state[dom][slot] = val
 
             request_acts = list()
-            if request_probs is not None:
-                request_acts = [slot for slot, p in request_probs.items() if p.item() > 0.5]
+            if requests is not None:
+                request_acts = [slot for slot, requested in requests.items() if requested]
                 request_acts = [slot.split('-', 1) for slot in request_acts]
                 request_acts = [[dom, slt] for dom, slt in request_acts
                                 if '?' in self.ontology.get(dom, dict()).get(slt, dict()).get('possible_values', [])]
                 request_acts = [['request', domain, slot, '?'] for domain, slot in request_acts]
 
             # Construct active domain set
-            active_domains = dict()
-            if active_domain_probs is not None:
-                active_domains = {dom: active_domain_probs.get(dom, torch.tensor(0.0)).item() > 0.5
-                                  for dom in self.ontology}
+            if active_domains is None:
+                active_domains = dict()
 
             # Construct general domain action
             general_acts = list()
-            if general_act_probs is not None:
-                general_acts = general_act_probs.argmax(-1).item()
-                general_acts = [[], ['bye'], ['thank']][general_acts]
+            if general_act is not None:
+                general_acts = [[], ['bye'], ['thank']][general_act]
                 general_acts = [[act, 'general', 'none', 'none'] for act in general_acts]
 
             user_acts = request_acts + general_acts
@@ -192,18 +214,27 @@ def SetSUMBTTokenizer(parent_name):
             if dialogue_ids is None:
                 dialogue_ids = [["{:06d}".format(i) for i in range(belief_state[slot_0].size(0))]]
 
+            # Decode the predictions of all turns at once, transferring one tensor per slot to the host
+            active_turns = (belief_state[slot_0].sum(-1) != 0.0).tolist()
+            values = {slot: p.argmax(-1).tolist() for slot, p in belief_state.items()}
+            requests = {slot: (p > 0.5).tolist() for slot, p in request_probs.items()} \
+                if request_probs is not None else None
+            domains = {dom: (active_domain_probs[dom] > 0.5).tolist() if dom in active_domain_probs else None
+                       for dom in self.ontology} if active_domain_probs is not None else None
+            general_acts = general_act_probs.argmax(-1).tolist() if general_act_probs is not None else None
+
             for dial_idx in range(belief_state[slot_0].size(0)):
                 dialogue = list()
                 for turn_idx in range(belief_state[slot_0].size(1)):
-                    if belief_state[slot_0][dial_idx, turn_idx].sum() != 0.0:
-                        belief = {slot: p[dial_idx, turn_idx] for slot, p in belief_state.items()}
-                        req = {slot: p[dial_idx, turn_idx]
-                               for slot, p in request_probs.items()} if request_probs is not None else None
-                        dom = {dom: p[dial_idx, turn_idx]
-                               for dom, p in active_domain_probs.items()} if active_domain_probs is not None else None
-                        gen = general_act_probs[dial_idx, turn_idx] if general_act_probs is not None else None
-
-                        state = self.decode_state(belief, req, dom, gen)
+                    if active_turns[dial_idx][turn_idx]:
+                        belief = {slot: v[dial_idx][turn_idx] for slot, v in values.items()}
+                        req = {slot: r[dial_idx][turn_idx]
+                               for slot, r in requests.items()} if requests is not None else None
+                        dom = {dom: d[dial_idx][turn_idx] if d is not None else False
+                               for dom, d in domains.items()} if domains is not None else None
+                        gen = general_acts[dial_idx][turn_idx] if general_acts is not None else None
+
+                        state = self._build_state(belief, req, dom, gen)
                         dialogue.append(state)
                 data[dialogue_ids[0][dial_idx]] = dialogue
 
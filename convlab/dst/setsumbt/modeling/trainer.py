@@ -75,7 +75,7 @@ class SetSUMBTTrainer:
         if self.validation_dataloader is not None:
             self.joint_goal_accuracy = JointGoalAccuracy(self.args.dataset, validation_dataloader.dataset.set_type)
             self.belief_state_uncertainty_metrics = BeliefStateUncertainty()
-            self.ensemble_aggregator = EnsembleAggregator()
+            self.ensemble_aggregator = EnsembleAggregator(shard_size=self.args.prediction_shard_size)
             if self.args.predict_actions:
                 self.request_accuracy = ActPredictionAccuracy('request', binary=True)
                 self.active_domain_accuracy = ActPredictionAccuracy('active_domain', binary=True)
@@ -574,6 +574,8 @@ class SetSUMBTTrainer:
         belief_state_summary = dict()
         self.joint_goal_accuracy._init_session()
         self.belief_state_uncertainty_metrics._init_session()
+        if self.args.ensemble and save_pred_dist_path is not None:
+            self.ensemble_aggregator.init_session(save_pred_dist_path)
         self.eval_mode(load_slots=True)
 
         if not is_train:
@@ -122,7 +122,8 @@ def main():
                                           args.max_dialogue_len,
                                           args.max_turn_len,
                                           train_ratio=args.dataset_train_ratio,
-                                          seed=args.seed)
+                                          seed=args.seed,
+                                          feature_store_dir=args.feature_store_dir)
         torch.save(train_dataloader, os.path.join(OUTPUT_DIR, 'dataloaders', 'train.dataloader'))
         dev_dataloader = get_dataloader(args.dataset,
                                         'validation',
@@ -132,7 +133,8 @@ def main():
                                         args.max_dialogue_len,
                                         args.max_turn_len,
                                         train_ratio=args.dataset_train_ratio,
-                                        seed=args.seed)
+                                        seed=args.seed,
+                                        feature_store_dir=args.feature_store_dir)
         torch.save(dev_dataloader, os.path.join(OUTPUT_DIR, 'dataloaders', 'dev.dataloader'))
         test_dataloader = get_dataloader(args.dataset,
                                          'test',
@@ -142,7 +144,8 @@ def main():
                                          args.max_dialogue_len,
                                          args.max_turn_len,
                                          train_ratio=args.dataset_train_ratio,
-                                         seed=args.seed)
+                                         seed=args.seed,
+                                         feature_store_dir=args.feature_store_dir)
         torch.save(test_dataloader, os.path.join(OUTPUT_DIR, 'dataloaders', 'test.dataloader'))
 
         setup_ensemble(OUTPUT_DIR, args.ensemble_size)
@@ -183,7 +186,8 @@ def main():
                                                   config.max_turn_len,
                                                   resampled_size=args.data_sampling_size,
                                                   train_ratio=args.dataset_train_ratio,
-                                                  seed=args.seed)
+                                                  seed=args.seed,
+                                                  feature_store_dir=args.feature_store_dir)
             else:
                 loader_args = {"ensemble_path": args.ensemble_model_path,
                                "set_type": "train",
@@ -206,7 +210,8 @@ def main():
                                                     tokenizer,
                                                     encoder,
                                                     args.max_dialogue_len,
-                                                    config.max_turn_len)
+                                                    config.max_turn_len,
+                                                    feature_store_dir=args.feature_store_dir)
                 else:
                     loader_args = {"ensemble_path": args.ensemble_model_path,
                                    "set_type": "dev",
@@ -245,7 +250,8 @@ def main():
                 train_dataloader = change_batch_size(train_dataloader, args.train_batch_size)
         else:
             train_dataloader = get_dataloader(args.dataset, 'train', args.train_batch_size, tokenizer,
-                                              encoder, args.max_dialogue_len, config.max_turn_len)
+                                              encoder, args.max_dialogue_len, config.max_turn_len,
+                                              feature_store_dir=args.feature_store_dir)
             torch.save(train_dataloader, os.path.join(OUTPUT_DIR, 'dataloaders', 'train.dataloader'))
 
         # EVALUATION
@@ -266,7 +272,8 @@ def main():
                 dev_dataloader = change_batch_size(dev_dataloader, args.dev_batch_size)
         else:
             dev_dataloader = get_dataloader(args.dataset, 'validation', args.dev_batch_size, tokenizer,
-                                            encoder, args.max_dialogue_len, config.max_turn_len)
+                                            encoder, args.max_dialogue_len, config.max_turn_len,
+                                            feature_store_dir=args.feature_store_dir)
             torch.save(dev_dataloader, os.path.join(OUTPUT_DIR, 'dataloaders', 'dev.dataloader'))
 
         # EVALUATION
@@ -288,7 +295,8 @@ def main():
                 test_dataloader = change_batch_size(test_dataloader, args.test_batch_size)
         else:
             test_dataloader = get_dataloader(args.dataset, 'test', args.test_batch_size, tokenizer,
-                                             encoder, args.max_dialogue_len, config.max_turn_len)
+                                             encoder, args.max_dialogue_len, config.max_turn_len,
+                                             feature_store_dir=args.feature_store_dir)
             torch.save(test_dataloader, os.path.join(OUTPUT_DIR, 'dataloaders', 'test.dataloader'))
 
         trainer = SetSUMBTTrainer(args, model, tokenizer, None, test_dataloader, logger, tb_writer, device)
@@ -17,14 +17,17 @@
 
 import copy
 import logging
+from collections import OrderedDict
 
 import torch
 import transformers
 
 from convlab.dst.setsumbt.modeling import SetSUMBTModels
+from convlab.dst.setsumbt.modeling.setsumbt import SetSUMBTOutput
 from convlab.dst.dst import DST
 
 USE_CUDA = torch.cuda.is_available()
+TURN_CACHE_SIZE = 4096
 transformers.logging.set_verbosity_error()
 
 
@@ -50,6 +53,9 @@ class SetSUMBTTracker(DST):
             return_belief_state_entropy: If true belief state distribution entropies are included in the state
             return_belief_state_mutual_info: If true belief state distribution mutual infos are included in the state
             store_full_belief_state: If true full belief state is stored within tracker object
+
+        Trackers spawned from this tracker share its model and can update their dialogue states in a single forward
+        pass using update_batch.
         """
         super(SetSUMBTTracker, self).__init__()
 
@@ -64,6 +70,7 @@ class SetSUMBTTracker(DST):
         if self.store_full_belief_state:
             self.full_belief_state = {}
         self.info_dict = {}
+        self.turn_cache = OrderedDict()
 
         if self.model_type in SetSUMBTModels:
             self.model, _, self.config, self.tokenizer = SetSUMBTModels[self.model_type]
@@ -103,6 +110,20 @@ class SetSUMBTTracker(DST):
             logging.info('Model returns belief state distribution mutual information scores (Knowledge uncertainty).')
         logging.info('Ontology loaded successfully.')
 
+    def spawn(self):
+        """
+        Create a tracker for another dialogue, which uses the model, tokenizer and tokenized turn cache of this
+        tracker, e.g. to track parallel dialogues with update_batch.
+
+        Returns:
+            tracker: SetSUMBTTracker with a new dialogue session
+        """
+        tracker = copy.copy(self)
+        if self.store_full_belief_state:
+            tracker.full_belief_state = {}
+        tracker.init_session()
+        return tracker
+
     def get_thresholds(self, threshold='auto') -> dict:
         """
         Setup dictionary of domain specific confidence thresholds
@@ -153,11 +174,40 @@ class SetSUMBTTracker(DST):
         Args:
             user_act: User utterance
 
+        Returns:
+            state: Dialogue state
+        """
+        return self.update_batch([self], [user_act])[0]
+
+    @staticmethod
+    def update_batch(trackers: list, user_acts: list) -> list:
+        """
+        Update the dialogue states of several dialogues, each tracked by its own tracker, with a single model forward
+        pass. The trackers have to share the model (see spawn).
+
+        Args:
+            trackers: Trackers of the dialogues
+            user_acts: User utterance of each dialogue
+
+        Returns:
+            states: Dialogue state of each dialogue
+        """
+        features = [tracker.get_features(user_act) for tracker, user_act in zip(trackers, user_acts)]
+        outputs = SetSUMBTTracker.predict_batch(trackers, features)
+        return [tracker._update_state(user_act, out) for tracker, user_act, out in zip(trackers, user_acts, outputs)]
+
+    def _update_state(self, user_act: str, outputs) -> dict:
+        """
+        Update dialogue state based on the model predictions for the user utterance.
+
+        Args:
+            user_act: User utterance
+            outputs: Model predictions and uncertainty features
+
         Returns:
             state: Dialogue state
         """
         prev_state = self.state
-        outputs = self.predict(self.get_features(user_act))
 
         # Format state entropy
         if outputs.state_entropy is not None:
@@ -286,20 +336,118 @@ class SetSUMBTTracker(DST):
         Returns:
             out: Model predictions and uncertainty features
         """
-        state_mutual_info = None
-        with torch.no_grad():
-            features['hidden_state'] = self.hidden_states
-            features['get_turn_pooled_representation'] = self.return_turn_pooled_representation
-            mutual_info = self.return_belief_state_mutual_info or self.store_full_belief_state
-            features['calculate_state_mutual_info'] = mutual_info
-            outputs = self.model(**features)
-            self.hidden_states = outputs.hidden_state
-
-        # Convert belief state into dialog state
-        state = self.tokenizer.decode_state_batch(outputs.belief_state, outputs.request_probabilities,
-                                                  outputs.active_domain_probabilities,
-                                                  outputs.general_act_probabilities)
-        state = state['000000'][0]
+        return self.predict_batch([self], [features])[0]
+
+    @staticmethod
+    def predict_batch(trackers: list, features: list) -> list:
+        """
+        Model forward pass and prediction post-processing for the current turns of several dialogues. The turns are
+        batched together with the latent belief states of their dialogues, dialogues without a latent belief state
+        (first turns) are batched separately as the model initialises the belief states of a whole batch at once.
+
+        Args:
+            trackers: Trackers of the dialogues, sharing one model
+            features: Dictionary of model input features of each dialogue
+
+        Returns:
+            out: Model predictions and uncertainty features of each dialogue
+        """
+        model = trackers[0].model
+        outputs = [None] * len(trackers)
+        batches = dict()
+        for idx, tracker in enumerate(trackers):
+            batches.setdefault(tracker.hidden_states is None, []).append(idx)
+
+        for batch in batches.values():
+            batch_features = dict()
+            for key, value in features[batch[0]].items():
+                batch_features[key] = torch.cat([features[idx][key] for idx in batch]) if value is not None else None
+            hidden_states = [trackers[idx].hidden_states for idx in batch]
+            if hidden_states[0] is None:
+                batch_features['hidden_state'] = None
+            elif isinstance(hidden_states[0], tuple):
+                batch_features['hidden_state'] = tuple(torch.cat(states, 1) for states in zip(*hidden_states))
+            else:
+                batch_features['hidden_state'] = torch.cat(hidden_states, 1)
+            batch_features['get_turn_pooled_representation'] = any(trackers[idx].return_turn_pooled_representation
+                                                                   for idx in batch)
+            batch_features['calculate_state_mutual_info'] = any(trackers[idx].return_belief_state_mutual_info
+                                                                or trackers[idx].store_full_belief_state
+                                                                for idx in batch)
+
+            with torch.no_grad():
+                batch_outputs = model(**batch_features)
+
+            # Convert belief states into dialog states
+            states = trackers[0].tokenizer.decode_state_batch(batch_outputs.belief_state,
+                                                              batch_outputs.request_probabilities,
+                                                              batch_outputs.active_domain_probabilities,
+                                                              batch_outputs.general_act_probabilities)
+            states = list(states.values())
+            for i, idx in enumerate(batch):
+                outputs[idx] = trackers[idx]._postprocess(SetSUMBTTracker._select_dialogue(batch_outputs, i,
+                                                                                           len(batch)),
+                                                          states[i][0])
+
+        return outputs
+
+    @staticmethod
+    def _select_dialogue(outputs, idx: int, batch_size: int):
+        """
+        Model outputs of a single dialogue of a batch.
+
+        Args:
+            outputs: Model outputs of the batch
+            idx: Index of the dialogue in the batch
+            batch_size: Number of dialogues in the batch
+
+        Returns:
+            outputs: Model outputs of the dialogue
+        """
+        def select(value):
+            if value is None:
+                return None
+            if isinstance(value, dict):
+                return {key: select(itm) for key, itm in value.items()}
+            return value[idx:idx + 1]
+
+        # The latent belief state contains a state per slot for each dialogue
+        def select_hidden(value):
+            size = value.size(1) // batch_size
+            return value[:, idx * size:(idx + 1) * size]
+
+        if outputs.hidden_state is None:
+            hidden_state = None
+        elif isinstance(outputs.hidden_state, tuple):
+            hidden_state = tuple(select_hidden(state) for state in outputs.hidden_state)
+        else:
+            hidden_state = select_hidden(outputs.hidden_state)
+
+        output = SetSUMBTOutput(belief_state=select(outputs.belief_state),
+                                request_probabilities=select(outputs.request_probabilities),
+                                active_domain_probabilities=select(outputs.active_domain_probabilities),
+                                general_act_probabilities=select(outputs.general_act_probabilities),
+                                hidden_state=hidden_state,
+                                belief_state_mutual_information=select(outputs.belief_state_mutual_information))
+        output.turn_pooled_representation = select(getattr(outputs, 'turn_pooled_representation', None))
+        return output
+
+    def _postprocess(self, outputs, state: dict):
+        """
+        Prediction post-processing for the current turn of the dialogue.
+
+        Args:
+            outputs: Model outputs of the dialogue
+            state: Decoded dialogue state
+
+        Returns:
+            out: Model predictions and uncertainty features
+        """
+        self.hidden_states = outputs.hidden_state
+        if not self.return_turn_pooled_representation:
+            outputs.turn_pooled_representation = None
+        if not (self.return_belief_state_mutual_info or self.store_full_belief_state):
+            outputs.belief_state_mutual_information = None
 
         if self.store_full_belief_state:
             self.info_dict['belief_state_distributions'] = outputs.belief_state
@@ -367,6 +515,12 @@ class SetSUMBTTracker(DST):
         else:
             system_act = ''
 
+        # Tokenized turns are cached as the same utterances reoccur often, e.g. in simulated dialogues
+        key = (user_act, system_act)
+        if key in self.turn_cache:
+            self.turn_cache.move_to_end(key)
+            return dict(self.turn_cache[key])
+
         dialogue = [[{
             'user_utterance': user_act,
             'system_utterance': system_act
@@ -375,11 +529,15 @@ class SetSUMBTTracker(DST):
         # Tokenize dialog
         features = self.tokenizer.encode(dialogue, max_seq_len=self.config.max_turn_len, max_turns=1)
 
-        for key in features:
-            if features[key] is not None:
-                features[key] = features[key].to(self.device)
+        for key_ in features:
+            if features[key_] is not None:
+                features[key_] = features[key_].to(self.device)
+
+        self.turn_cache[key] = features
+        if len(self.turn_cache) > TURN_CACHE_SIZE:
+            self.turn_cache.popitem(last=False)
 
-        return features
+        return dict(features)
 
 
 # if __name__ == "__main__":
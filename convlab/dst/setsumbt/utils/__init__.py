@@ -1,2 +1,13 @@
-from convlab.dst.setsumbt.utils.configuration import get_args, update_args, clear_checkpoints
-from convlab.dst.setsumbt.utils.ensemble import setup_ensemble, EnsembleAggregator
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'get_args': 'convlab.dst.setsumbt.utils.configuration',
+    'update_args': 'convlab.dst.setsumbt.utils.configuration',
+    'clear_checkpoints': 'convlab.dst.setsumbt.utils.configuration',
+    'setup_ensemble': 'convlab.dst.setsumbt.utils.ensemble',
+    'EnsembleAggregator': 'convlab.dst.setsumbt.utils.ensemble',
+    'load_predictions': 'convlab.dst.setsumbt.utils.ensemble',
+    'iterate_predictions': 'convlab.dst.setsumbt.utils.ensemble',
+})
+__all__ = ['get_args', 'update_args', 'clear_checkpoints', 'setup_ensemble', 'EnsembleAggregator',
+           'load_predictions', 'iterate_predictions']
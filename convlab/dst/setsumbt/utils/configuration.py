@@ -55,6 +55,8 @@ def get_args(base_models: dict):
     parser.add_argument('--data_sampling_size', help='Resampled dataset size', default=-1, type=int)
     parser.add_argument('--no_descriptions', help='Do not use slot descriptions rather than slot names for embeddings',
                         action='store_true')
+    parser.add_argument('--feature_store_dir', default=None,
+                        help='Directory in which preprocessed dataset features are stored once and reused')
 
     # MODEL
     # Environment
@@ -81,6 +83,8 @@ def get_args(base_models: dict):
     parser.add_argument('--distance_measure', default='cosine',
                         help='Similarity measure for candidate scoring: cosine/euclidean')
     parser.add_argument('--ensemble_size', help='Number of models in ensemble', default=-1, type=int)
+    parser.add_argument('--prediction_shard_size', default=None, type=int,
+                        help='Number of dialogues per shard of saved ensemble predictions, unsharded if not set')
     parser.add_argument('--no_set_similarity', action='store_true', help='Set True to not use set similarity')
     parser.add_argument('--set_pooling',
                         help='Set pooling method for set similarity model using single embedding distances',
@@ -15,12 +15,17 @@
 # limitations under the License.
 """Ensemble setup ad inference utils."""
 
+import json
 import os
+import shutil
 from shutil import copy2 as copy
 
 import torch
 import numpy as np
 
+PREDICTIONS_VERSION = 1
+
+
 def setup_ensemble(model_path: str, ensemble_size: int):
     """
     Setup ensemble model directory structure.
@@ -34,24 +39,51 @@ def setup_ensemble(model_path: str, ensemble_size: int):
         if not os.path.exists(path):
             os.mkdir(path)
             os.mkdir(os.path.join(path, 'dataloaders'))
-            # Add development set dataloader to each ensemble member directory
+            # Add development set dataloader to each ensemble member directory, a dataloader of a dataset loaded
+            # from a feature store only references the features in the store
             for set_type in ['dev']:
                 copy(os.path.join(model_path, 'dataloaders', f'{set_type}.dataloader'),
                      os.path.join(path, 'dataloaders', f'{set_type}.dataloader'))
 
 
 class EnsembleAggregator:
-    """Aggregator for ensemble model outputs."""
+    """
+    Aggregator for ensemble model outputs.
+
+    Without a shard size all outputs are kept in memory and saved to a single file. With a shard size the outputs
+    are written to the save path, a directory, in shards of about shard_size dialogues as soon as they are complete,
+    and only the outputs of the current shard are kept in memory. The shards are listed in the index.json file of the
+    directory, which is written last. Use load_predictions to load either format.
+    """
 
-    def __init__(self):
+    def __init__(self, shard_size: int = None):
+        """
+        Args:
+            shard_size: Number of dialogues per shard, None to save all outputs to a single file
+        """
+        self.shard_size = shard_size
         self.init_session()
         self.input_items = ['input_ids', 'attention_mask', 'token_type_ids']
         self.output_items = ['belief_state', 'request_probabilities', 'active_domain_probabilities',
                              'general_act_probabilities']
 
-    def init_session(self):
-        """Initialize aggregator for new session."""
+    def init_session(self, path: str = None):
+        """
+        Initialize aggregator for new session.
+
+        Args:
+            path: Path of the saved outputs, required to stream shards to disk
+        """
         self.features = dict()
+        self.path = path
+        self.num_dialogues = 0
+        self.shards = list()
+        if self.shard_size and path is not None:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+            os.makedirs(path)
 
     def add_batch(self, model_input: dict, model_output: dict, dialogue_ids=None):
         """
@@ -66,13 +98,13 @@ class EnsembleAggregator:
             if key in model_input:
                 if key not in self.features:
                     self.features[key] = list()
-                self.features[key].append(model_input[key])
+                self.features[key].append(self._to_cpu(model_input[key]))
 
         for key in self.output_items:
             if key in model_output:
                 if key not in self.features:
                     self.features[key] = list()
-                self.features[key].append(model_output[key])
+                self.features[key].append(self._to_cpu(model_output[key]))
 
         if dialogue_ids is not None:
             if 'dialogue_ids' not in self.features:
@@ -80,6 +112,19 @@ class EnsembleAggregator:
             else:
                 self.features['dialogue_ids'].append(np.array([list(itm) for itm in dialogue_ids]).T)
 
+        self.num_dialogues += model_input['input_ids'].size(0)
+        if self.shard_size and self.path is not None and self.num_dialogues >= self.shard_size:
+            self._write_shard()
+
+    @staticmethod
+    def _to_cpu(item):
+        """Move a model input or output item to the cpu."""
+        if type(item) == dict:
+            return {k: EnsembleAggregator._to_cpu(i) for k, i in item.items()}
+        elif isinstance(item, torch.Tensor):
+            return item.detach().cpu()
+        return item
+
     def _aggregate(self):
         """Aggregate model outputs."""
         for key in self.features:
@@ -105,6 +150,15 @@ class EnsembleAggregator:
         else:
             return torch.cat(item, 0)
 
+    def _write_shard(self):
+        """Write the aggregated outputs of the current shard and clear them from memory."""
+        self._aggregate()
+        file_name = f'shard-{len(self.shards):05d}.data'
+        torch.save(self.features, os.path.join(self.path, file_name))
+        self.shards.append({'file': file_name, 'num_dialogues': self.num_dialogues})
+        self.features = dict()
+        self.num_dialogues = 0
+
     def save(self, path):
         """
         Save aggregated model outputs to file.
@@ -112,5 +166,58 @@ class EnsembleAggregator:
         Args:
             path: Path to save file
         """
-        self._aggregate()
-        torch.save(self.features, path)
+        if not self.shard_size:
+            self._aggregate()
+            torch.save(self.features, path)
+            return
+
+        if self.path is None:
+            # Outputs were kept in memory, write them as a single shard
+            features, num_dialogues = self.features, self.num_dialogues
+            self.init_session(path)
+            self.features, self.num_dialogues = features, num_dialogues
+        elif self.path != path:
+            raise ValueError(f'Outputs were streamed to {self.path}, not {path}.')
+        if self.num_dialogues:
+            self._write_shard()
+        with open(os.path.join(path, 'index.json'), 'w') as writer:
+            json.dump({'version': PREDICTIONS_VERSION, 'shards': self.shards}, writer, indent=2)
+
+
+def iterate_predictions(path: str):
+    """
+    Iterate over the shards of saved ensemble outputs, a file saved without sharding is a single shard.
+
+    Args:
+        path: Path of the saved outputs
+
+    Returns:
+        Iterator over dictionaries of ensemble outputs
+    """
+    if not os.path.isdir(path):
+        yield torch.load(path)
+        return
+
+    index_path = os.path.join(path, 'index.json')
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f'{path} contains no index of saved ensemble outputs, was saving interrupted?')
+    with open(index_path) as reader:
+        index = json.load(reader)
+    for shard in index['shards']:
+        yield torch.load(os.path.join(path, shard['file']))
+
+
+def load_predictions(path: str) -> dict:
+    """
+    Load saved ensemble outputs, either a single file or a directory of shards.
+
+    Args:
+        path: Path of the saved outputs
+
+    Returns:
+        Dictionary of ensemble outputs of all dialogues
+    """
+    shards = list(iterate_predictions(path))
+    if len(shards) == 1:
+        return shards[0]
+    return {key: EnsembleAggregator._aggregate_item([shard[key] for shard in shards]) for key in shards[0]}
@@ -1 +1,6 @@
-from convlab.dst.trade.multiwoz.trade import MultiWOZTRADE as TRADE
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'TRADE': ('convlab.dst.trade.multiwoz.trade', 'MultiWOZTRADE'),
+})
+__all__ = ['TRADE']
@@ -1 +1,6 @@
-from convlab.dst.trippy.tracker import TRIPPY
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'TRIPPY': 'convlab.dst.trippy.tracker',
+})
+__all__ = ['TRIPPY']
@@ -19,6 +19,7 @@ import re
 import json
 import copy
 import logging
+from collections import OrderedDict
 
 import torch
 from transformers import (BertConfig, BertTokenizer,
@@ -41,6 +42,8 @@ MODEL_CLASSES = {
     'electra': (ElectraConfig, ElectraForDST, ElectraTokenizer),
 }
 
+TOKEN_CACHE_SIZE = 4096
+
 
 class TRIPPY(DST):
     def print_header(self):
@@ -193,6 +196,16 @@ class TRIPPY(DST):
         self.model.to(self.device)
         self.model.eval()
         logging.info("DST model weights loaded from %s" % (self.model_path))
+        self.init_context_encoding()
+
+    def spawn(self):
+        """
+        Create a tracker for another dialogue, which uses the model, tokenizer and token cache of this
+        tracker, e.g. to track parallel dialogues with update_batch.
+        """
+        tracker = copy.copy(self)
+        tracker.init_session()
+        return tracker
 
     def load_nlu(self):
         """ Loads NLUs for internal evaluation """
@@ -230,7 +243,7 @@ class TRIPPY(DST):
                       'history': []}
         self.state['belief_state'] = copy.deepcopy(self.template_state)
         self.history = []
-        self.ds_aux = {slot: torch.tensor([0]).to(self.device) for slot in self.config.dst_slot_list}
+        self.ds_aux = {slot: 0 for slot in self.config.dst_slot_list}
         self.gt_belief_state = copy.deepcopy(self.template_state)
         self.global_diag_cnt += 1
         self.global_turn_cnt = -1
@@ -246,6 +259,22 @@ class TRIPPY(DST):
                     self.gt_belief_state[domain][slot] = value
 
     def update(self, user_act=''):
+        return TRIPPY.update_batch([self], [user_act])[0]
+
+    @staticmethod
+    def update_batch(trackers, user_acts):
+        """
+        Update the dialogue states of several dialogues, each tracked by its own tracker, with a single model
+        forward pass. The trackers have to share the model (see spawn).
+        """
+        turns = [tracker.prepare_turn() for tracker in trackers]
+        features = trackers[0].collate_features([turn_features for turn_features, _, _ in turns])
+        predictions = TRIPPY.predict_batch(trackers, features, [inform_mem for _, inform_mem, _ in turns])
+        return [tracker.update_state(pred_states, pred_classes, u_acts)
+                for tracker, (pred_states, pred_classes), (_, _, u_acts) in zip(trackers, predictions, turns)]
+
+    def prepare_turn(self):
+        """ Adds the last turn to the history and returns its features, inform memory and user acts """
         prev_state = self.state
 
         if not self.no_eval:
@@ -273,6 +302,7 @@ class TRIPPY(DST):
         else:
             raise Exception('Unknown format for system action:', prev_state['system_action'])
 
+        u_acts = None
         if not self.no_eval:
             # user_action is a list of semantic user actions if no NLG is used
             # in the pipeline, otherwise user_action is plain text.
@@ -290,12 +320,18 @@ class TRIPPY(DST):
         if not self.no_eval:
             self.print_inform_memory(inform_mem)
 
-        # --- Tokenize dialogue context and feed DST model ---
+        # --- Tokenize dialogue context ---
 
         used_ds_aux = None if not self.config.dst_class_aux_feats_ds else self.ds_aux
         used_inform_aux = None if not self.config.dst_class_aux_feats_inform else inform_aux
-        features = self.get_features(self.history, ds_aux=used_ds_aux, inform_aux=used_inform_aux)
-        pred_states, pred_classes = self.predict(features, inform_mem)
+        turn_features = {'input_ids': self.get_context_ids(self.history),
+                         'inform_slot_id': used_inform_aux,
+                         'diag_state': used_ds_aux}
+        return turn_features, inform_mem, u_acts
+
+    def update_state(self, pred_states, pred_classes, u_acts=None):
+        """ Updates the dialogue state with the predictions of the DST model for the last turn """
+        prev_state = self.state
 
         # --- Update ConvLab-style dialogue state ---
 
@@ -359,44 +395,58 @@ class TRIPPY(DST):
         return self.state
     
     def predict(self, features, inform_mem):
+        return TRIPPY.predict_batch([self], features, [inform_mem])[0]
+
+    @staticmethod
+    def predict_batch(trackers, features, inform_mems):
+        """
+        Runs the DST model on the batched features of the current turns of several dialogues (see collate_features)
+        and returns the slot value and class predictions of each dialogue.
+        """
         with torch.no_grad():
-            outputs = self.model(input_ids=features['input_ids'],
-                                 input_mask=features['attention_mask'],
-                                 inform_slot_id=features['inform_slot_id'],
-                                 diag_state=features['diag_state'])
-
-        input_tokens = self.tokenizer.convert_ids_to_tokens(features['input_ids'][0]) # unmasked!
+            outputs = trackers[0].model(input_ids=features['input_ids'],
+                                        input_mask=features['attention_mask'],
+                                        inform_slot_id=features['inform_slot_id'],
+                                        diag_state=features['diag_state'])
+
+        # Argmax of all slots and dialogues at once. Padding is never predicted as span start or end.
+        slot_list = trackers[0].config.dst_slot_list
+        padding = (features['attention_mask'] == 0).unsqueeze(1)
+        class_predictions = torch.stack([outputs[2][slot] for slot in slot_list], 1).argmax(-1).tolist()
+        start_predictions = torch.stack([outputs[3][slot] for slot in slot_list], 1).masked_fill(
+            padding, float('-inf')).argmax(-1).tolist()
+        end_predictions = torch.stack([outputs[4][slot] for slot in slot_list], 1).masked_fill(
+            padding, float('-inf')).argmax(-1).tolist()
+        refer_predictions = torch.stack([outputs[5][slot] for slot in slot_list], 1).argmax(-1).tolist()
+
+        return [tracker.decode_predictions(input_ids, inform_mem, class_predictions[i], start_predictions[i],
+                                           end_predictions[i], refer_predictions[i])
+                for i, (tracker, input_ids, inform_mem) in enumerate(zip(trackers, features['context_ids'],
+                                                                         inform_mems))]
+
+    def decode_predictions(self, input_ids, inform_mem, class_preds, start_preds, end_preds, refer_preds):
+        """ Maps the per slot predictions of the DST model for one dialogue to slot values """
+        input_tokens = None
 
-        per_slot_class_logits = outputs[2]
-        per_slot_start_logits = outputs[3]
-        per_slot_end_logits = outputs[4]
-        per_slot_refer_logits = outputs[5]
-
-        # TODO: maybe add assert to check that batch=1
-        
         predictions = {}
         class_predictions = {}
 
-        for slot in self.config.dst_slot_list:
+        for slot_idx, slot in enumerate(self.config.dst_slot_list):
             d, s = slot.split('-')
             slot_udf = "%s-%s" % (self.dataset_interfacer.map_trippy_to_udf(d, s))
 
             predictions[slot_udf] = 'none'
             class_predictions[slot_udf] = 0
 
-            class_logits = per_slot_class_logits[slot][0]
-            start_logits = per_slot_start_logits[slot][0]
-            end_logits = per_slot_end_logits[slot][0]
-            refer_logits = per_slot_refer_logits[slot][0]
-
-            class_prediction = int(class_logits.argmax())
-            start_prediction = int(start_logits.argmax())
-            end_prediction = int(end_logits.argmax())
-            refer_prediction = int(refer_logits.argmax())
+            class_prediction = class_preds[slot_idx]
+            start_prediction = start_preds[slot_idx]
+            end_prediction = end_preds[slot_idx]
 
             if class_prediction == self.config.dst_class_types.index('dontcare'):
                 predictions[slot_udf] = 'dontcare'
             elif class_prediction == self.config.dst_class_types.index('copy_value'):
+                if input_tokens is None:
+                    input_tokens = self.tokenizer.convert_ids_to_tokens(input_ids) # unmasked!
                 predictions[slot_udf] = ' '.join(input_tokens[start_prediction:end_prediction + 1])
                 predictions[slot_udf] = re.sub("(^| )##", "", predictions[slot_udf])
                 if "\u0120" in predictions[slot_udf]:
@@ -413,15 +463,12 @@ class TRIPPY(DST):
 
         # Referral case. All other slot values need to be seen first in order
         # to be able to do this correctly.
-        for slot in self.config.dst_slot_list:
+        for slot_idx, slot in enumerate(self.config.dst_slot_list):
             d, s = slot.split('-')
             slot_udf = "%s-%s" % (self.dataset_interfacer.map_trippy_to_udf(d, s))
 
-            class_logits = per_slot_class_logits[slot][0]
-            refer_logits = per_slot_refer_logits[slot][0]
-
-            class_prediction = int(class_logits.argmax())
-            refer_prediction = int(refer_logits.argmax())
+            class_prediction = class_preds[slot_idx]
+            refer_prediction = refer_preds[slot_idx]
 
             if 'refer' in self.config.dst_class_types and class_prediction == self.config.dst_class_types.index('refer'):
                 # Only slots that have been mentioned before can be referred to.
@@ -448,6 +495,121 @@ class TRIPPY(DST):
         return predictions, class_predictions
 
     def get_features(self, context, ds_aux=None, inform_aux=None):
+        return self.collate_features([{'input_ids': self.get_context_ids(context),
+                                       'inform_slot_id': inform_aux,
+                                       'diag_state': ds_aux}])
+
+    def collate_features(self, turn_features):
+        """
+        Pads the context token ids of several turns into a batch and moves it to the device together with the
+        auxiliary features. The unpadded token ids are kept as 'context_ids'.
+        """
+        context_ids = [turn['input_ids'] for turn in turn_features]
+        max_len = max(len(ids) for ids in context_ids)
+        pad_id = self.tokenizer.pad_token_id
+        input_ids = torch.tensor([ids + [pad_id] * (max_len - len(ids)) for ids in context_ids])
+        attention_mask = torch.tensor([[1] * len(ids) + [0] * (max_len - len(ids)) for ids in context_ids])
+        features = {'input_ids': input_ids.to(self.device),
+                    'attention_mask': attention_mask.to(self.device),
+                    'inform_slot_id': self.collate_aux([turn['inform_slot_id'] for turn in turn_features]),
+                    'diag_state': self.collate_aux([turn['diag_state'] for turn in turn_features]),
+                    'context_ids': context_ids}
+        return features
+
+    def collate_aux(self, aux_feats):
+        # Auxiliary features are kept as ints per slot, the model gets a tensor of the batch per slot
+        if aux_feats[0] is None:
+            return None
+        aux = torch.tensor([list(feats.values()) for feats in aux_feats]).to(self.device)
+        return {slot: aux[:, slot_idx] for slot_idx, slot in enumerate(aux_feats[0])}
+
+    def init_context_encoding(self):
+        """
+        Sets up the incremental encoding of dialogue contexts (see get_context_ids). Utterances are tokenized once
+        and cached, the token ids of a context are concatenated from the cached utterances.
+        """
+        self.token_cache = OrderedDict()
+        encode = lambda text: self.tokenizer.encode(text, add_special_tokens=False)
+        self.bos_ids = encode('<s>')
+        self.eos_ids = encode('</s>')
+        # What is left of the whitespace between two separators, also left of the whitespace before a separator
+        self.gap_ids = encode('</s> </s>')[len(self.eos_ids):-len(self.eos_ids)]
+        # Token ids of the probe word that precedes utterances in the history, see encode_utterance
+        self.probe_ids = self.encode_in_context('a')[:len(self.encode_in_context('a')) - len(self.gap_ids)]
+
+        # The incremental encoding relies on utterances being tokenized independently of their neighbours,
+        # fall back to encoding full contexts if this does not hold for the tokenizer
+        self.incremental_context = True
+        probe_context = [['sys', 'null'], ['user', 'i need a cheap hotel .'],
+                         ['sys', 'what area would you like ?'], ['user', "north , please . it's for 2 people"],
+                         ['sys', 'i have 3 options .'], ['user', 'book one']]
+        for turn in range(1, len(probe_context) + 1):
+            if self.get_context_ids(probe_context[:turn]) != self.encode_context(probe_context[:turn]):
+                logging.warning("DST tokenizer does not support incremental context encoding, contexts are "
+                                "tokenized from scratch every turn")
+                self.incremental_context = False
+                break
+        self.token_cache.clear()
+
+    def encode_in_context(self, text):
+        # Token ids of text between two separators
+        ids = self.tokenizer.encode('</s> %s </s>' % text, add_special_tokens=False)
+        return ids[len(self.eos_ids):-len(self.eos_ids)]
+
+    def encode_utterance(self, text):
+        """
+        Returns the token ids of an utterance between two separators (as last user or system turn) and after
+        another utterance (as older turn in the history). Both are cached.
+        """
+        if text in self.token_cache:
+            self.token_cache.move_to_end(text)
+            return self.token_cache[text]
+
+        after_probe = self.encode_in_context('a %s' % text)
+        utterance_ids = (self.encode_in_context(text),
+                         after_probe[len(self.probe_ids):len(after_probe) - len(self.gap_ids)])
+        self.token_cache[text] = utterance_ids
+        if len(self.token_cache) > TOKEN_CACHE_SIZE:
+            self.token_cache.popitem(last=False)
+        return utterance_ids
+
+    def get_context_ids(self, context):
+        """
+        Returns the token ids of the dialogue context, the same as encode_context: the last user and system
+        utterances in separate segments, followed by the remaining history. Each utterance is tokenized once
+        and the history is only added until the maximum sequence length is reached.
+        """
+        texts = [e[1] for e in reversed(context)]
+        if not self.incremental_context or len(texts) == 0 or any(t != t.strip() for t in texts):
+            return self.encode_context(context)
+
+        texts = ['' if t in ['null'] else t for t in texts]
+        max_length = self.config.dst_max_seq_length
+        input_ids = list(self.bos_ids)
+        for text in texts[:2] + [''] * (2 - len(texts)):
+            input_ids += self.encode_utterance(text)[0] if text else self.gap_ids
+            input_ids += self.eos_ids + self.gap_ids + self.eos_ids
+        # Utterances of the history are joined by spaces, so only the first one keeps the
+        # whitespace handling right after a separator
+        history = [t for t in texts[2:] if t]
+        if not history:
+            input_ids += self.gap_ids
+        for h_itr, text in enumerate(history):
+            if len(input_ids) >= max_length:
+                break
+            if h_itr == 0:
+                first_ids = self.encode_utterance(text)[0]
+                input_ids += first_ids[:len(first_ids) - len(self.gap_ids)]
+            else:
+                input_ids += self.encode_utterance(text)[1]
+        else:
+            if history:
+                input_ids += self.gap_ids
+        input_ids += self.eos_ids
+        return input_ids[:max_length]
+
+    def encode_context(self, context):
+        """ Tokenizes the full dialogue context, latest utterances first """
         assert(self.model_type == "roberta") # TODO: generalize to other BERT-like models
         input_tokens = ['<s>'] # TODO: use tokenizer token names rather than strings
         e_itr = 0
@@ -463,27 +625,19 @@ class TRIPPY(DST):
 
         # TODO: delex sys utt currently not supported
         features = self.tokenizer.encode_plus(input_tokens, add_special_tokens=False, max_length=self.config.dst_max_seq_length)
-
-        input_ids = torch.tensor(features['input_ids']).reshape(1,-1).to(self.device)
-        attention_mask = torch.tensor(features['attention_mask']).reshape(1,-1).to(self.device)
-        features = {'input_ids': input_ids,
-                    'attention_mask': attention_mask,
-                    'inform_slot_id': inform_aux,
-                    'diag_state': ds_aux}
-
-        return features
+        return features['input_ids']
 
     def update_ds_aux(self, state, pred_states, terminated=False):
-        ds_aux = copy.deepcopy(self.ds_aux)
+        ds_aux = dict(self.ds_aux)
         for slot in self.config.dst_slot_list:
             d, s = slot.split('-')
             d_udf, s_udf = self.dataset_interfacer.map_trippy_to_udf(d, s)
             slot_udf = "%s-%s" % (d_udf, s_udf)
             if d_udf in state and s_udf in state[d_udf]:
-                ds_aux[slot][0] = int(state[d_udf][s_udf] != '')
+                ds_aux[slot] = int(state[d_udf][s_udf] != '')
             else:
                 # Requestable slots are not found in the DS
-                ds_aux[slot][0] = int(pred_states[slot_udf] != 'none')
+                ds_aux[slot] = int(pred_states[slot_udf] != 'none')
         return ds_aux
 
     def get_inform_aux(self, state):
@@ -497,7 +651,7 @@ class TRIPPY(DST):
         for slot in self.config.dst_slot_list:
             d, s = slot.split('-')
             d_udf, s_udf = self.dataset_interfacer.map_trippy_to_udf(d, s)
-            inform_aux["%s-%s" % (d_udf, s_udf)] = torch.tensor([0]).to(self.device)
+            inform_aux["%s-%s" % (d_udf, s_udf)] = 0
             inform_mem["%s-%s" % (d_udf, s_udf)] = 'none'
         for e in state:
             a, d, s, v = e
@@ -505,7 +659,7 @@ class TRIPPY(DST):
             if a in ['inform', 'recommend', 'select', 'book', 'offerbook']:
                 slot = "%s-%s" % (d, s)
                 if slot in inform_aux:
-                    inform_aux[slot][0] = 1
+                    inform_aux[slot] = 1
                     inform_mem[slot] = self.dataset_interfacer.normalize_values(v)
         return inform_aux, inform_mem
 
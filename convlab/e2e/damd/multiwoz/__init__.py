@@ -1 +1,6 @@
-from convlab.e2e.damd.multiwoz.damd import Damd
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'Damd': 'convlab.e2e.damd.multiwoz.damd',
+})
+__all__ = ['Damd']
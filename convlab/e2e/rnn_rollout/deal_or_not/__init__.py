@@ -1 +1,6 @@
-from convlab.e2e.rnn_rollout.deal_or_not.model import DealornotAgent
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'DealornotAgent': 'convlab.e2e.rnn_rollout.deal_or_not.model',
+})
+__all__ = ['DealornotAgent']
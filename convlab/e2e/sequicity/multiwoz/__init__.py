@@ -1 +1,6 @@
-from convlab.e2e.sequicity.multiwoz.sequicity import Sequicity
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'Sequicity': 'convlab.e2e.sequicity.multiwoz.sequicity',
+})
+__all__ = ['Sequicity']
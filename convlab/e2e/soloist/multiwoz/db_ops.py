@@ -1,13 +1,16 @@
-import json, random, os
+import random, os
 from convlab.e2e.damd.multiwoz.ontology import all_domains, db_domains, booking_slots
+from convlab.util.multiwoz.entity_store import load_table
 
 class MultiWozDB(object):
     def __init__(self, dir, db_paths):
         self.dbs = {}
         self.sql_dbs = {}
+        # the lower-cased databases are loaded once per process and shared
+        self.tables = {}
         for domain in all_domains:
-            with open(os.path.join(dir, db_paths[domain]), 'r') as f:
-                self.dbs[domain] = json.loads(f.read().lower())
+            self.tables[domain] = load_table(os.path.join(dir, db_paths[domain]), lower=True)
+            self.dbs[domain] = self.tables[domain].entities
 
 
     def oneHotVector(self, domain, num):
@@ -121,6 +124,20 @@ class MultiWozDB(object):
         return report
 
 
+    def _candidates(self, domain, constraints, exactly_match):
+        """ids of the entities that can satisfy the value constraints of queryJsons, from the index of the domain"""
+        if not exactly_match:
+            return range(len(self.dbs[domain]))
+        exact = []
+        for s, v in constraints.items():
+            if s in ['name', 'people', 'stay', 'arrive', 'leave'] or (domain == 'hotel' and s == 'day') or \
+                    (domain == 'restaurant' and s in ['day', 'time']):
+                continue
+            if v in ["don't care", "do n't care", "dont care", "not mentioned", "dontcare", ""]:
+                continue
+            exact.append((s, 'yes' if v == 'free' else v))
+        return self.tables[domain].candidates(exact)
+
     def queryJsons(self, domain, constraints, exactly_match=True, return_name=False):
         """Returns the list of entities for a given domain
         based on the annotation of the belief state
@@ -152,7 +169,8 @@ class MultiWozDB(object):
 
 
         if 'name' in constraints:
-            for db_ent in self.dbs[domain]:
+            for index in self.tables[domain].candidates([('name', constraints['name'])]):
+                db_ent = self.dbs[domain][index]
                 if 'name' in db_ent:
                     cons = constraints['name']
                     dbn = db_ent['name']
@@ -161,7 +179,8 @@ class MultiWozDB(object):
                         match_result.append(db_ent)
                         return match_result
 
-        for index, db_ent in enumerate(self.dbs[domain]):
+        for index in self._candidates(domain, constraints, exactly_match):
+            db_ent = self.dbs[domain][index]
             match = True
             for s, v in constraints.items():
                 if s == 'name':
@@ -204,7 +223,8 @@ class MultiWozDB(object):
                         break
 
             if match:
-                db_ent['reference'] = f'{index:08d}'
+                # the entities are shared, add the reference to a copy
+                db_ent = dict(db_ent, reference=f'{index:08d}')
                 match_result.append(db_ent)
 
         if not return_name:
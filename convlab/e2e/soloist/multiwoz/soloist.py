@@ -6,6 +6,7 @@ Created on
 """
 import os
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from nltk.tokenize import word_tokenize
 
 from convlab.util.file_util import cached_path
@@ -18,6 +19,9 @@ DEFAULT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_ARCHIVE_FILE_URL = "https://bapengstorage.blob.core.windows.net/fileshare/soloist_multiwoz_data.zip"
 DEFAULT_MODEL_URL = "https://bapengstorage.blob.core.windows.net/fileshare/soloist-model.zip"
 
+# looks up the entities of generated belief states while the responses are decoded
+LOOKUP_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
 
 class SOLOISTAgent(Agent):
     def __init__(self,
@@ -65,6 +69,8 @@ class SOLOISTAgent(Agent):
         self.hidden_states = {}
         self.state = {}
         self.history = []
+        # (turn, token ids) of the turns of the history that were tokenized already
+        self.history_ids = []
 
     def update_dialog_state(self):
         self.state = {}
@@ -77,6 +83,30 @@ class SOLOISTAgent(Agent):
 
         return context
 
+    def prepare_input_ids(self, usr):
+        """
+        token ids of the input of prepare_input. The turns of the history are tokenized once per session, only
+        the new turns are tokenized.
+        """
+        context = self.prepare_input(usr)
+        if not self.model.incremental_encoding or any(not turn or turn != ' '.join(turn.split())
+                                                      for turn in self.history):
+            return self.model.tokenizer([context])['input_ids'][0]
+
+        cached = 0
+        while cached < min(len(self.history), len(self.history_ids)) and \
+                self.history_ids[cached][0] == self.history[cached]:
+            cached += 1
+        self.history_ids = self.history_ids[:cached] + \
+            [(turn, self.model.encode(turn)) for turn in self.history[cached:]]
+
+        pieces = [self.model.encode('[e2e]')]
+        for idx, (_, turn_ids) in enumerate(self.history_ids):
+            if idx > 0:
+                pieces.append(self.model.separator_ids)
+            pieces.append(turn_ids)
+        return self.model.encode_pieces(pieces)
+
     def parse_belief_state_and_response(self, response):
         
         try:
@@ -132,15 +162,26 @@ class SOLOISTAgent(Agent):
                 The response generated by the agent.
         """
         usr = ' '.join(word_tokenize(usr))
-        inputs = self.prepare_input(usr)
-        belief_and_response = self.model.generate(inputs)
+        input_ids = self.prepare_input_ids(usr)
+
+        lookup = {}
+        def on_belief_state(belief):
+            # the entities of the belief state are looked up while the response is decoded
+            lookup['belief_state'], _ = self.parse_belief_state_and_response(belief + ' EOS')
+            lookup['entities'] = LOOKUP_EXECUTOR.submit(self.reader.db.get_match_num, lookup['belief_state'], True)
+
+        belief_and_response = self.model.generate(input_ids, on_belief_state)
         belief_state, response = self.parse_belief_state_and_response(belief_and_response)
 
         self.history.append(response)
         self.active_domains.extend(list(belief_state.keys()))
         self.active_domains = list(set(self.active_domains))
 
-        lexicalized_response = self.reader.restore(response, self.active_domains, belief_state)
+        # entities looked up for a belief state that differs from the one parsed from the whole output are not used
+        entities = None
+        if lookup and lookup['belief_state'] == belief_state:
+            entities = lookup['entities'].result()
+        lexicalized_response = self.reader.restore(response, self.active_domains, belief_state, entities)
 
         return lexicalized_response
 
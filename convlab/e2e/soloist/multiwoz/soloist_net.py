@@ -23,6 +23,25 @@ def cuda_(var):
 def tensor(var):
     return cuda_(torch.tensor(var))
 
+# generation settings of the model config that make model.generate differ from plain greedy decoding
+GREEDY_DEFAULTS = {
+    'num_beams': 1,
+    'num_beam_groups': 1,
+    'do_sample': False,
+    'min_length': 0,
+    'repetition_penalty': 1.0,
+    'no_repeat_ngram_size': 0,
+    'encoder_no_repeat_ngram_size': 0,
+    'bad_words_ids': None,
+    'forced_bos_token_id': None,
+    'forced_eos_token_id': None,
+    'remove_invalid_values': False,
+    'exponential_decay_length_penalty': None,
+    'suppress_tokens': None,
+    'begin_suppress_tokens': None,
+}
+
+
 class SOLOIST:
 
     def __init__(self) -> None:
@@ -34,15 +53,75 @@ class SOLOIST:
 
         self.model = self.model.cuda() if torch.cuda.is_available() else self.model
 
-    def generate(self, inputs):
+        # model.generate decodes greedily with these settings, so the same tokens can be decoded step by step
+        self.incremental_decoding = all(getattr(self.config, key, default) == default
+                                        for key, default in GREEDY_DEFAULTS.items())
+        self.separator_ids = self.encode('EOS')
+        # inputs can be encoded piece by piece if that gives the tokens of the whole input
+        probe = ['[e2e]', 'i want a cheap restaurant in the centre .', 'EOS', 'there are [value_choice] of them .']
+        self.incremental_encoding = self.encode_pieces([self.encode(piece) for piece in probe]) == \
+            self.tokenizer([' '.join(probe)])['input_ids'][0]
+
+    def encode(self, text):
+        """token ids of a piece of the input without the end of sequence token"""
+        return self.tokenizer(text, add_special_tokens=False)['input_ids']
+
+    def encode_pieces(self, pieces):
+        """
+        token ids of the input made of the pieces joined by spaces. Pieces are tokenized independently,
+        the sentencepiece tokenizer never merges tokens across spaces.
+        """
+        input_ids = []
+        for piece in pieces:
+            input_ids += piece
+        return input_ids + [self.tokenizer.eos_token_id]
 
+    def generate(self, inputs, on_belief_state=None):
+        """
+        Args:
+            inputs (str or list): input text, or its token ids
+            on_belief_state (callable): called with the decoded belief state as soon as it is complete, while the
+                response is decoded
+        Returns:
+            the decoded belief state and response
+        """
         self.model.eval()
-        inputs = self.tokenizer([inputs])
-        input_ids = tensor(inputs['input_ids'])
-        generated_tokens = self.model.generate(input_ids = input_ids, max_length = cfg.max_length, top_p=cfg.top_p)
-        decoded_preds = self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+        if isinstance(inputs, str):
+            inputs = self.tokenizer([inputs])['input_ids'][0]
+        input_ids = tensor([inputs])
+        if not self.incremental_decoding:
+            generated_tokens = self.model.generate(input_ids = input_ids, max_length = cfg.max_length, top_p=cfg.top_p)
+            decoded_preds = self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+            return decoded_preds[0]
 
-        return decoded_preds[0]
+        generated_tokens = self.greedy_decode(input_ids, on_belief_state)
+        return self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
 
-    
-    
\ No newline at end of file
+    @torch.no_grad()
+    def greedy_decode(self, input_ids, on_belief_state=None):
+        """
+        Greedy decoding as done by model.generate: the input is encoded once, every step only feeds the last token
+        to the decoder, which keeps the keys and values of the previous tokens and of the encoder output.
+        """
+        attention_mask = input_ids.ne(self.config.pad_token_id).long()
+        encoder_outputs = self.model.get_encoder()(input_ids=input_ids, attention_mask=attention_mask, return_dict=True)
+        generated_tokens = [self.config.decoder_start_token_id]
+        past_key_values = None
+        belief_state_done = on_belief_state is None
+        while len(generated_tokens) < cfg.max_length:
+            outputs = self.model(encoder_outputs=encoder_outputs,
+                                 attention_mask=attention_mask,
+                                 decoder_input_ids=tensor([generated_tokens[-1:]]),
+                                 past_key_values=past_key_values,
+                                 use_cache=True,
+                                 return_dict=True)
+            past_key_values = outputs.past_key_values
+            next_token = int(outputs.logits[0, -1].argmax())
+            generated_tokens.append(next_token)
+            if next_token == self.config.eos_token_id:
+                break
+            if not belief_state_done and generated_tokens[-len(self.separator_ids):] == self.separator_ids:
+                belief_state_done = True
+                on_belief_state(self.tokenizer.decode(generated_tokens[:-len(self.separator_ids)],
+                                                      skip_special_tokens=True))
+        return generated_tokens
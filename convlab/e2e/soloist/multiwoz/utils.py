@@ -55,7 +55,7 @@ class MultiWozReader(object):
         self.nlp = spacy.load('en_core_web_sm')
         self.db = MultiWozDB(DEFAULT_DIRECTORY, cfg.dbs)
 
-    def restore(self, resp, domain, constraint_dict):
+    def restore(self, resp, domain, constraint_dict, mat_ents=None):
         restored = resp
         restored = restored.capitalize()
         restored = restored.replace(' -s', 's')
@@ -63,7 +63,8 @@ class MultiWozReader(object):
         restored = restored.replace(' -er', 'er')
 
 
-        mat_ents = self.db.get_match_num(constraint_dict, True)
+        if mat_ents is None:
+            mat_ents = self.db.get_match_num(constraint_dict, True)
 
         restored = restored.replace('[value_car]', 'BMW')
 
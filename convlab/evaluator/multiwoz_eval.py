@@ -87,6 +87,8 @@ DEF_VAL_BOOKED = 'yes'  # for booked
 DEF_VAL_NOBOOK = 'no'  # for booked
 NOT_SURE_VALS = [DEF_VAL_UNK, DEF_VAL_DNC, DEF_VAL_NUL, DEF_VAL_NOBOOK]
 
+INFORM_INTENTS = ['inform', 'recommend', 'offerbook', 'offerbooked']
+
 
 class MultiWozEvaluator(Evaluator):
     def __init__(self, check_book_constraints=True, check_domain_success=False):
@@ -103,9 +105,64 @@ class MultiWozEvaluator(Evaluator):
         self.success = 0
         self.success_strict = 0
         self.successful_domains = []
+        self._reset_stats()
         logging.info(
             f"We check booking constraints: {self.check_book_constraints}")
 
+    def _reset_stats(self):
+        # per domain bookkeeping of the dialog acts seen so far, so that metrics don't rescan the history
+        self.sys_inform_stats = {domain: {'slots': set(), 'bad': set(), 'num_bad': 0} for domain in belief_domains}
+        self.usr_goal_stats = {domain: {'info': {}, 'reqt': []} for domain in belief_domains}
+        self._num_sys_da_counted = 0
+        self._num_usr_da_counted = 0
+        # database results of the goal constraints, valid as long as the goal is
+        self._query_cache = {}
+        # goals derived from the current goal / user acts, valid until the next dialog act
+        self._goal_cache = {}
+
+    def _count_sys_da(self):
+        for da in self.sys_da_array[self._num_sys_da_counted:]:
+            domain, intent, slot, value = da.split('_', 3)
+            if intent in INFORM_INTENTS and domain in belief_domains and slot in mapping[domain] \
+                    and value.strip() not in NUL_VALUE:
+                key = mapping[domain][slot]
+                stats = self.sys_inform_stats[domain]
+                if self._check_value(domain, key, value):
+                    stats['slots'].add(key)
+                else:
+                    stats['bad'].add((intent, domain, key))
+                    stats['num_bad'] += 1
+        self._num_sys_da_counted = len(self.sys_da_array)
+
+    def _count_usr_da(self):
+        for da in self.usr_da_array[self._num_usr_da_counted:]:
+            d, i, s, v = da.split('_', 3)
+            if d not in belief_domains:
+                continue
+            if i in INFORM_INTENTS and s in mapping[d]:
+                self.usr_goal_stats[d]['info'][mapping[d][s]] = v
+            elif i == 'request':
+                self.usr_goal_stats[d]['reqt'].append(s)
+        self._num_usr_da_counted = len(self.usr_da_array)
+
+    def _usr_goal(self, domains=None):
+        """goal made of the user dialog acts so far, used when not referring to the goal"""
+        self._count_usr_da()
+        if domains is None:
+            domains = belief_domains
+        goal = {}
+        for domain in domains:
+            stats = self.usr_goal_stats.get(domain, {'info': {}, 'reqt': []})
+            goal[domain] = {'info': dict(stats['info']), 'book': {}, 'reqt': list(stats['reqt'])}
+            if domain in self.goal and 'book' in self.goal[domain]:
+                goal[domain]['book'] = self.goal[domain]['book']
+        return goal
+
+    def _get_goal(self, ref2goal=True):
+        if ref2goal not in self._goal_cache:
+            self._goal_cache[ref2goal] = self._expand(self.goal) if ref2goal else self._usr_goal()
+        return self._goal_cache[ref2goal]
+
     def _init_dict(self):
         dic = {}
         for domain in belief_domains:
@@ -146,6 +203,7 @@ class MultiWozEvaluator(Evaluator):
         self.booked = self._init_dict_booked()
         self.booked_states = self._init_dict_booked()
         self.successful_domains = []
+        self._reset_stats()
 
     @staticmethod
     def _convert_action(act):
@@ -200,6 +258,8 @@ class MultiWozEvaluator(Evaluator):
                         else:
                             self.booked_states[domain] = None
         self.goal = self.update_goal(self.goal, da_turn)
+        self._count_sys_da()
+        self._goal_cache = {}
 
     def add_usr_da(self, da_turn):
         """add usr_da into array
@@ -217,6 +277,8 @@ class MultiWozEvaluator(Evaluator):
             da = (dom_int + '_' + slot).lower()
             value = str(value)
             self.usr_da_array.append(da + '_' + value)
+        self._count_usr_da()
+        self._goal_cache = {}
 
     def _book_rate_goal(self, goal, booked_entity, domains=None):
         """
@@ -327,17 +389,26 @@ class MultiWozEvaluator(Evaluator):
         inform_not_reqt = set()
         reqt_not_inform = set()
         bad_inform = set()
-        for da in sys_history:
-            domain, intent, slot, value = da.split('_', 3)
-            if intent in ['inform', 'recommend', 'offerbook', 'offerbooked'] and \
-                    domain in domains and slot in mapping[domain] and value.strip() not in NUL_VALUE:
-                key = mapping[domain][slot]
-                if self._check_value(domain, key, value):
-                    # print('add key', key)
-                    inform_slot[domain].add(key)
-                else:
-                    bad_inform.add((intent, domain, key))
-                    FP += 1
+        if sys_history is self.sys_da_array:
+            # use the counts kept while adding the system acts
+            self._count_sys_da()
+            for domain in domains:
+                stats = self.sys_inform_stats[domain]
+                inform_slot[domain] = stats['slots']
+                bad_inform |= stats['bad']
+                FP += stats['num_bad']
+        else:
+            for da in sys_history:
+                domain, intent, slot, value = da.split('_', 3)
+                if intent in INFORM_INTENTS and \
+                        domain in domains and slot in mapping[domain] and value.strip() not in NUL_VALUE:
+                    key = mapping[domain][slot]
+                    if self._check_value(domain, key, value):
+                        # print('add key', key)
+                        inform_slot[domain].add(key)
+                    else:
+                        bad_inform.add((intent, domain, key))
+                        FP += 1
         for domain in domains:
             for k in goal[domain]['reqt']:
                 if k in inform_slot[domain]:
@@ -385,17 +456,7 @@ class MultiWozEvaluator(Evaluator):
             return True
 
     def book_rate(self, ref2goal=True, aggregate=True):
-        if ref2goal:
-            goal = self._expand(self.goal)
-        else:
-            goal = self._init_dict()
-            for domain in belief_domains:
-                if domain in self.goal and 'book' in self.goal[domain]:
-                    goal[domain]['book'] = self.goal[domain]['book']
-            for da in self.usr_da_array:
-                d, i, s, v = da.split('_', 3)
-                if i in ['inform', 'recommend', 'offerbook', 'offerbooked'] and s in mapping[d]:
-                    goal[d]['info'][mapping[d][s]] = v
+        goal = self._get_goal(ref2goal)
         score = self._book_rate_goal(goal, self.booked)
         if aggregate:
             return np.mean(score) if score else None
@@ -403,17 +464,7 @@ class MultiWozEvaluator(Evaluator):
             return score
 
     def book_rate_constrains(self, ref2goal=True, aggregate=True):
-        if ref2goal:
-            goal = self._expand(self.goal)
-        else:
-            goal = self._init_dict()
-            for domain in belief_domains:
-                if domain in self.goal and 'book' in self.goal[domain]:
-                    goal[domain]['book'] = self.goal[domain]['book']
-            for da in self.usr_da_array:
-                d, i, s, v = da.split('_', 3)
-                if i in ['inform', 'recommend', 'offerbook', 'offerbooked'] and s in mapping[d]:
-                    goal[d]['info'][mapping[d][s]] = v
+        goal = self._get_goal(ref2goal)
         score = self._book_goal_constraints(goal, self.booked_states)
         if aggregate:
             return np.mean(score) if score else None
@@ -421,13 +472,7 @@ class MultiWozEvaluator(Evaluator):
             return score
 
     def check_booking_done(self, ref2goal=True):
-        if ref2goal:
-            goal = self._expand(self.goal)
-        else:
-            goal = self._init_dict()
-            for domain in belief_domains:
-                if domain in self.goal and 'book' in self.goal[domain]:
-                    goal[domain]['book'] = self.goal[domain]['book']
+        goal = self._get_goal(ref2goal)
 
         # check for every domain where booking is required whether a booking has been made
         for domain in goal:
@@ -438,16 +483,7 @@ class MultiWozEvaluator(Evaluator):
         return True
 
     def inform_F1(self, ref2goal=True, aggregate=True):
-        if ref2goal:
-            goal = self._expand(self.goal)
-        else:
-            goal = self._init_dict()
-            for da in self.usr_da_array:
-                d, i, s, v = da.split('_', 3)
-                if i in ['inform', 'recommend', 'offerbook', 'offerbooked'] and s in mapping[d]:
-                    goal[d]['info'][mapping[d][s]] = v
-                elif i == 'request':
-                    goal[d]['reqt'].append(s)
+        goal = self._get_goal(ref2goal)
 
         TP, FP, FN, bad_inform, reqt_not_inform, inform_not_reqt = self._inform_F1_goal(
             goal, self.sys_da_array)
@@ -496,21 +532,9 @@ class MultiWozEvaluator(Evaluator):
             return None
 
         if ref2goal:
-            goal = {}
-            goal[domain] = self._expand(self.goal)[domain]
+            goal = {domain: self._get_goal(True)[domain]}
         else:
-            goal = {}
-            goal[domain] = {'info': {}, 'book': {}, 'reqt': []}
-            if 'book' in self.goal[domain]:
-                goal[domain]['book'] = self.goal[domain]['book']
-            for da in self.usr_da_array:
-                d, i, s, v = da.split('_', 3)
-                if d != domain:
-                    continue
-                if i in ['inform', 'recommend', 'offerbook', 'offerbooked'] and s in mapping[d]:
-                    goal[d]['info'][mapping[d][s]] = v
-                elif i == 'request':
-                    goal[d]['reqt'].append(s)
+            goal = self._usr_goal([domain])
 
         inform = self._inform_F1_goal(goal, self.sys_da_array, [domain])
         return inform
@@ -523,21 +547,9 @@ class MultiWozEvaluator(Evaluator):
             return None
 
         if ref2goal:
-            goal = {}
-            goal[domain] = self._expand(self.goal)[domain]
+            goal = {domain: self._get_goal(True)[domain]}
         else:
-            goal = {}
-            goal[domain] = {'info': {}, 'book': {}, 'reqt': []}
-            if 'book' in self.goal[domain]:
-                goal[domain]['book'] = self.goal[domain]['book']
-            for da in self.usr_da_array:
-                d, i, s, v = da.split('_', 3)
-                if d != domain:
-                    continue
-                if i in ['inform', 'recommend', 'offerbook', 'offerbooked'] and s in mapping[d]:
-                    goal[d]['info'][mapping[d][s]] = v
-                elif i == 'request':
-                    goal[d]['reqt'].append(s)
+            goal = self._usr_goal([domain])
 
         book_constraints = self._book_goal_constraints(
             goal, self.booked_states, [domain])
@@ -565,6 +577,20 @@ class MultiWozEvaluator(Evaluator):
         else:
             return 0
 
+    def _query_goal(self, domain, dom_goal_dict):
+        """database entities matching the info and reqt constraints of a domain goal"""
+        info_constraints = list(dom_goal_dict['info'].items()) if 'info' in dom_goal_dict else []
+        reqt_constraints = list(dom_goal_dict['reqt'].items()) if 'reqt' in dom_goal_dict else []
+        constraints = info_constraints + reqt_constraints
+        if domain == 'taxi':
+            # taxi entities are sampled, keep drawing them like before
+            return self.database.query(domain, constraints)
+        # the goal only changes when requested slots get informed, so most calls hit the cache
+        key = (domain, tuple(constraints))
+        if key not in self._query_cache:
+            self._query_cache[key] = self.database.query(domain, constraints)
+        return self._query_cache[key]
+
     def _final_goal_analyze_domain(self, domain):
 
         match = mismatch = 0
@@ -572,19 +598,7 @@ class MultiWozEvaluator(Evaluator):
             dom_goal_dict = self.goal[domain]
         else:
             return match, mismatch
-        constraints = []
-        if 'reqt' in dom_goal_dict:
-            reqt_constraints = list(dom_goal_dict['reqt'].items())
-            constraints += reqt_constraints
-        else:
-            reqt_constraints = []
-        if 'info' in dom_goal_dict:
-            info_constraints = list(dom_goal_dict['info'].items())
-            constraints += info_constraints
-        else:
-            info_constraints = []
-        query_result = self.database.query(
-            domain, info_constraints + reqt_constraints)
+        query_result = self._query_goal(domain, dom_goal_dict)
         if not query_result:
             mismatch += 1
 
@@ -605,19 +619,7 @@ class MultiWozEvaluator(Evaluator):
         """whether the final goal satisfies constraints"""
         match = mismatch = 0
         for domain, dom_goal_dict in self.goal.items():
-            constraints = []
-            if 'reqt' in dom_goal_dict:
-                reqt_constraints = list(dom_goal_dict['reqt'].items())
-                constraints += reqt_constraints
-            else:
-                reqt_constraints = []
-            if 'info' in dom_goal_dict:
-                info_constraints = list(dom_goal_dict['info'].items())
-                constraints += info_constraints
-            else:
-                info_constraints = []
-            query_result = self.database.query(
-                domain, info_constraints + reqt_constraints)
+            query_result = self._query_goal(domain, dom_goal_dict)
             if not query_result:
                 mismatch += 1
                 continue
@@ -159,6 +159,91 @@ class BiLSTM_CRF(nn.Module):
         best_path.reverse()
         return path_score, best_path
 
+    def init_hidden_batch(self, batch_size):
+        return (torch.randn(2, batch_size, self.hidden_dim // 2),
+                torch.randn(2, batch_size, self.hidden_dim // 2))
+
+    def _get_lstm_features_batch(self, sentences, lengths):
+        # sentences: [batch, time] padded word ids, lengths: [batch]
+        batch_size, max_len = sentences.size()
+        hidden = self.init_hidden_batch(batch_size)
+        hidden = (hidden[0].to(sentences.device), hidden[1].to(sentences.device))
+        embeds = self.word_embeds(sentences).transpose(0, 1)
+        packed = nn.utils.rnn.pack_padded_sequence(
+            embeds, lengths.cpu(), enforce_sorted=False)
+        lstm_out, _ = self.lstm(packed, hidden)
+        lstm_out, _ = nn.utils.rnn.pad_packed_sequence(lstm_out, total_length=max_len)
+        # [batch, time, tags]
+        return self.hidden2tag(lstm_out.transpose(0, 1))
+
+    def _forward_alg_batch(self, feats, mask):
+        # feats: [batch, time, tags], mask: [batch, time] bool
+        batch_size = feats.size(0)
+        forward_var = feats.new_full((batch_size, self.tagset_size), -10000.)
+        forward_var[:, self.tag_to_ix[START_TAG]] = 0.
+        # trans[i, j] is the score of transitioning to i from j
+        trans = self.transitions.unsqueeze(0)
+        for t in range(feats.size(1)):
+            # [batch, next_tag, prev_tag]
+            next_tag_var = forward_var.unsqueeze(1) + trans + feats[:, t].unsqueeze(2)
+            alphas_t = torch.logsumexp(next_tag_var, dim=2)
+            forward_var = torch.where(mask[:, t].unsqueeze(1), alphas_t, forward_var)
+        terminal_var = forward_var + self.transitions[self.tag_to_ix[STOP_TAG]]
+        return torch.logsumexp(terminal_var, dim=1)
+
+    def _score_sentence_batch(self, feats, tags, mask):
+        # Gives the scores of the provided padded tag sequences
+        batch_size = feats.size(0)
+        start = tags.new_full((batch_size, 1), self.tag_to_ix[START_TAG])
+        tags_ext = torch.cat([start, tags], dim=1)
+        maskf = mask.float()
+        trans_score = self.transitions[tags_ext[:, 1:], tags_ext[:, :-1]]
+        emit_score = feats.gather(2, tags.unsqueeze(2)).squeeze(2)
+        score = ((trans_score + emit_score) * maskf).sum(dim=1)
+        last_tags = tags.gather(1, (mask.long().sum(dim=1) - 1).unsqueeze(1)).squeeze(1)
+        return score + self.transitions[self.tag_to_ix[STOP_TAG], last_tags]
+
+    def _viterbi_decode_batch(self, feats, mask):
+        batch_size, max_len, _ = feats.size()
+        forward_var = feats.new_full((batch_size, self.tagset_size), -10000.)
+        forward_var[:, self.tag_to_ix[START_TAG]] = 0.
+        trans = self.transitions.unsqueeze(0)
+        identity = torch.arange(self.tagset_size, device=feats.device).expand(batch_size, -1)
+        backpointers = []
+        for t in range(max_len):
+            # [batch, next_tag, prev_tag]
+            next_tag_var = forward_var.unsqueeze(1) + trans
+            viterbivars_t, bptrs_t = next_tag_var.max(dim=2)
+            step_mask = mask[:, t].unsqueeze(1)
+            forward_var = torch.where(step_mask, viterbivars_t + feats[:, t], forward_var)
+            # padded steps point back to the same tag so backtracking passes through
+            backpointers.append(torch.where(step_mask, bptrs_t, identity))
+
+        terminal_var = forward_var + self.transitions[self.tag_to_ix[STOP_TAG]]
+        path_scores, best_tag_ids = terminal_var.max(dim=1)
+
+        best_paths = [best_tag_ids]
+        for bptrs_t in reversed(backpointers[1:]):
+            best_tag_ids = bptrs_t.gather(1, best_tag_ids.unsqueeze(1)).squeeze(1)
+            best_paths.append(best_tag_ids)
+        best_paths.reverse()
+        best_paths = torch.stack(best_paths, dim=1).tolist()
+        lengths = mask.long().sum(dim=1).tolist()
+        return path_scores, [path[:length] for path, length in zip(best_paths, lengths)]
+
+    def neg_log_likelihood_batch(self, sentences, tags, lengths):
+        mask = torch.arange(sentences.size(1), device=sentences.device).unsqueeze(0) < lengths.unsqueeze(1)
+        feats = self._get_lstm_features_batch(sentences, lengths)
+        forward_score = self._forward_alg_batch(feats, mask)
+        gold_score = self._score_sentence_batch(feats, tags, mask)
+        return (forward_score - gold_score).mean()
+
+    def decode_batch(self, sentences, lengths):
+        # Batched counterpart of forward() over padded sentences
+        mask = torch.arange(sentences.size(1), device=sentences.device).unsqueeze(0) < lengths.unsqueeze(1)
+        lstm_feats = self._get_lstm_features_batch(sentences, lengths)
+        return self._viterbi_decode_batch(lstm_feats, mask)
+
     def neg_log_likelihood(self, sentence, tags):
         feats = self._get_lstm_features(sentence)
         forward_score = self._forward_alg(feats)
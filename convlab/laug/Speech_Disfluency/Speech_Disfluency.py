@@ -2,7 +2,7 @@
 import json
 import random
 from fuzzywuzzy import fuzz
-from convlab.laug.Speech_Disfluency.inference import IP_model
+from convlab.laug.Speech_Disfluency.inference import IP_model, IP_model_batch
 import os
 
 current_path=os.path.dirname(os.path.abspath(__file__))
@@ -121,6 +121,16 @@ class Speech_Disfluency:
     def aug(self,sentence,spans):
         word_list=preprocess(sentence)
         IP_tags=IP_model(word_list)
+        return self._aug_with_tags(word_list,spans,IP_tags)
+
+    def augment_batch(self,sentences,spans_list,batch_size=64):
+        # same as aug over many utterances, tagging batch_size sentences per forward pass
+        word_lists=[preprocess(sentence) for sentence in sentences]
+        IP_tags_list=IP_model_batch(word_lists,batch_size=batch_size)
+        return [self._aug_with_tags(word_list,spans,IP_tags)
+                for word_list,spans,IP_tags in zip(word_lists,spans_list,IP_tags_list)]
+
+    def _aug_with_tags(self,word_list,spans,IP_tags):
         IP_tags=self.protect_slots(word_list,spans,IP_tags)
         word_list=self.add_repairs(word_list,spans)
         word_list=self.add_repeats(word_list,IP_tags)
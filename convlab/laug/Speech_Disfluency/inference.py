@@ -18,38 +18,85 @@ def prepare_sequence(seq, to_ix):
 			idxs.append(0)
 	return torch.tensor(idxs, dtype=torch.long)
 
+def prepare_batch(seqs, to_ix):
+	# pad a list of word lists into [batch, time] ids and their lengths
+	lengths=torch.tensor([len(seq) for seq in seqs], dtype=torch.long)
+	batch=torch.zeros(len(seqs), int(lengths.max()), dtype=torch.long)
+	for i,seq in enumerate(seqs):
+		batch[i,:len(seq)]=prepare_sequence(seq, to_ix)
+	return batch, lengths
+
 # Put your dir to glove here
 glove_file='[dir_to]/glove.6B.100d.txt'
 
-word_to_ix={}
 max=20000
-ifs=open(glove_file, 'r')
-word_to_ix['<unk>'] = 0
-weights=[]
-weights.append(torch.from_numpy(np.array([0.]*100)))
-for i,line in enumerate(ifs.readlines()):
-	if i>=max:
-		break
-	line_list = line.split()
-	word = line_list[0]
-	embed = line_list[1:]
-	embed = torch.from_numpy(np.array([float(num) for num in embed]))
-	word_to_ix[word] = i+1
-	weights.append(embed)
-
-weights = torch.stack(weights, 0).float()
+
+def load_glove(glove_file, max_words=max):
+	"""Load the first max_words GloVe vectors as (word_to_ix, weights).
+
+	The parsed vocab and embedding matrix are cached next to the text file
+	as a binary .npz, so only the first call has to parse the text format.
+	"""
+	cache_file=glove_file+'.%d.npz' % max_words
+	if os.path.exists(cache_file):
+		cache=np.load(cache_file)
+		words=cache['words'].tolist()
+		weights=torch.from_numpy(cache['weights'])
+	else:
+		words=['<unk>']
+		vectors=[np.zeros(EMBEDDING_DIM, dtype=np.float32)]
+		with open(glove_file, 'r') as ifs:
+			for i,line in enumerate(ifs):
+				if i>=max_words:
+					break
+				line_list = line.split()
+				words.append(line_list[0])
+				vectors.append(np.asarray(line_list[1:], dtype=np.float32))
+		weights=np.stack(vectors, 0)
+		try:
+			np.savez(cache_file, words=np.array(words), weights=weights)
+		except OSError:
+			pass
+		weights=torch.from_numpy(weights)
+	word_to_ix={word:i for i,word in enumerate(words)}
+	return word_to_ix, weights.float()
 
 tag_to_ix = {"O": 0, "F": 1, "R": 2, START_TAG: 3, STOP_TAG: 4}
 
-model = BiLSTM_CRF(len(word_to_ix), tag_to_ix, EMBEDDING_DIM, HIDDEN_DIM,weights)
-model_path=os.path.dirname(os.path.abspath(__file__))
-model.load_state_dict(torch.load(os.path.join(model_path,'model/LSTMCRF.bin')))
+word_to_ix=None
+model=None
+
+def load_model():
+	# the embeddings and weights are only loaded on first use
+	global word_to_ix, model
+	if model is None:
+		word_to_ix, weights = load_glove(glove_file)
+		model = BiLSTM_CRF(len(word_to_ix), tag_to_ix, EMBEDDING_DIM, HIDDEN_DIM,weights)
+		model_path=os.path.dirname(os.path.abspath(__file__))
+		model.load_state_dict(torch.load(os.path.join(model_path,'model/LSTMCRF.bin')))
+		model.eval()
+	return model
 
 def IP_model(word_list):
+	load_model()
 	with torch.no_grad():
 		precheck_sent = prepare_sequence(word_list, word_to_ix)
-	return model(precheck_sent)[1]
+		return model(precheck_sent)[1]
+
+def IP_model_batch(word_lists, batch_size=64):
+	# tag interruption points for many sentences, one forward pass per batch
+	load_model()
+	tags=[[] for _ in word_lists]
+	nonempty=[i for i,word_list in enumerate(word_lists) if len(word_list)>0]
+	with torch.no_grad():
+		for i in range(0, len(nonempty), batch_size):
+			chunk=nonempty[i:i+batch_size]
+			sentences, lengths = prepare_batch([word_lists[j] for j in chunk], word_to_ix)
+			for j,tag_seq in zip(chunk, model.decode_batch(sentences, lengths)[1]):
+				tags[j]=tag_seq
+	return tags
 
 if __name__=="__main__":
 	sent="okay , i like to do weight training and cycling ."
 	print(IP_model(sent.split()))
+	print(IP_model_batch([sent.split(), 'i want to go to cambridge .'.split()]))
@@ -1,6 +1,8 @@
+import random
+
 import tqdm
 
-from .task_oriented_eda import eda
+from .task_oriented_eda import eda, precompute_synonyms
 from .types import MultiwozSampleType, SentenceType, MultiwozDatasetType
 from .util import AugmentationRecorder, iter_dialogues, Helper, choice, is_span_info_consistent_with_text, p_str
 from .tokenize_util import tokenize, convert_tokens_to_string, convert_sentence_to_tokens
@@ -91,7 +93,24 @@ class MultiwozEDA:
 
     __call__ = augment_sample
 
-    def augment_multiwoz_dataset(self, mode='usr', progress_bar=True):
+    def augment_sample_with_seed(self, sample_id, sample: MultiwozSampleType, mode='usr', seed=None) -> MultiwozSampleType:
+        """augment a sample; with a seed, the result only depends on (seed, sample_id), not on the order of samples."""
+        if seed is not None:
+            random.seed(f'{seed}-{sample_id}')
+        return self.augment_sample(sample, mode=mode)
+
+    def get_vocabulary(self, mode='usr'):
+        """words of the turns that may be augmented."""
+        vocab = set()
+        for sample in self.multiwoz.values():
+            for _, turn in iter_dialogues(sample, mode=mode):
+                vocab.update(tokenize(turn['text']))
+        return vocab
+
+    def precompute_synonyms(self, mode='usr'):
+        return precompute_synonyms(sorted(self.get_vocabulary(mode=mode)))
+
+    def augment_multiwoz_dataset(self, mode='usr', progress_bar=True, seed=None):
         assert mode in ('usr', 'user', 'sys', 'all')
         res = {}
         if progress_bar:
@@ -99,5 +118,5 @@ class MultiwozEDA:
         else:
             items = self.multiwoz.items()
         for sample_id, sample in items:
-            res[sample_id] = self.augment_sample(sample, mode=mode)
+            res[sample_id] = self.augment_sample_with_seed(sample_id, sample, mode=mode, seed=seed)
         return res
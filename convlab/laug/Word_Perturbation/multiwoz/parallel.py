@@ -0,0 +1,93 @@
+import json
+import multiprocessing
+import os
+from typing import Iterator, Tuple
+
+import tqdm
+
+from . import task_oriented_eda
+from .multiwoz_eda import MultiwozEDA
+from .types import MultiwozDatasetType, MultiwozSampleType
+
+_worker_eda = None
+
+
+def _init_worker(eda: MultiwozEDA, synonym_table: dict):
+    global _worker_eda
+    _worker_eda = eda
+    # with the fork start method this is already inherited, with spawn it has to be copied
+    task_oriented_eda.synonym_table.update(synonym_table)
+
+
+def _augment_shard(args):
+    shard, mode, seed = args
+    return [(sample_id, _worker_eda.augment_sample_with_seed(sample_id, sample, mode=mode, seed=seed))
+            for sample_id, sample in shard]
+
+
+def _iter_shards(multiwoz: MultiwozDatasetType, shard_size):
+    shard = []
+    for item in multiwoz.items():
+        shard.append(item)
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def iter_augmented_dataset(eda: MultiwozEDA, mode='usr', seed=0, num_workers=None, shard_size=64,
+                           precompute_synonyms=True) -> Iterator[Tuple[str, MultiwozSampleType]]:
+    """
+    augment the dataset of `eda` in worker processes, yielding (sample_id, augmented_sample) in dataset order.
+
+    Every sample is augmented with a random state seeded by (seed, sample_id), so the output is identical to
+    `eda.augment_multiwoz_dataset(mode, seed=seed)` regardless of num_workers and shard_size.
+
+    Args:
+        eda: the augmenter, its dataset is the one to augment
+        mode: 'usr', 'sys' or 'all'
+        seed: seed of the per-sample random state
+        num_workers: num of processes, defaults to the cpu count. 1 runs in this process.
+        shard_size: num of samples sent to a worker at a time
+        precompute_synonyms: build the synonym table over the corpus vocabulary before starting the workers
+    """
+    assert mode in ('usr', 'user', 'sys', 'all')
+    if precompute_synonyms:
+        eda.precompute_synonyms(mode=mode)
+    num_workers = num_workers or os.cpu_count() or 1
+    shards = ((shard, mode, seed) for shard in _iter_shards(eda.multiwoz, shard_size))
+
+    if num_workers == 1:
+        _init_worker(eda, {})
+        for args in shards:
+            yield from _augment_shard(args)
+        return
+
+    with multiprocessing.Pool(num_workers, initializer=_init_worker,
+                              initargs=(eda, task_oriented_eda.synonym_table)) as pool:
+        for results in pool.imap(_augment_shard, shards):
+            yield from results
+
+
+def augment_dataset_to_jsonl(eda: MultiwozEDA, output_filepath, mode='usr', seed=0, num_workers=None,
+                             shard_size=64, progress_bar=True):
+    """stream the augmented dataset to a JSONL file, one {"id": ..., "sample": ...} object per line."""
+    os.makedirs(os.path.dirname(os.path.abspath(output_filepath)), exist_ok=True)
+    items = iter_augmented_dataset(eda, mode=mode, seed=seed, num_workers=num_workers, shard_size=shard_size)
+    if progress_bar:
+        items = tqdm.tqdm(items, total=len(eda.multiwoz))
+    with open(output_filepath, 'w', encoding='utf-8') as out:
+        for sample_id, sample in items:
+            out.write(json.dumps({'id': sample_id, 'sample': sample}) + '\n')
+
+
+def load_jsonl_dataset(filepath) -> MultiwozDatasetType:
+    """read a file written by `augment_dataset_to_jsonl` back into a dataset dict."""
+    dataset = {}
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                dataset[item['id']] = item['sample']
+    return dataset
@@ -2,11 +2,12 @@ import os, json
 from convlab.laug.Word_Perturbation.multiwoz.multiwoz_eda import MultiwozEDA
 from convlab.laug.Word_Perturbation.multiwoz.db.slot_value_replace import MultiSourceDBLoader, MultiSourceDBLoaderArgs
 from convlab.laug.Word_Perturbation.multiwoz.util import load_json
+from convlab.laug.Word_Perturbation.multiwoz.parallel import augment_dataset_to_jsonl
 from convlab import DATA_ROOT
 
 
 def main(multiwoz_filepath, output_filepath, alpha_sr=0.1, alpha_ri=0.1, alpha_rs=0.1, p_rd=0.1, num_aug=2,
-         p_slot_value_replacement=0.25):
+         p_slot_value_replacement=0.25, seed=0, num_workers=1):
     multiwoz = load_json(multiwoz_filepath)
 
     db_dir = os.path.join(DATA_ROOT, 'multiwoz', 'db')
@@ -34,7 +35,11 @@ def main(multiwoz_filepath, output_filepath, alpha_sr=0.1, alpha_ri=0.1, alpha_r
     eda = MultiwozEDA(multiwoz, db_loader,
                       slot_value_replacement_probability=p_slot_value_replacement,
                       alpha_sr=alpha_sr, alpha_ri=alpha_ri, alpha_rs=alpha_rs, p_rd=p_rd, num_aug=num_aug)
-    result = eda.augment_multiwoz_dataset('usr')
+    # both outputs seed every dialog by (seed, dialog id), so .json and .jsonl runs give the same dialogs
+    if output_filepath.endswith('.jsonl'):
+        augment_dataset_to_jsonl(eda, output_filepath, 'usr', seed=seed, num_workers=num_workers)
+        return
+    result = eda.augment_multiwoz_dataset('usr', seed=seed)
 
     os.makedirs(os.path.dirname(os.path.abspath(output_filepath)), exist_ok=True)
     with open(output_filepath, 'w', encoding='utf-8') as out:
@@ -51,5 +56,7 @@ if __name__ == '__main__':
     parser.add_argument('--p_rd', type=float, default=0.1, help="probability of deletion")
     parser.add_argument('--num_aug', type=int, default=2, help="generate `num_aug` candidates with EDA and randomly choose one dialog as augmented dialog.")
     parser.add_argument('--p_slot_value_replacement', '-p_svr', type=float, default=0.25, help='probability to replace a slot value.')
+    parser.add_argument('--seed', type=int, default=0, help='seed each dialog by (seed, dialog id), so that output is reproducible.')
+    parser.add_argument('--num_workers', type=int, default=1, help='num of worker processes, used when output is a .jsonl file.')
     opts = parser.parse_args()
     main(**vars(opts))
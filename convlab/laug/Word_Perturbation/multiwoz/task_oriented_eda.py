@@ -130,8 +130,11 @@ def replacement(words, index: int):
         return None
 
 
-@lru_cache(maxsize=1000)
-def get_synonyms(word):
+# word --> synonyms, filled by `precompute_synonyms` and consulted before wordnet
+synonym_table = {}
+
+
+def _lookup_synonyms(word):
     synonyms = set()
     for syn in wordnet.synsets(word):
         for l in syn.lemmas():
@@ -141,7 +144,31 @@ def get_synonyms(word):
                 synonyms.add(synonym)
     if word in synonyms:
         synonyms.remove(word)
-    return list(synonyms)
+    # sorted, so that random choices don't depend on the hash seed of the process
+    return sorted(synonyms)
+
+
+@lru_cache(maxsize=1000)
+def get_synonyms(word):
+    if word in synonym_table:
+        return synonym_table[word]
+    return _lookup_synonyms(word)
+
+
+def precompute_synonyms(words):
+    """
+    fill `synonym_table` for a vocabulary, so that augmentation doesn't query wordnet for known words.
+
+    Args:
+        words: an iterable of words, e.g. the vocabulary of a corpus
+
+    Returns:
+        synonym_table (Dict[str, List[str]])
+    """
+    for word in words:
+        if word not in synonym_table:
+            synonym_table[word] = _lookup_synonyms(word)
+    return synonym_table
 
 
 ########################################################################
@@ -1 +1,6 @@
-from convlab.nlg.sclstm.crosswoz.sc_lstm import SCLSTM
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'SCLSTM': 'convlab.nlg.sclstm.crosswoz.sc_lstm',
+})
+__all__ = ['SCLSTM']
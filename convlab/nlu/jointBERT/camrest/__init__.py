@@ -1 +1,6 @@
-from convlab.nlu.jointBERT.camrest.nlu import BERTNLU
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'BERTNLU': 'convlab.nlu.jointBERT.camrest.nlu',
+})
+__all__ = ['BERTNLU']
@@ -1 +1,6 @@
-from convlab.nlu.jointBERT.crosswoz.nlu import BERTNLU
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'BERTNLU': 'convlab.nlu.jointBERT.crosswoz.nlu',
+})
+__all__ = ['BERTNLU']
@@ -1 +1,6 @@
-from convlab.nlu.milu.multiwoz.nlu import MILU
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'MILU': 'convlab.nlu.milu.multiwoz.nlu',
+})
+__all__ = ['MILU']
@@ -1 +1,6 @@
-from convlab.nlu.milu.unified_datasets.nlu import MILU
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'MILU': 'convlab.nlu.milu.unified_datasets.nlu',
+})
+__all__ = ['MILU']
@@ -1 +1,6 @@
-from convlab.nlu.svm.multiwoz.nlu import SVMNLU
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'SVMNLU': 'convlab.nlu.svm.multiwoz.nlu',
+})
+__all__ = ['SVMNLU']
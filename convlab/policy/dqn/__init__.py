@@ -1 +1,6 @@
-from convlab.policy.dqn.dqn import DQN
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'DQN': 'convlab.policy.dqn.dqn',
+})
+__all__ = ['DQN']
@@ -8,7 +8,7 @@ import os
 import json
 import copy
 from convlab.policy.policy import Policy
-from convlab.policy.rlmodule import EpsilonGreedyPolicy, MemoryReplay
+from convlab.policy.rlmodule import EpsilonGreedyPolicy, TensorMemoryReplay
 from convlab.util.train_util import init_logging_handler
 from convlab.policy.vector.vector_binary import VectorBinary
 from convlab.policy.rule.multiwoz.rule_based_multiwoz_bot import RuleBasedMultiwozBot
@@ -44,8 +44,13 @@ class DQN(Policy):
         if dataset == 'Multiwoz':
             self.vector = VectorBinary()
 
-        #replay memory
-        self.memory = MemoryReplay(cfg['memory_size'])
+        #replay memory, kept on the training device
+        self.reset_memory = cfg.get('reset_memory', False)
+        self.memory = TensorMemoryReplay(cfg['memory_size'], device=DEVICE,
+                                         prioritized=cfg.get('prioritized_replay', False),
+                                         alpha=cfg.get('per_alpha', 0.6), beta=cfg.get('per_beta', 0.4),
+                                         beta_increment=cfg.get('per_beta_increment', 0.),
+                                         keep_warm_start=cfg.get('keep_warm_start', False))
 
         self.net = EpsilonGreedyPolicy(self.vector.state_dim, cfg['hv_dim'], self.vector.da_dim, cfg['epsilon_spec']).to(device=DEVICE)
         self.target_net = copy.deepcopy(self.net)
@@ -58,9 +63,15 @@ class DQN(Policy):
 
         self.loss_fn = nn.MSELoss()
 
-    def update_memory(self, sample):
-        self.memory.reset()
-        self.memory.append(sample)
+    def update_memory(self, sample, warm_up=False):
+        """
+        Add the transitions of `sample` (a Memory) to the replay memory, which drops the oldest ones when it is full.
+        Args:
+            warm_up (bool): the transitions come from the rule-based warm up
+        """
+        if self.reset_memory:
+            self.memory.reset(keep_warm_start=True)
+        self.memory.append(sample, warm_start=warm_up)
         
     def predict(self, state, warm_up=False):
         """
@@ -97,15 +108,15 @@ class DQN(Policy):
         """
         Restore after one session
         """
-        self.memory.reset()
+        pass
     
-    def calc_q_loss(self, batch):
-        '''Compute the Q value loss using predicted and target Q values from the appropriate networks'''
-        s = torch.from_numpy(np.stack(batch.state)).to(device=DEVICE)
-        a = torch.from_numpy(np.stack(batch.action)).to(device=DEVICE)
-        r = torch.from_numpy(np.stack(batch.reward)).to(device=DEVICE)
-        next_s = torch.from_numpy(np.stack(batch.next_state)).to(device=DEVICE)
-        mask = torch.Tensor(np.stack(batch.mask)).to(device=DEVICE)
+    def calc_q_preds(self, batch):
+        '''Predicted Q values of the actions of a batch (of tensors from the replay memory) and their targets'''
+        s = torch.as_tensor(batch.state, device=DEVICE)
+        a = torch.as_tensor(batch.action, device=DEVICE)
+        r = torch.as_tensor(batch.reward, device=DEVICE)
+        next_s = torch.as_tensor(batch.next_state, device=DEVICE)
+        mask = torch.as_tensor(batch.mask, device=DEVICE)
 
         q_preds = self.net(s)
         with torch.no_grad():
@@ -117,8 +128,12 @@ class DQN(Policy):
         online_actions = online_next_q_preds.argmax(dim=-1, keepdim=True)
         max_next_q_preds = next_q_preds.gather(-1, online_actions).squeeze(-1)
         max_q_targets = r + self.gamma * mask * max_next_q_preds
-        
-        
+
+        return act_q_preds, max_q_targets
+
+    def calc_q_loss(self, batch):
+        '''Compute the Q value loss using predicted and target Q values from the appropriate networks'''
+        act_q_preds, max_q_targets = self.calc_q_preds(batch)
         q_loss = self.loss_fn(act_q_preds, max_q_targets)
 
         return q_loss
@@ -128,11 +143,17 @@ class DQN(Policy):
         for i in range(self.training_iter):
             round_loss = 0.
             # 1. batch a sample from memory
-            batch = self.memory.get_batch(batch_size=self.batch_size)
-            
+            batch, slots, weights = self.memory.sample(batch_size=self.batch_size)
+
             for _ in range(self.training_batch_iter):
                 # 2. calculate the Q loss
-                loss = self.calc_q_loss(batch)
+                if self.memory.prioritized:
+                    # squared TD errors weighted by importance sampling, which also give the new priorities
+                    act_q_preds, max_q_targets = self.calc_q_preds(batch)
+                    loss = (weights * (act_q_preds - max_q_targets).pow(2)).mean()
+                    self.memory.update_priorities(slots, max_q_targets - act_q_preds)
+                else:
+                    loss = self.calc_q_loss(batch)
 
                 # 3. make a optimization step
                 self.net_optim.zero_grad()
@@ -1 +1,6 @@
-from convlab.policy.dqn.multiwoz.dqn_policy import DQNPolicy
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'DQNPolicy': 'convlab.policy.dqn.multiwoz.dqn_policy',
+})
+__all__ = ['DQNPolicy']
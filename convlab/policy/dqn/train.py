@@ -215,7 +215,7 @@ def update(env, policy, batchsz, epoch, process_num):
 def warm_start(env, policy, batchsz, epoch, process_num):
     # sample data asynchronously
     buff = sample(env, policy, batchsz, process_num, warm_up=True)
-    policy.update_memory(buff)
+    policy.update_memory(buff, warm_up=True)
     policy.update(epoch)
 
 
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+Evaluation engine shared by policy/evaluate.py, custom_util.evaluate / eval_policy and evaluate_distributed.
+
+An evaluation is a fixed list of goals, dialogue i is run on goals[i] with its own seed. The dialogues are run by
+a backend:
+    InProcessBackend  runs the dialogues one after another on the given session
+    PoolBackend       keeps worker processes with a copy of the session alive between runs and sends them the
+                      current weights of the system policy before every run
+    BatchedBackend    steps copies of the session in lockstep, so the system policy is asked for the actions of a
+                      batch of states at once
+As every dialogue is seeded on its own, all backends give the same results for the same goals and seeds, which
+convlab/policy/test_eval_engine.py checks against the dialogue loop used before the engine.
+
+    engine = EvaluationEngine(PoolBackend(sess, num_workers=4))
+    results = engine.run(goals, jsonl_path='eval.jsonl')
+    summary = summarize(results)
+"""
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from convlab.util.custom_util import set_seed
+
+MAX_TURNS = 40
+START_SEED = 1000
+# system intents counted per dialogue, intent -> key prefix
+ACT_INTENTS = {'book': 'book', 'inform': 'inform', 'request': 'request', 'select': 'select', 'offerbook': 'offer',
+               'recommend': 'recommend'}
+
+
+def run_dialogue(sess, goal, seed, sys_semantic_to_usr=False, max_turns=MAX_TURNS, verbose=False,
+                 complete_from_user_goal=False):
+    """
+    Run one dialogue of `sess` on `goal`, with random, numpy and torch seeded by `seed`.
+    Args:
+        complete_from_user_goal (bool): the dialogue is complete if the goal of the agenda user simulator is, instead
+            of the goal of the evaluator (e.g. for goals from the dataset)
+    Returns:
+        result (dict): success / complete flags, returns, number of turns and the system actions of the dialogue.
+            `total_return` is 80 (strict success) or -40 minus the turns, `evaluator_return` the sum of the rewards
+            of the evaluator.
+    """
+    set_seed(seed)
+    # the goal is updated during the dialogue, keep the one of the goal list intact
+    sess.init_session(goal=deepcopy(goal))
+    semantic = sys_semantic_to_usr or sess.sys_agent.nlg is None or getattr(sess.sys_agent, 'return_semantic_acts',
+                                                                             False)
+    sys_response = [] if semantic else ''
+    if verbose:
+        logging.info("NEW EPISODE!!!!" + "-" * 80)
+        logging.info(f"\n Seed: {seed}")
+        logging.info(f"GOAL: {sess.evaluator.goal}")
+        logging.info("\n")
+
+    acts_num = dict.fromkeys(ACT_INTENTS.values(), 0)
+    num_actions = 0
+    turns = 0
+    evaluator_return = 0.
+    complete, success, success_strict = 0, 0, 0
+    for _ in range(max_turns):
+        sys_response, user_response, session_over, reward = sess.next_turn(sys_response)
+        if verbose:
+            logging.info(f"USER RESPONSE: {user_response}")
+            logging.info(f"SYS RESPONSE: {sys_response}")
+
+        acts = sess.sys_agent.dst.state['system_action'] if sess.sys_agent.dst is not None else sys_response
+        for intent, _, _, _ in acts:
+            if intent.lower() in ACT_INTENTS:
+                acts_num[ACT_INTENTS[intent.lower()]] += 1
+        num_actions += len(acts)
+        turns += 1
+        evaluator_return += sess.evaluator.get_reward(session_over)
+
+        if session_over is True:
+            sess.evaluator.task_success()
+            if complete_from_user_goal:
+                complete = sess.user_agent.policy.policy.goal.task_complete()
+            else:
+                complete = sess.evaluator.complete
+            success = sess.evaluator.success
+            success_strict = sess.evaluator.success_strict
+            break
+
+    result = {
+        'seed': seed,
+        'complete': complete,
+        'success': success,
+        'success_strict': success_strict,
+        'total_return': (80 if success_strict else -40) - turns,
+        'evaluator_return': evaluator_return,
+        'turns': turns,
+        'avg_actions': num_actions / turns,
+        'domains': list(sess.evaluator.goal)
+    }
+    for key, num in acts_num.items():
+        result[f'{key}_acts'] = num
+    if verbose:
+        logging.info(f"Complete: {complete}")
+        logging.info(f"Success: {success}")
+        logging.info(f"Success strict: {success_strict}")
+        logging.info(f"Return: {result['total_return']}")
+        logging.info(f"Average actions: {result['avg_actions']}")
+    return result
+
+
+class InProcessBackend:
+    def __init__(self, sess, sys_semantic_to_usr=False, verbose=False, collect_saves=False,
+                 complete_from_user_goal=False):
+        """
+        :param collect_saves: keep the info saved by the system agent (`agent_saves`) in the results
+        """
+        self.sess = sess
+        self.run_kwargs = {'sys_semantic_to_usr': sys_semantic_to_usr, 'verbose': verbose,
+                           'complete_from_user_goal': complete_from_user_goal}
+        self.collect_saves = collect_saves
+
+    def run(self, jobs):
+        """yield the result of every (index, seed, goal) job"""
+        for index, seed, goal in jobs:
+            result = run_dialogue(self.sess, goal, seed, **self.run_kwargs)
+            result['index'] = index
+            if self.collect_saves:
+                result['agent_saves'] = list(self.sess.sys_agent.agent_saves)
+            self.sess.sys_agent.agent_saves.clear()
+            yield result
+
+    def close(self):
+        pass
+
+
+def policy_state(policy):
+    """the weights of the torch modules of a policy and its training flag"""
+    import torch
+    modules = {name: module.state_dict() for name, module in vars(policy).items()
+               if isinstance(module, torch.nn.Module)}
+    return {'modules': modules, 'is_train': getattr(policy, 'is_train', None)}
+
+
+def load_policy_state(policy, state):
+    for name, module_state in state['modules'].items():
+        getattr(policy, name).load_state_dict(module_state)
+    if state['is_train'] is not None:
+        policy.is_train = state['is_train']
+
+
+_worker_sess = None
+_worker_run_kwargs = None
+_worker_version = None
+
+
+def _init_pool_worker(sess, run_kwargs):
+    global _worker_sess, _worker_run_kwargs
+    _worker_sess = sess
+    _worker_run_kwargs = run_kwargs
+
+
+def _run_chunk(args):
+    global _worker_version
+    jobs, state_path, version = args
+    if version != _worker_version:
+        import torch
+        load_policy_state(_worker_sess.sys_agent.policy, torch.load(state_path))
+        _worker_version = version
+    results = []
+    for index, seed, goal in jobs:
+        result = run_dialogue(_worker_sess, goal, seed, **_worker_run_kwargs)
+        result['index'] = index
+        _worker_sess.sys_agent.agent_saves.clear()
+        results.append(result)
+    return results
+
+
+class PoolBackend:
+    def __init__(self, sess, num_workers=4, chunk_size=None, sys_semantic_to_usr=False, complete_from_user_goal=False):
+        """
+        The worker processes are started on the first run and kept until `close`, every worker works on its own
+        copy of `sess`. Before each run the weights of the system policy are written to a temporary file, which
+        the workers load once per run.
+        :param chunk_size: num of dialogues sent to a worker at a time, by default a run is split into 4 chunks
+                           per worker
+        """
+        self.sess = sess
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.run_kwargs = {'sys_semantic_to_usr': sys_semantic_to_usr,
+                           'complete_from_user_goal': complete_from_user_goal}
+        self.pool = None
+        self.version = 0
+        self.state_dir = None
+
+    def _start(self):
+        from torch import multiprocessing as mp
+        self.state_dir = tempfile.mkdtemp(prefix='convlab_eval_')
+        self.pool = mp.Pool(self.num_workers, initializer=_init_pool_worker, initargs=(self.sess, self.run_kwargs))
+
+    def run(self, jobs):
+        import torch
+        if self.pool is None:
+            self._start()
+        self.version += 1
+        state_path = os.path.join(self.state_dir, 'policy.pt')
+        torch.save(policy_state(self.sess.sys_agent.policy), state_path)
+
+        jobs = list(jobs)
+        chunk_size = self.chunk_size or max(1, int(np.ceil(len(jobs) / (4 * self.num_workers))))
+        chunks = [(jobs[i:i + chunk_size], state_path, self.version) for i in range(0, len(jobs), chunk_size)]
+        for results in self.pool.imap_unordered(_run_chunk, chunks):
+            yield from results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+
+def _get_rng_state():
+    import torch
+    return random.getstate(), np.random.get_state(), torch.get_rng_state()
+
+
+def _set_rng_state(rng_state):
+    import torch
+    random.setstate(rng_state[0])
+    np.random.set_state(rng_state[1])
+    torch.set_rng_state(rng_state[2])
+
+
+class _DeferredPolicy:
+    """stands in for the system policy of a lockstep session, `predict` waits for the batched action"""
+
+    def __init__(self, env):
+        self._env = env
+
+    def predict(self, state):
+        return self._env.wait_action(state)
+
+    def __getattr__(self, name):
+        return getattr(self._env.policy, name)
+
+
+class _LockstepEnv:
+    """
+    Runs the dialogues of one session copy in a thread. Control is handed back and forth, so only one thread runs
+    at a time and every env keeps its own random states in between.
+    """
+
+    def __init__(self, sess, run_kwargs):
+        self.policy = sess.sys_agent.policy
+        # the copy shares the system policy, every other module is copied
+        self.sess = deepcopy(sess, {id(self.policy): _DeferredPolicy(self)})
+        self.run_kwargs = run_kwargs
+        self._go = threading.Semaphore(0)
+        self._paused = threading.Semaphore(0)
+        self.rng_state = None
+        self.state = None
+        self.action = None
+        self.result = None
+        self.error = None
+        self.busy = False
+
+    def start(self, job):
+        self.busy = True
+        self.result, self.error, self.rng_state = None, None, None
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        self.step()
+
+    def _run(self, job):
+        self._go.acquire()
+        index, seed, goal = job
+        try:
+            self.result = run_dialogue(self.sess, goal, seed, **self.run_kwargs)
+            self.result['index'] = index
+            self.sess.sys_agent.agent_saves.clear()
+        except BaseException as e:
+            self.error = e
+        self.state = None
+        self._paused.release()
+
+    def step(self):
+        """let the dialogue run until it needs the next system action or ends"""
+        if self.rng_state is not None:
+            _set_rng_state(self.rng_state)
+        self._go.release()
+        self._paused.acquire()
+        self.rng_state = _get_rng_state()
+
+    def wait_action(self, state):
+        # called in the dialogue thread
+        self.state = state
+        self._paused.release()
+        self._go.acquire()
+        return self.action
+
+    def waiting(self):
+        return self.busy and self.state is not None
+
+
+class BatchedBackend:
+    def __init__(self, sess, batch_size=8, sys_semantic_to_usr=False, complete_from_user_goal=False):
+        """
+        Run `batch_size` dialogues at once on copies of `sess` that share the system policy. Once every running
+        dialogue waits for a system action, the policy predicts the whole batch, with `predict_batch(states)` if
+        it has one, otherwise state by state, sharing DB lookups of the vectoriser within the batch.
+        The shared policy is not reset per dialogue, so this is meant for stateless (e.g. neural) policies.
+        """
+        run_kwargs = {'sys_semantic_to_usr': sys_semantic_to_usr, 'complete_from_user_goal': complete_from_user_goal}
+        self.policy = sess.sys_agent.policy
+        self.envs = [_LockstepEnv(sess, run_kwargs) for _ in range(batch_size)]
+
+    def _predict(self, envs):
+        states = [env.state for env in envs]
+        if hasattr(self.policy, 'predict_batch'):
+            return self.policy.predict_batch(states)
+        actions = []
+        for env, state in zip(envs, states):
+            _set_rng_state(env.rng_state)
+            actions.append(deepcopy(self.policy.predict(state)))
+            env.rng_state = _get_rng_state()
+        return actions
+
+    def run(self, jobs):
+        jobs = iter(jobs)
+        while True:
+            for env in self.envs:
+                # start new dialogues and collect the ones that ended
+                while not env.busy or not env.waiting():
+                    if env.busy:
+                        env.busy = False
+                        if env.error is not None:
+                            raise env.error
+                        yield env.result
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    env.start(job)
+            waiting = [env for env in self.envs if env.waiting()]
+            if not waiting:
+                return
+            vector = getattr(self.policy, 'vector', None)
+            if vector is not None and hasattr(vector, 'shared_db_counts'):
+                with vector.shared_db_counts():
+                    actions = self._predict(waiting)
+            else:
+                actions = self._predict(waiting)
+            for env, action in zip(waiting, actions):
+                env.action = action
+                env.step()
+
+    def close(self):
+        pass
+
+
+def build_backend(sess, backend='inprocess', num_workers=4, batch_size=8, sys_semantic_to_usr=False, **kwargs):
+    """
+    :param backend: 'inprocess', 'pool' or 'batched'
+    """
+    if backend == 'inprocess':
+        return InProcessBackend(sess, sys_semantic_to_usr=sys_semantic_to_usr, **kwargs)
+    if backend == 'pool':
+        return PoolBackend(sess, num_workers=num_workers, sys_semantic_to_usr=sys_semantic_to_usr, **kwargs)
+    if backend == 'batched':
+        return BatchedBackend(sess, batch_size=batch_size, sys_semantic_to_usr=sys_semantic_to_usr, **kwargs)
+    raise ValueError(f"Unknown evaluation backend {backend}")
+
+
+class EvaluationEngine:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {}
+
+    def run(self, goals, seeds=None, jsonl_path=None):
+        """
+        Run one dialogue per goal and return the results ordered like `goals`.
+        Args:
+            goals (list): user goals
+            seeds (list): seed of each dialogue, by default 1000, 1001, ...
+            jsonl_path (str): stream the result of every finished dialogue to this file
+        """
+        if seeds is None:
+            seeds = list(range(START_SEED, START_SEED + len(goals)))
+        jobs = [(index, seed, goal) for index, (seed, goal) in enumerate(zip(seeds, goals))]
+
+        fout = open(jsonl_path, 'w') if jsonl_path else None
+        results = []
+        start = time.time()
+        try:
+            for result in self.backend.run(jobs):
+                results.append(result)
+                if fout is not None:
+                    fout.write(json.dumps({k: v for k, v in result.items() if k != 'agent_saves'}) + '\n')
+                    fout.flush()
+        finally:
+            if fout is not None:
+                fout.close()
+        seconds = time.time() - start
+        turns = sum(result['turns'] for result in results)
+
+        self.stats = {'dialogues': len(results), 'turns': turns, 'seconds': seconds,
+                      'dialogues_per_s': len(results) / max(seconds, 1e-9),
+                      'turns_per_s': turns / max(seconds, 1e-9)}
+        logging.info(f"Evaluated {len(results)} dialogues in {seconds:.1f}s, "
+                     f"{self.stats['dialogues_per_s']:.2f} dialogues/s, {self.stats['turns_per_s']:.2f} turns/s")
+        return sorted(results, key=lambda result: result['index'])
+
+    def close(self):
+        self.backend.close()
+
+
+def summarize(results):
+    """
+    Aggregate dialogue results like eval_policy reports them.
+    Returns:
+        summary (dict): mean rates, returns and turns, the share of each act type among the counted system acts
+        task_success (dict): domain -> list of strict success of the dialogues with that domain
+    """
+    summary = {
+        'complete_rate': np.average([result['complete'] for result in results]),
+        'success_rate': np.average([result['success'] for result in results]),
+        'success_rate_strict': np.average([result['success_strict'] for result in results]),
+        'avg_return': np.average([result['total_return'] for result in results]),
+        'turns': np.average([result['turns'] for result in results]),
+        'avg_actions': np.average([result['avg_actions'] for result in results])
+    }
+    acts = {key: np.average([result[f'{key}_acts'] for result in results]) for key in ACT_INTENTS.values()}
+    total_acts = sum(acts.values())
+    for key, num in acts.items():
+        summary[f'{key}_acts'] = num / total_acts if total_acts else 0
+
+    task_success = {}
+    for result in results:
+        for domain in result['domains']:
+            task_success.setdefault(domain, []).append(result['success_strict'])
+    return summary, task_success
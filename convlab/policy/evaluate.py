@@ -7,13 +7,11 @@ import os
 
 import numpy as np
 import torch
-from convlab.dialog_agent.agent import PipelineAgent
-from convlab.dialog_agent.session import BiSession
-from convlab.evaluator.multiwoz_eval import MultiWozEvaluator
+from convlab.policy.eval_engine import EvaluationEngine, build_backend
 from convlab.policy.rule.multiwoz import RulePolicy
+from convlab.task.multiwoz.goal_bank import load_goal_bank
 from convlab.task.multiwoz.goal_generator import GoalGenerator
 from convlab.util.custom_util import set_seed, get_config, env_config, create_goals, data_goals
-from tqdm import tqdm
 
 
 def init_logging(log_dir_path, path_suffix=None):
@@ -37,7 +35,8 @@ def init_logging(log_dir_path, path_suffix=None):
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 
-def evaluate(config_path, model_name, verbose=False, model_path="", goals_from_data=False, dialogues=500):
+def evaluate(config_path, model_name, verbose=False, model_path="", goals_from_data=False, dialogues=500,
+             backend='inprocess', num_workers=4, batch_size=8, output_jsonl=None, goal_bank=None):
     seed = 0
     set_seed(seed)
 
@@ -70,84 +69,38 @@ def evaluate(config_path, model_name, verbose=False, model_path="", goals_from_d
         logging.info(f"Could not load a policy: {e}")
 
     env, sess = env_config(conf, policy_sys)
-    action_dict = {}
 
-    task_success = {'Complete': [], 'Success': [],
-                    'Success strict': [], 'total_return': [], 'turns': []}
-
-    goal_generator = GoalGenerator()
-    if goals_from_data:
+    if goal_bank:
+        logging.info("read goals from the goal bank...")
+        goals = load_goal_bank(goal_bank).goals(dialogues)
+    elif goals_from_data:
         logging.info("read goals from dataset...")
-        goals = data_goals(dialogues, dataset="multiwoz21", dial_ids_order=0)
+        goals = data_goals(dialogues, dataset="multiwoz21", dial_ids_order=0)[:dialogues]
     else:
         logging.info("create goals from goal_generator...")
-        goals = create_goals(goal_generator, num_goals=dialogues,
+        goals = create_goals(GoalGenerator(), num_goals=dialogues,
                              single_domains=False, allowed_domains=None)
 
-    for seed in tqdm(range(1000, 1000 + dialogues)):
-        set_seed(seed)
-        sess.init_session(goal=goals[seed-1000])
-        sys_response = []
-        actions = 0.0
-        total_return = 0.0
-        turns = 0
-        task_succ = 0
-        task_succ_strict = 0
-        complete = 0
-
-        if verbose:
-            logging.info("NEW EPISODE!!!!" + "-" * 80)
-            logging.info(f"\n Seed: {seed}")
-            logging.info(f"GOAL: {sess.evaluator.goal}")
-            logging.info("\n")
-        for i in range(40):
-            sys_response, user_response, session_over, reward = sess.next_turn(
-                sys_response)
-
-            if verbose:
-                logging.info(f"USER RESPONSE: {user_response}")
-                logging.info(f"SYS RESPONSE: {sys_response}")
-
-            actions += len(sys_response)
-            length = len(sys_response)
-            if length in action_dict:
-                if sys_response not in action_dict[length]:
-                    action_dict[length].append(sys_response)
-            else:
-                action_dict[length] = []
-                action_dict[length].append(sys_response)
-
-            # logging.info(f"Actions in turn: {len(sys_response)}")
-            turns += 1
-            total_return += sess.evaluator.get_reward(session_over)
-
-            if session_over:
-                task_succ = sess.evaluator.task_success()
-                task_succ = sess.evaluator.success
-                task_succ_strict = sess.evaluator.success_strict
-                if goals_from_data:
-                    complete = sess.user_agent.policy.policy.goal.task_complete()
-                else:
-                    complete = sess.evaluator.complete
-                break
-
-        if verbose:
-            logging.info(f"Complete: {complete}")
-            logging.info(f"Success: {task_succ}")
-            logging.info(f"Success strict: {task_succ_strict}")
-            logging.info(f"Return: {total_return}")
-            logging.info(f"Average actions: {actions / turns}")
-
-        task_success['Complete'].append(complete)
-        task_success['Success'].append(task_succ)
-        task_success['Success strict'].append(task_succ_strict)
-        task_success['total_return'].append(total_return)
-        task_success['turns'].append(turns)
-
+    backend_kwargs = {'verbose': verbose} if backend == 'inprocess' else {}
+    # goals from the dataset are complete when the user simulator says so
+    engine = EvaluationEngine(build_backend(sess, backend, num_workers=num_workers, batch_size=batch_size,
+                                            complete_from_user_goal=goals_from_data and not goal_bank,
+                                            **backend_kwargs))
+    try:
+        results = engine.run(goals, jsonl_path=output_jsonl)
+    finally:
+        engine.close()
+
+    task_success = {'Complete': [result['complete'] for result in results],
+                    'Success': [result['success'] for result in results],
+                    'Success strict': [result['success_strict'] for result in results],
+                    'total_return': [result['evaluator_return'] for result in results],
+                    'turns': [result['turns'] for result in results]}
     for key in task_success:
         logging.info(
             f'{key} {len(task_success[key])} {np.average(task_success[key]) if len(task_success[key]) > 0 else 0}')
-    logging.info(f"Average actions: {actions / turns}")
+    logging.info(f"Average actions: {np.average([result['avg_actions'] for result in results])}")
+    logging.info(f"Dialogues/s: {engine.stats['dialogues_per_s']:.2f}, turns/s: {engine.stats['turns_per_s']:.2f}")
 
 
 if __name__ == "__main__":
@@ -169,6 +122,15 @@ if __name__ == "__main__":
                         default="log", help="path of log directory")
     parser.add_argument("-D", "--goals_from_data", action='store_true',
                         help="load goal from the dataset")
+    parser.add_argument("--goal_bank", type=str, default=None,
+                        help="draw the goals from this goal bank (see convlab/task/multiwoz/goal_bank.py)")
+    parser.add_argument("--backend", type=str, default="inprocess", choices=["inprocess", "pool", "batched"],
+                        help="run the dialogues in this process, in a pool of worker processes or in lockstep "
+                             "batches")
+    parser.add_argument("--num_workers", type=int, default=4, help="# of worker processes of the pool backend")
+    parser.add_argument("--batch_size", type=int, default=8, help="# of dialogues run at once by the batched backend")
+    parser.add_argument("--output_jsonl", type=str, default=None,
+                        help="if this is set, the result of every dialogue is written to this file")
 
     args = parser.parse_args()
 
@@ -179,4 +141,9 @@ if __name__ == "__main__":
              verbose=args.verbose,
              model_path=args.model_path,
              goals_from_data=args.goals_from_data,
-             dialogues=args.num_dialogues)
+             dialogues=args.num_dialogues,
+             backend=args.backend,
+             num_workers=args.num_workers,
+             batch_size=args.batch_size,
+             output_jsonl=args.output_jsonl,
+             goal_bank=args.goal_bank)
@@ -1,2 +1,7 @@
-from convlab.policy.gdpl.gdpl import GDPL
-from convlab.policy.gdpl.estimator import RewardEstimator
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'GDPL': 'convlab.policy.gdpl.gdpl',
+    'RewardEstimator': 'convlab.policy.gdpl.estimator',
+})
+__all__ = ['GDPL', 'RewardEstimator']
@@ -9,9 +9,6 @@ import numpy as np
 import torch
 import torch.nn as nn
 from torch import optim
-import torch.utils.data as data
-from convlab.util.train_util import to_device
-from convlab.policy.vector.dataset import ActStateDataset
 from convlab.policy.mle.loader import PolicyDataVectorizer
 
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -37,14 +34,9 @@ class RewardEstimator(object):
         
         manager = ActEstimatorDataLoaderMultiWoz()
         self.data_train = manager.create_dataset_irl('train', cfg['batchsz'])
-        self.irl_iter = iter(self.data_train)
         if pretrain:
-            self.data_train = manager.create_dataset_irl('train', cfg['batchsz'])
             self.data_valid = manager.create_dataset_irl('validation', cfg['batchsz'])
             self.data_test = manager.create_dataset_irl('test', cfg['batchsz'])
-            self.irl_iter = iter(self.data_train)
-            self.irl_iter_valid = iter(self.data_valid)
-            self.irl_iter_test = iter(self.data_test)
         
     def kl_divergence(self, mu, logvar, istrain):
         klds = -0.5 * (1 + logvar - mu.pow(2) - logvar.exp()).sum()
@@ -52,7 +44,7 @@ class RewardEstimator(object):
         return beta*klds
     
     def irl_loop(self, data_real, data_gen):
-        s_real, a_real, next_s_real = to_device(data_real)
+        s_real, a_real, next_s_real = data_real
         s, a, next_s = data_gen
         
         # train with real data
@@ -66,9 +58,7 @@ class RewardEstimator(object):
     
     def train_irl(self, batch, epoch):
         self.irl.train()
-        input_s = torch.from_numpy(np.stack(batch.state)).to(device=DEVICE)
-        input_a = torch.from_numpy(np.stack(batch.action)).to(device=DEVICE)
-        input_next_s = torch.from_numpy(np.stack(batch.next_state)).to(device=DEVICE)
+        input_s, input_a, input_next_s = _to_tensors(batch)
         batchsz = input_s.size(0)
         
         real_loss, gen_loss = 0., 0.
@@ -78,11 +68,7 @@ class RewardEstimator(object):
         next_s_chunk = torch.chunk(input_next_s, turns)
         
         for s, a, next_s in zip(s_chunk, a_chunk, next_s_chunk):
-            try:
-                data = self.irl_iter.next()
-            except StopIteration:
-                self.irl_iter = iter(self.data_train)
-                data = self.irl_iter.next()
+            data = self.data_train.sample()
             
             self.irl_optim.zero_grad()
             loss_real, loss_gen = self.irl_loop(data, (s, a, next_s))
@@ -104,9 +90,7 @@ class RewardEstimator(object):
         self.irl.eval()
     
     def test_irl(self, batch, epoch, best):
-        input_s = torch.from_numpy(np.stack(batch.state)).to(device=DEVICE)
-        input_a = torch.from_numpy(np.stack(batch.action)).to(device=DEVICE)
-        input_next_s = torch.from_numpy(np.stack(batch.next_state)).to(device=DEVICE)
+        input_s, input_a, input_next_s = _to_tensors(batch)
         batchsz = input_s.size(0)
         
         real_loss, gen_loss = 0., 0.
@@ -116,11 +100,7 @@ class RewardEstimator(object):
         next_s_chunk = torch.chunk(input_next_s, turns)
         
         for s, a, next_s in zip(s_chunk, a_chunk, next_s_chunk):
-            try:
-                data = self.irl_iter_valid.next()
-            except StopIteration:
-                self.irl_iter_valid = iter(self.data_valid)
-                data = self.irl_iter_valid.next()
+            data = self.data_valid.sample()
             
             loss_real, loss_gen = self.irl_loop(data, (s, a, next_s))
             real_loss += loss_real.item()
@@ -137,11 +117,7 @@ class RewardEstimator(object):
             self.save_irl(self.save_dir, 'best')
             
         for s, a, next_s in zip(s_chunk, a_chunk, next_s_chunk):
-            try:
-                data = self.irl_iter_test.next()
-            except StopIteration:
-                self.irl_iter_test = iter(self.data_test)
-                data = self.irl_iter_test.next()
+            data = self.data_test.sample()
             
             loss_real, loss_gen = self.irl_loop(data, (s, a, next_s))
             real_loss += loss_real.item()
@@ -168,11 +144,7 @@ class RewardEstimator(object):
         next_s_chunk = torch.chunk(input_next_s, turns)
         
         for s, a, next_s in zip(s_chunk, a_chunk, next_s_chunk):
-            try:
-                data = self.irl_iter.next()
-            except StopIteration:
-                self.irl_iter = iter(self.data_train)
-                data = self.irl_iter.next()
+            data = self.data_train.sample()
             
             self.irl_optim.zero_grad()
             loss_real, loss_gen = self.irl_loop(data, (s, a, next_s))
@@ -207,7 +179,8 @@ class RewardEstimator(object):
         """
         infer the reward of state action pair with the estimator
         """
-        weight = self.irl(s, a.float(), next_s)
+        with torch.no_grad():
+            weight = self.irl(s, a.float(), next_s)
         logging.debug('<<reward estimator>> weight {}'.format(weight.mean().item()))
         logging.debug('<<reward estimator>> log pi {}'.format(log_pi.mean().item()))
         # see AIRL paper
@@ -237,30 +210,71 @@ class AIRL(nn.Module):
         :param next_s: [b, s_dim]
         :return:  [b, 1]
         """
-        weights = self.g(torch.cat([s, a], -1)) + self.gamma * self.h(next_s) - self.h(s)
+        h_s, h_next_s = self.potentials(s, next_s)
+        weights = self.g(torch.cat([s, a], -1)) + self.gamma * h_next_s - h_s
         return weights
 
+    def potentials(self, s, next_s):
+        """
+        h(s) and h(next_s) in one forward pass. A next state that is the following state of the batch, as in
+        sampled trajectories, is not passed twice.
+        :return: [b, 1], [b, 1]
+        """
+        b = s.size(0)
+        shared = torch.zeros(b, dtype=torch.bool, device=s.device)
+        if b > 1:
+            shared[:-1] = (next_s[:-1] == s[1:]).all(-1)
+        rest = ~shared
+        h = self.h(torch.cat([s, next_s[rest]], 0))
+        # rows of h: the states, then the next states that are not shared
+        positions = torch.arange(b, device=s.device)
+        next_index = torch.where(shared, positions + 1, b + rest.long().cumsum(0) - 1)
+        return h[:b], h[next_index]
+
+
+class ExpertData(object):
+    """
+    The expert (s, a, next_s) of a part of the dataset as tensors on DEVICE, copied once from the vectorized data
+    cached on disk; next states are kept as indexes into the states. Batches are drawn by index, every turn once
+    per epoch in random order.
+    """
+    def __init__(self, part_data, batchsz):
+        self.state = torch.from_numpy(np.ascontiguousarray(part_data['state'])).to(device=DEVICE)
+        self.action = torch.from_numpy(np.ascontiguousarray(part_data['action'])).to(device=DEVICE)
+        # the next state of a terminated turn is the turn itself
+        index = np.arange(len(self.state))
+        next_index = np.minimum(np.where(part_data['terminated'], index, index + 1), len(index) - 1)
+        self.next_index = torch.from_numpy(next_index).to(device=DEVICE)
+        self.batchsz = batchsz
+        self.order = None
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.state)
+
+    def sample(self):
+        if self.order is None or self.pos >= len(self):
+            self.order = torch.randperm(len(self), device=DEVICE)
+            self.pos = 0
+        index = self.order[self.pos:self.pos + self.batchsz]
+        self.pos += self.batchsz
+        return self.state[index], self.action[index], self.state[self.next_index[index]]
+
+
+def _to_tensors(batch):
+    """(s, a, next_s) of a batch of transitions, stacked if they are no tensors yet"""
+    return [(field if torch.is_tensor(field) else torch.from_numpy(np.stack(field))).to(device=DEVICE)
+            for field in (batch.state, batch.action, batch.next_state)]
+
 
 class ActEstimatorDataLoaderMultiWoz(PolicyDataVectorizer):
     def __init__(self):
         super(ActEstimatorDataLoaderMultiWoz, self).__init__()
-        
+        self.expert_data = {}
+
     def create_dataset_irl(self, part, batchsz):
-        print('Start creating {} irl dataset'.format(part))
-        s = []
-        a = []
-        next_s = []
-        for i, item in enumerate(self.data[part]):
-            s.append(torch.Tensor(item['state']))
-            a.append(torch.Tensor(item['action']))
-            if item['terminated']: #terminated
-                next_s.append(torch.Tensor(item['state']))
-            else:
-                next_s.append(torch.Tensor(self.data[part][i+1]['state']))
-        s = torch.stack(s)
-        a = torch.stack(a)
-        next_s = torch.stack(next_s)
-        dataset = ActStateDataset(s, a, next_s)
-        dataloader = data.DataLoader(dataset, batchsz, True)
-        print('Finish creating {} irl dataset'.format(part))
-        return dataloader
+        if (part, batchsz) not in self.expert_data:
+            print('Start creating {} irl dataset'.format(part))
+            self.expert_data[(part, batchsz)] = ExpertData(self.data[part], batchsz)
+            print('Finish creating {} irl dataset'.format(part))
+        return self.expert_data[(part, batchsz)]
@@ -1 +1,6 @@
-from convlab.policy.gdpl.multiwoz.gdpl_policy import GDPLPolicy
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'GDPLPolicy': 'convlab.policy.gdpl.multiwoz.gdpl_policy',
+})
+__all__ = ['GDPLPolicy']
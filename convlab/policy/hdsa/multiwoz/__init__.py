@@ -1 +1,6 @@
-from convlab.policy.hdsa.multiwoz.hdsa import HDSA
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'HDSA': 'convlab.policy.hdsa.multiwoz.hdsa',
+})
+__all__ = ['HDSA']
@@ -1 +1,6 @@
-from convlab.policy.larl.multiwoz.larl import LaRL
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'LaRL': 'convlab.policy.larl.multiwoz.larl',
+})
+__all__ = ['LaRL']
@@ -7,7 +7,7 @@ from nltk.util import ngrams
 from convlab.policy.larl.multiwoz.latent_dialog.corpora import SYS, USR, BOS, EOS
 import json
 from convlab.policy.larl.multiwoz.latent_dialog.normalizer.delexicalize import normalize
-import sqlite3
+from convlab.util.multiwoz.sqlite_db import SQLiteDB
 import os
 import random
 import logging
@@ -138,53 +138,36 @@ class BleuEvaluator(BaseEvaluator):
 class MultiWozDB(object):
     # loading databases
     domains = ['restaurant', 'hotel', 'attraction', 'train', 'taxi', 'hospital']  # , 'police']
-    dbs = {}
     CUR_DIR = os.path.dirname(__file__).replace('latent_dialog', '')
-
-    for domain in domains:
-        print(os.path.join(CUR_DIR, 'data/norm-multi-woz/db/{}-dbase.db'.format(domain)))
-        db = os.path.join(CUR_DIR, 'data/norm-multi-woz/db/{}-dbase.db'.format(domain))
-        conn = sqlite3.connect(db)
-        c = conn.cursor()
-        dbs[domain] = c
+    # connections are opened on first use, one per thread and process
+    db = SQLiteDB(os.path.join(CUR_DIR, 'data/norm-multi-woz/db'), domains)
 
     def queryResultVenues(self, domain, turn, real_belief=False):
         # query the db
-        sql_query = "select * from {}".format(domain)
+        constraints = []
 
         if real_belief == True:
             items = turn.items()
         else:
             items = turn['metadata'][domain]['semi'].items()
 
-        flag = True
         for key, val in items:
             if val == "" or val == "dontcare" or val == 'not mentioned' or val == "don't care" or val == "dont care" or val == "do n't care":
                 pass
             else:
-                if flag:
-                    sql_query += " where "
-                    val2 = val.replace("'", "''")
-                    val2 = normalize(val2)
-                    if key == 'leaveAt':
-                        sql_query += r" " + key + " > " + r"'" + val2 + r"'"
-                    elif key == 'arriveBy':
-                        sql_query += r" " + key + " < " + r"'" + val2 + r"'"
-                    else:
-                        sql_query += r" " + key + "=" + r"'" + val2 + r"'"
-                    flag = False
+                val2 = val.replace("'", "''")
+                val2 = normalize(val2)
+                # the value the quoted sql string '<val2>' stood for
+                val2 = val2.replace("''", "'")
+                if key == 'leaveAt':
+                    constraints.append((key, '>', val2))
+                elif key == 'arriveBy':
+                    constraints.append((key, '<', val2))
                 else:
-                    val2 = val.replace("'", "''")
-                    val2 = normalize(val2)
-                    if key == 'leaveAt':
-                        sql_query += r" and " + key + " > " + r"'" + val2 + r"'"
-                    elif key == 'arriveBy':
-                        sql_query += r" and " + key + " < " + r"'" + val2 + r"'"
-                    else:
-                        sql_query += r" and " + key + "=" + r"'" + val2 + r"'"
+                    constraints.append((key, '=', val2))
 
-        try:  # "select * from attraction  where name = 'queens college'"
-            return self.dbs[domain].execute(sql_query).fetchall()
+        try:  # "select * from attraction where name = ?" with ('queens college',)
+            return self.db.select(domain, constraints)
         except:
             return []  # TODO test it
 
@@ -1 +1,6 @@
-from convlab.policy.lava.multiwoz.lava import LAVA
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'LAVA': 'convlab.policy.lava.multiwoz.lava',
+})
+__all__ = ['LAVA']
@@ -1,17 +1,12 @@
-import sqlite3
-
 import numpy as np
 
 from convlab.policy.mdrg.multiwoz.utils.nlp import normalize
+from convlab.util.multiwoz.sqlite_db import SQLiteDB
 
 # loading databases
 domains = ['restaurant', 'hotel', 'attraction', 'train', 'taxi', 'hospital']#, 'police']
-dbs = {}
-for domain in domains:
-    db = 'db/{}-dbase.db'.format(domain)
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    dbs[domain] = c
+# connections are opened on first use, one per thread and process
+db = SQLiteDB('db', domains)
 
 
 def oneHotVector(num, domain, vector):
@@ -48,53 +43,48 @@ def oneHotVector(num, domain, vector):
 
     return vector
 
-def queryResult(domain, turn):
-    """Returns the list of entities for a given domain
-    based on the annotation of the belief state"""
-    # query the db
-    sql_query = "select * from {}".format(domain)
 
-    flag = True
+def _operator(key):
+    # change query for trains
+    if key == 'leaveAt':
+        return '>'
+    elif key == 'arriveBy':
+        return '<'
+    return '='
+
+
+def _unquote(val2):
+    # the value that the sql string literal '<val2>' stands for
+    return val2.replace("''", "'")
+
+
+def _belief_constraints(domain, turn):
+    constraints = []
     #print turn['metadata'][domain]['semi']
     for key, val in turn['metadata'][domain]['semi'].items():
         if val == "" or val == "dont care" or val == 'not mentioned' or val == "don't care" or val == "dontcare" or val == "do n't care":
             pass
         else:
-            if flag:
-                sql_query += " where "
-                val2 = val.replace("'", "''")
-                #val2 = normalize(val2)
-                # change query for trains
-                if key == 'leaveAt':
-                    sql_query += r" " + key + " > " + r"'" + val2 + r"'"
-                elif key == 'arriveBy':
-                    sql_query += r" " + key + " < " + r"'" + val2 + r"'"
-                else:
-                    sql_query += r" " + key + "=" + r"'" + val2 + r"'"
-                flag = False
-            else:
-                val2 = val.replace("'", "''")
-                #val2 = normalize(val2)
-                if key == 'leaveAt':
-                    sql_query += r" and " + key + " > " + r"'" + val2 + r"'"
-                elif key == 'arriveBy':
-                    sql_query += r" and " + key + " < " + r"'" + val2 + r"'"
-                else:
-                    sql_query += r" and " + key + "=" + r"'" + val2 + r"'"
+            constraints.append((key, _operator(key), val))
+    return constraints
+
 
-    #try:  # "select * from attraction  where name = 'queens college'"
-    #print sql_query
-    #print domain
-    num_entities = len(dbs[domain].execute(sql_query).fetchall())
+def queryResult(domain, turn):
+    """Returns the list of entities for a given domain
+    based on the annotation of the belief state"""
+    # query the db, e.g. "select count(*) from attraction where name = ?" with ('queens college',)
+    return db.count(domain, _belief_constraints(domain, turn))
 
-    return num_entities
+
+def queryResults(domain, turns):
+    """queryResult of a list of turns (e.g. of a whole dialogue), every distinct query is run once"""
+    return db.count_many(domain, [_belief_constraints(domain, turn) for turn in turns])
 
 
 def queryResultVenues(domain, turn, real_belief=False):
     # query the db
-    sql_query = "select * from {}".format(domain)
+    constraints = []
 
-    flag = True
     if real_belief == True:
         items = turn.items()
     elif real_belief=='tracking':
@@ -110,67 +100,24 @@ def queryResultVenues(domain, turn, real_belief=False):
             if val == "do n't care":
                 pass
             else:
-                if flag:
-                    sql_query += " where "
-                    val2 = val.replace("'", "''")
-                    val2 = normalize(val2)
-                    if key == 'leaveAt':
-                        sql_query += key + " > " + r"'" + val2 + r"'"
-                    elif key == 'arriveBy':
-                        sql_query += key + " < " + r"'" + val2 + r"'"
-                    else:
-                        sql_query += r" " + key + "=" + r"'" + val2 + r"'"
-                    flag = False
-                else:
-                    val2 = val.replace("'", "''")
-                    val2 = normalize(val2)
-                    if key == 'leaveAt':
-                        sql_query += r" and " + key + " > " + r"'" + val2 + r"'"
-                    elif key == 'arriveBy':
-                        sql_query += r" and " + key + " < " + r"'" + val2 + r"'"
-                    else:
-                        sql_query += r" and " + key + "=" + r"'" + val2 + r"'"
-
-            try:  # "select * from attraction  where name = 'queens college'"
-                return dbs[domain].execute(sql_query).fetchall()
+                constraints.append((key, _operator(key), _unquote(normalize(val.replace("'", "''")))))
+
+            try:
+                return db.select(domain, constraints)
             except:
                 return []  # TODO test it
         pass
     else:
         items = turn['metadata'][domain]['semi'].items()
 
-    flag = True
     for key, val in items:
         if val == "" or val == "dontcare" or val == 'not mentioned' or val == "don't care" or val == "dont care" or val == "do n't care":
             pass
         else:
-            if flag:
-                sql_query += " where "
-                val2 = val.replace("'", "''")
-                val2 = normalize(val2)
-                if key == 'leaveAt':
-                    sql_query += r" " + key + " > " + r"'" + val2 + r"'"
-                elif key == 'arriveBy':
-                    sql_query += r" " +key + " < " + r"'" + val2 + r"'"
-                else:
-                    sql_query += r" " + key + "=" + r"'" + val2 + r"'"
-                flag = False
-            else:
-                val2 = val.replace("'", "''")
-                val2 = normalize(val2)
-                if key == 'leaveAt':
-                    sql_query += r" and " + key + " > " + r"'" + val2 + r"'"
-                elif key == 'arriveBy':
-                    sql_query += r" and " + key + " < " + r"'" + val2 + r"'"
-                else:
-                    sql_query += r" and " + key + "=" + r"'" + val2 + r"'"
-
-    try:  # "select * from attraction  where name = 'queens college'"
-        return dbs[domain].execute(sql_query).fetchall()
-    except:
-        raise
-        return []  # TODO test it
+            constraints.append((key, _operator(key), _unquote(normalize(val.replace("'", "''")))))
+
+    return db.select(domain, constraints)
 
 
 def table_schema(domain):
-    return [col[1] for col in dbs[domain].execute("PRAGMA table_info({})".format(domain)).fetchall()]
\ No newline at end of file
+    return [col[1] for col in db.connection(domain).execute("PRAGMA table_info({})".format(domain)).fetchall()]
@@ -1 +1,6 @@
-from convlab.policy.mdrg.multiwoz.policy import MDRGWordPolicy
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'MDRGWordPolicy': 'convlab.policy.mdrg.multiwoz.policy',
+})
+__all__ = ['MDRGWordPolicy']
@@ -136,6 +136,20 @@ def addDBPointer(turn):
     return pointer_vector
 
 
+def addDBPointers(turns):
+    """Create database pointers for a list of turns, e.g. the system turns of a dialogue."""
+    domains = ['restaurant', 'hotel', 'attraction', 'train']
+    num_entities = {domain: dbPointer.queryResults(domain, turns) for domain in domains}
+    pointer_vectors = []
+    for i in range(len(turns)):
+        pointer_vector = np.zeros(6 * len(domains))
+        for domain in domains:
+            pointer_vector = dbPointer.oneHotVector(num_entities[domain][i], domain, pointer_vector)
+        pointer_vectors.append(pointer_vector)
+
+    return pointer_vectors
+
+
 def get_summary_bstate(bstate):
     """Based on the mturk annotations we form multi-domain belief state"""
     domains = [u'taxi', u'restaurant', u'hospital', u'hotel', u'attraction', u'train', u'police']
@@ -327,6 +341,8 @@ def createDelexData():
         # print dialogue_name
 
         idx_acts = 1
+        # database pointers of the system turns, the delexicalization below does not change the belief states
+        db_pointers = addDBPointers(dialogue['log'][1::2])
 
         for idx, turn in enumerate(dialogue['log']):
             # normalization, split and delexicalization of the sentence
@@ -347,7 +363,7 @@ def createDelexData():
 
             if idx % 2 == 1:  # if it's a system turn
                 # add database pointer
-                pointer_vector = addDBPointer(turn)
+                pointer_vector = db_pointers[idx // 2]
                 # add booking pointer
                 pointer_vector = addBookingPointer(dialogue, turn, pointer_vector)
 
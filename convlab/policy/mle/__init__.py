@@ -1 +1,6 @@
-from .mle import MLE
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'MLE': 'convlab.policy.mle.mle',
+})
+__all__ = ['MLE']
@@ -1,6 +1,9 @@
+import hashlib
+import json
+import multiprocessing
 import os
-import pickle
-import torch
+import shutil
+import numpy as np
 import torch.utils.data as data
 from copy import deepcopy
 
@@ -12,131 +15,260 @@ from convlab.util.custom_util import flatten_acts
 from convlab.util.multiwoz.state import default_state
 from convlab.policy.vector.dataset import ActDataset
 
+# bump when the layout of the processed data changes
+CACHE_VERSION = 2
+ARRAY_KEYS = ['state', 'action', 'mask', 'terminated']
+# dialogues tracked in parallel by trackers that can update several dialogues at once
+DST_BATCH_DIALOGUES = 16
+
+_worker_vector = None
+
+
+def _init_worker(vector):
+    global _worker_vector
+    _worker_vector = vector
+    # the database does not change, so DB counts are shared across all chunks of the worker
+    _worker_vector.db_count_cache = {}
+
+
+def _vectorize_chunk(chunk):
+    states, dialogue_acts = zip(*[_turn_state(_dataset_state(data_point), data_point) for data_point in chunk])
+    state_vecs, masks = _worker_vector.state_vectorize_batch(states)
+    act_vecs = _worker_vector.action_vectorize_batch(dialogue_acts)
+    return [(state_vecs[i], act_vecs[i], masks[i], state['terminated']) for i, state in enumerate(states)]
+
+
+def _dataset_state(data_point):
+    """dialog state given by the dataset annotation, used when no tracker is set"""
+    state = default_state()
+    state['belief_state'] = data_point['context'][-1]['state']
+    state['user_action'] = flatten_acts(data_point['context'][-1]['dialogue_acts'])
+    return state
+
+
+def _turn_state(state, data_point):
+    """complete the state with the turn information, return it with the system act to imitate"""
+    last_system_act = data_point['context'][-2]['dialogue_acts'] if len(data_point['context']) > 1 else {}
+    state['system_action'] = flatten_acts(last_system_act)
+    state['terminated'] = data_point['terminated']
+    if "booked" in data_point:
+        state['booked'] = data_point['booked']
+    return state, flatten_acts(data_point['dialogue_acts'])
+
+
+def _vectorize_data_point(vector, state, data_point):
+    state, dialogue_act = _turn_state(state, data_point)
+    vectorized_state, mask = vector.state_vectorize(state)
+    vectorized_action = vector.action_vectorize(dialogue_act)
+    return vectorized_state, vectorized_action, mask, state['terminated']
+
+
+def _iter_dialogue_chunks(raw_data, chunk_size):
+    """split the turns into chunks of whole dialogues (a dialogue ends with a terminated turn)"""
+    chunk = []
+    for data_point in raw_data:
+        chunk.append(data_point)
+        if data_point['terminated'] and len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 class PolicyDataVectorizer:
     
-    def __init__(self, dataset_name='multiwoz21', vector=None, dst=None):
+    def __init__(self, dataset_name='multiwoz21', vector=None, dst=None, num_workers=None):
+        """
+        :param dataset_name: unified dataset to vectorize
+        :param vector: vectorizer, VectorBinary by default
+        :param dst: tracker that replaces the annotated states, None to use the annotation
+        :param num_workers: processes vectorizing the data when no tracker is used, defaults to the cpu count
+        """
         self.dataset_name = dataset_name
         if vector is None:
             self.vector = VectorBinary(dataset_name)
         else:
             self.vector = vector
         self.dst = dst
+        self.num_workers = num_workers
         self.process_data()
 
+    def cache_config(self):
+        """everything the processed data depends on, the cache directory is named after its hash"""
+        vector_attributes = {key: value for key, value in vars(self.vector).items()
+                             if isinstance(value, (str, int, float, bool, type(None)))}
+        return {
+            'version': CACHE_VERSION,
+            'dataset_name': self.dataset_name,
+            'dst': f"{type(self.dst).__module__}.{type(self.dst).__name__}" if self.dst is not None else None,
+            'vector': f"{type(self.vector).__module__}.{type(self.vector).__name__}",
+            'vector_attributes': vector_attributes,
+            'sys_da_voc': [list(act) for act in self.vector.da_voc],
+            'usr_da_voc': [list(act) for act in self.vector.da_voc_opp],
+            'ontology': hashlib.sha1(json.dumps(self.vector.ontology, sort_keys=True, default=str)
+                                     .encode('utf-8')).hexdigest(),
+        }
+
     def process_data(self):
+        config = self.cache_config()
+        config_hash = hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
         name = f"{self.dataset_name}_"
         name += f"{type(self.dst).__name__}_" if self.dst is not None else ""
-        name += f"{type(self.vector).__name__}"
+        name += f"{type(self.vector).__name__}_{config_hash[:12]}"
         processed_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
         if os.path.exists(processed_dir):
             print('Load processed data file')
-            self._load_data(processed_dir)
         else:
             print('Start preprocessing the dataset, this can take a while..')
-            self._build_data(processed_dir)
-        
-    def _build_data(self, processed_dir):
-        self.data = {}
+            self._build_data(processed_dir, config)
+        self._load_data(processed_dir)
 
-        os.makedirs(processed_dir, exist_ok=True)
-        dataset = load_dataset(self.dataset_name)
-        data_split = load_policy_data(dataset, context_window_size=2)
+    def _dst_state(self, data_point):
+        """dialog state of the turn, tracked by self.dst if set"""
+        if self.dst is None:
+            return _dataset_state(data_point)
+        usr_utt = self._dst_prepare(self.dst, data_point)
+        state = deepcopy(self.dst.update(usr_utt))
+        self._dst_finish(self.dst, data_point, usr_utt)
+        return state
 
-        for split in data_split:
-            self.data[split] = []
-            raw_data = data_split[split]
+    def _dst_prepare(self, dst, data_point):
+        """give the tracker the turn before its update, return the user utterance to track"""
+        if "setsumbt" in str(dst):
+            last_system_utt = data_point['context'][-2]['utterance'] if len(data_point['context']) > 1 else ''
+            dst.state['history'].append(['sys', last_system_utt])
+
+            usr_utt = data_point['context'][-1]['utterance']
+        elif "trippy" in str(dst):
+            # Get last system acts and text.
+            # System acts are used to fill the inform memory.
+            last_system_acts = []
+            last_system_utt = ''
+            if len(data_point['context']) > 1:
+                last_system_acts = []
+                for act_type in data_point['context'][-2]['dialogue_acts']:
+                    for act in data_point['context'][-2]['dialogue_acts'][act_type]:
+                        value = ''
+                        if 'value' not in act:
+                            if act['intent'] == 'request':
+                                value = '?'
+                            elif act['intent'] == 'inform':
+                                value = 'yes'
+                        else:
+                            value = act['value']
+                        last_system_acts.append([act['intent'], act['domain'], act['slot'], value])
+                last_system_utt = data_point['context'][-2]['utterance']
+
+            # Get current user acts and text.
+            # User acts are used for internal evaluation.
+            usr_acts = []
+            for act_type in data_point['context'][-1]['dialogue_acts']:
+                for act in data_point['context'][-1]['dialogue_acts'][act_type]:
+                    usr_acts.append([act['intent'], act['domain'], act['slot'], act['value'] if 'value' in act else ''])
+            usr_utt = data_point['context'][-1]['utterance']
+
+            # Update the state for DST, then update the state via DST.
+            dst.state['system_action'] = last_system_acts
+            dst.state['user_action'] = usr_acts
+            dst.state['history'].append(['sys', last_system_utt])
+            dst.state['history'].append(['usr', usr_utt])
+        else:
+            raise NameError(f"Tracker: {dst} not implemented.")
+        return usr_utt
+
+    def _dst_finish(self, dst, data_point, usr_utt):
+        if "setsumbt" in str(dst):
+            dst.state['history'].append(['usr', usr_utt])
+        if data_point['terminated']:
+            dst.init_session()
 
+    def _iter_dst_vectorized(self, raw_data):
+        """
+        track DST_BATCH_DIALOGUES dialogues at a time in lockstep, with one tracker update per turn for all of them,
+        and yield the vectorized turns in order
+        """
+        trackers = [self.dst] + [self.dst.spawn() for _ in range(DST_BATCH_DIALOGUES - 1)]
+        dialogues = _iter_dialogue_chunks(raw_data, chunk_size=1)
+        while True:
+            group = [dialogue for _, dialogue in zip(trackers, dialogues)]
+            if not group:
+                return
+            results = [[] for _ in group]
+            for turn in range(max(len(dialogue) for dialogue in group)):
+                active = [i for i, dialogue in enumerate(group) if turn < len(dialogue)]
+                usr_utts = [self._dst_prepare(trackers[i], group[i][turn]) for i in active]
+                states = type(self.dst).update_batch([trackers[i] for i in active], usr_utts)
+                for i, usr_utt, state in zip(active, usr_utts, states):
+                    data_point = group[i][turn]
+                    state = deepcopy(state)
+                    self._dst_finish(trackers[i], data_point, usr_utt)
+                    results[i].append(_vectorize_data_point(self.vector, state, data_point))
+            for dialogue_results in results:
+                yield from dialogue_results
+
+    def _iter_vectorized(self, raw_data):
+        num_workers = self.num_workers or os.cpu_count() or 1
+        if self.dst is not None or num_workers == 1:
+            # trackers carry their state from turn to turn, so the turns are processed in order
             if self.dst is not None:
                 self.dst.init_session()
+            with self.vector.shared_db_counts():
+                if self.dst is not None and hasattr(self.dst, 'update_batch') and hasattr(self.dst, 'spawn'):
+                    yield from self._iter_dst_vectorized(raw_data)
+                    return
+                for data_point in raw_data:
+                    yield _vectorize_data_point(self.vector, self._dst_state(data_point), data_point)
+            return
+
+        chunks = _iter_dialogue_chunks(raw_data, chunk_size=256)
+        with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(self.vector,)) as pool:
+            for results in pool.imap(_vectorize_chunk, chunks):
+                yield from results
+
+    def _build_data(self, processed_dir, config):
+        tmp_dir = processed_dir + '.tmp'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        dataset = load_dataset(self.dataset_name)
+        data_split = load_policy_data(dataset, context_window_size=2)
 
-            for data_point in tqdm(raw_data):
-                if self.dst is None:
-                    state = default_state()
-
-                    state['belief_state'] = data_point['context'][-1]['state']
-                    state['user_action'] = flatten_acts(data_point['context'][-1]['dialogue_acts'])
-                elif "setsumbt" in str(self.dst):
-                    last_system_utt = data_point['context'][-2]['utterance'] if len(data_point['context']) > 1 else ''
-                    self.dst.state['history'].append(['sys', last_system_utt])
-
-                    usr_utt = data_point['context'][-1]['utterance']
-                    state = deepcopy(self.dst.update(usr_utt))
-                    self.dst.state['history'].append(['usr', usr_utt])
-                elif "trippy" in str(self.dst):
-                    # Get last system acts and text.
-                    # System acts are used to fill the inform memory.
-                    last_system_acts = []
-                    last_system_utt = ''
-                    if len(data_point['context']) > 1:
-                        last_system_acts = []
-                        for act_type in data_point['context'][-2]['dialogue_acts']:
-                            for act in data_point['context'][-2]['dialogue_acts'][act_type]:
-                                value = ''
-                                if 'value' not in act:
-                                    if act['intent'] == 'request':
-                                        value = '?'
-                                    elif act['intent'] == 'inform':
-                                        value = 'yes'
-                                else:
-                                    value = act['value']
-                                last_system_acts.append([act['intent'], act['domain'], act['slot'], value])
-                        last_system_utt = data_point['context'][-2]['utterance']
-
-                    # Get current user acts and text.
-                    # User acts are used for internal evaluation.
-                    usr_acts = []
-                    for act_type in data_point['context'][-1]['dialogue_acts']:
-                        for act in data_point['context'][-1]['dialogue_acts'][act_type]:
-                            usr_acts.append([act['intent'], act['domain'], act['slot'], act['value'] if 'value' in act else ''])
-                    usr_utt = data_point['context'][-1]['utterance']
-
-                    # Update the state for DST, then update the state via DST.
-                    self.dst.state['system_action'] = last_system_acts
-                    self.dst.state['user_action'] = usr_acts
-                    self.dst.state['history'].append(['sys', last_system_utt])
-                    self.dst.state['history'].append(['usr', usr_utt])
-                    state = deepcopy(self.dst.update(usr_utt))
-                else:
-                    raise NameError(f"Tracker: {self.dst} not implemented.")
-
-                last_system_act = data_point['context'][-2]['dialogue_acts'] if len(data_point['context']) > 1 else {}
-                state['system_action'] = flatten_acts(last_system_act)
-                state['terminated'] = data_point['terminated']
-                if self.dst is not None and state['terminated']:
-                    self.dst.init_session()
-                if "booked" in data_point:
-                    state['booked'] = data_point['booked']
-                dialogue_act = flatten_acts(data_point['dialogue_acts'])
-
-                vectorized_state, mask = self.vector.state_vectorize(state)
-                vectorized_action = self.vector.action_vectorize(dialogue_act)
-                self.data[split].append({"state": vectorized_state, "action": vectorized_action, "mask": mask,
-                                         "terminated": state['terminated']})
-
-            with open(os.path.join(processed_dir, '{}.pkl'.format(split)), 'wb') as f:
-                pickle.dump(self.data[split], f)
+        for split in data_split:
+            raw_data = data_split[split]
+            num = len(raw_data)
+            # written row by row into .npy files, so the data never has to fit in memory twice
+            arrays = {
+                'state': np.lib.format.open_memmap(os.path.join(tmp_dir, f'{split}_state.npy'), mode='w+',
+                                                   dtype=np.float32, shape=(num, self.vector.state_dim)),
+                'action': np.lib.format.open_memmap(os.path.join(tmp_dir, f'{split}_action.npy'), mode='w+',
+                                                    dtype=np.float32, shape=(num, self.vector.da_dim)),
+                'mask': np.lib.format.open_memmap(os.path.join(tmp_dir, f'{split}_mask.npy'), mode='w+',
+                                                  dtype=np.float32, shape=(num, self.vector.da_dim)),
+                'terminated': np.lib.format.open_memmap(os.path.join(tmp_dir, f'{split}_terminated.npy'), mode='w+',
+                                                        dtype=np.bool_, shape=(num,)),
+            }
+            for i, item in enumerate(tqdm(self._iter_vectorized(raw_data), total=num)):
+                for key, value in zip(ARRAY_KEYS, item):
+                    arrays[key][i] = value
+            for array in arrays.values():
+                array.flush()
+            del arrays
 
+        with open(os.path.join(tmp_dir, 'config.json'), 'w') as f:
+            json.dump(config, f, indent=2, default=str)
+        os.rename(tmp_dir, processed_dir)
         print("Data processing done.")
 
     def _load_data(self, processed_dir):
         self.data = {}
         for part in ['train', 'validation', 'test']:
-            with open(os.path.join(processed_dir, '{}.pkl'.format(part)), 'rb') as f:
-                self.data[part] = pickle.load(f)
-                
+            self.data[part] = {key: np.load(os.path.join(processed_dir, f'{part}_{key}.npy'), mmap_mode='r')
+                               for key in ARRAY_KEYS}
+
     def create_dataset(self, part, batchsz):
-        states = []
-        actions = []
-        masks = []
-        for item in self.data[part]:
-            states.append(torch.Tensor(item['state']))
-            actions.append(torch.Tensor(item['action']))
-            masks.append(torch.Tensor(item['mask']))
-        s = torch.stack(states)
-        a = torch.stack(actions)
-        m = torch.stack(masks)
-        dataset = ActDataset(s, a, m)
+        # rows are read from the memory-mapped files when batches are drawn
+        part_data = self.data[part]
+        dataset = ActDataset(part_data['state'], part_data['action'], part_data['mask'])
         dataloader = data.DataLoader(dataset, batchsz, True)
         return dataloader
 
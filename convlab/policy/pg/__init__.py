@@ -1 +1,6 @@
-from convlab.policy.pg.pg import PG
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'PG': 'convlab.policy.pg.pg',
+})
+__all__ = ['PG']
@@ -1 +1,6 @@
-from convlab.policy.pg.multiwoz.pg_policy import PGPolicy
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'PGPolicy': 'convlab.policy.pg.multiwoz.pg_policy',
+})
+__all__ = ['PGPolicy']
@@ -17,7 +17,7 @@ from convlab.policy.rlmodule import Memory
 from torch import multiprocessing as mp
 from argparse import ArgumentParser
 from convlab.util.custom_util import set_seed, init_logging, save_config, move_finished_training, env_config, \
-    eval_policy, log_start_args, save_best, load_config_file, get_config
+    eval_policy, close_eval_engines, log_start_args, save_best, load_config_file, get_config
 from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(
@@ -275,6 +275,7 @@ if __name__ == '__main__':
 
     logging.info("End of Training: " +
                  time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime()))
+    close_eval_engines(sess)
 
     f = open(os.path.join(dir_path, "time.txt"), "a")
     f.write(str(datetime.now() - begin_time))
@@ -1 +1,6 @@
-from convlab.policy.ppo.ppo import PPO
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'PPO': 'convlab.policy.ppo.ppo',
+})
+__all__ = ['PPO']
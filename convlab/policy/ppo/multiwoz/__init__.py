@@ -1 +1,6 @@
-from convlab.policy.ppo.multiwoz.ppo_policy import PPOPolicy
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'PPOPolicy': 'convlab.policy.ppo.multiwoz.ppo_policy',
+})
+__all__ = ['PPOPolicy']
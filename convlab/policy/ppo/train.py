@@ -18,7 +18,7 @@ from torch import multiprocessing as mp
 
 from convlab.policy.ppo import PPO
 from convlab.policy.rlmodule import Memory
-from convlab.util.custom_util import (env_config, eval_policy, get_config,
+from convlab.util.custom_util import (close_eval_engines, env_config, eval_policy, get_config,
                                       init_logging, load_config_file,
                                       log_start_args, move_finished_training,
                                       save_best, save_config, set_seed)
@@ -274,6 +274,7 @@ if __name__ == '__main__':
                 tb_writer.add_scalar(key, eval_dict[key], idx * conf['model']['num_train_dialogues'])
     logging.info("End of Training: " +
                  time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime()))
+    close_eval_engines(sess)
 
     f = open(os.path.join(dir_path, "time.txt"), "a")
     f.write(str(datetime.now() - begin_time))
@@ -412,3 +412,174 @@ class MemoryReplay(object):
 
     def __len__(self):
         return len(self.memory)
+
+
+class SumTree(object):
+    """
+    Binary tree over the priorities of a fixed number of slots, stored in a flat array: the leaves are at
+    [capacity, 2 * capacity) and every inner node holds the sum of its two children, the root (1) the total.
+    Updates and lookups work on whole batches of slots, one tree level at a time.
+    """
+
+    def __init__(self, size):
+        self.capacity = 1
+        while self.capacity < size:
+            self.capacity *= 2
+        self.tree = np.zeros(2 * self.capacity)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, slots):
+        return self.tree[np.asarray(slots) + self.capacity]
+
+    def update(self, slots, priorities):
+        """set the priorities of `slots` and the sums above them"""
+        nodes = np.asarray(slots, dtype=np.int64) + self.capacity
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """for every value in [0, total), the slot whose priority interval (in slot order) contains it"""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.capacity:
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.capacity
+
+
+class TensorMemoryReplay(object):
+    """
+        MemoryReplay that stores the transitions in tensors preallocated on `device`, so that a batch is gathered by
+        indexing instead of stacking python objects and copying them to the device.
+        Batches are sampled uniformly with replacement or, if `prioritized`, proportionally to the priorities of the
+        transitions (prioritized experience replay, Schaul et al. 2016), given by their last TD errors.
+        Transitions appended with `warm_start=True` before any other (e.g. from a rule-based policy) stay in the
+        memory until it is reset, if `keep_warm_start`, instead of being overwritten like the others.
+    """
+
+    def __init__(self, max_size, device=None, prioritized=False, alpha=0.6, beta=0.4, beta_increment=0., eps=1e-6,
+                 keep_warm_start=False):
+        """
+        :param alpha: float, how much the priorities count, 0 is uniform sampling
+        :param beta: float, initial importance sampling exponent, raised by `beta_increment` per batch up to 1
+        :param eps: float, added to the absolute TD errors so that every transition can be sampled
+        """
+        self.max_size = max_size
+        self.device = torch.device('cpu') if device is None else torch.device(device)
+        self.prioritized = prioritized
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.keep_warm_start = keep_warm_start
+        self.tensors = None
+        self.tree = SumTree(max_size) if prioritized else None
+        self.reset()
+
+    def reset(self, keep_warm_start=False):
+        """remove all transitions, but the kept warm start ones if `keep_warm_start`"""
+        if not keep_warm_start:
+            self.num_warm_start = 0
+        self.index = 0
+        self.num_ring = 0
+        self.max_priority = 1.
+        if self.tree is not None:
+            self.tree.tree[:] = 0.
+            if self.num_warm_start:
+                self.tree.update(np.arange(self.num_warm_start), self.max_priority ** self.alpha)
+
+    def _allocate(self, fields):
+        self.tensors = Transition(*[torch.zeros((self.max_size,) + field.shape[1:], device=self.device)
+                                    for field in fields])
+
+    def _write(self, fields, warm_start=False):
+        num = len(fields[0])
+        if num == 0:
+            return
+        if self.tensors is None:
+            self._allocate(fields)
+        if warm_start and self.keep_warm_start and self.num_ring == 0:
+            # kept transitions fill the slots before the ring, at most half of the memory
+            kept = min(num, self.max_size // 2 - self.num_warm_start)
+            if kept > 0:
+                self._store(np.arange(self.num_warm_start, self.num_warm_start + kept), [f[:kept] for f in fields])
+                self.num_warm_start += kept
+                fields = [f[kept:] for f in fields]
+                num -= kept
+
+        ring_size = self.max_size - self.num_warm_start
+        if num > ring_size:
+            # only the last transitions would be left
+            self.index = (self.index + num - ring_size) % ring_size
+            fields = [f[num - ring_size:] for f in fields]
+            num = ring_size
+        if num:
+            self._store(self.num_warm_start + (self.index + np.arange(num)) % ring_size, fields)
+            self.index = (self.index + num) % ring_size
+            self.num_ring = min(self.num_ring + num, ring_size)
+
+    def _store(self, slots, fields):
+        index = torch.from_numpy(slots).to(self.device)
+        for tensor, field in zip(self.tensors, fields):
+            tensor[index] = torch.as_tensor(field, dtype=tensor.dtype).to(self.device)
+        if self.tree is not None:
+            # new transitions are sampled at least once with high probability
+            self.tree.update(slots, self.max_priority ** self.alpha)
+
+    def push(self, *args, warm_start=False):
+        """Saves a transition."""
+        self._write([np.asarray(field, dtype=np.float32)[None] for field in args], warm_start)
+
+    def append(self, new_memory, warm_start=False):
+        """
+        Saves the transitions of a Memory (or MemoryReplay) in order.
+        :param warm_start: bool, the transitions come from warm start, e.g. a rule-based policy
+        """
+        if len(new_memory.memory) == 0:
+            return
+        fields = [np.stack(field).astype(np.float32) for field in zip(*new_memory.memory)]
+        self._write(fields, warm_start)
+
+    def sample(self, batch_size):
+        """
+        :return: batch: Transition of tensors [batch_size, ...] on the device of the memory,
+                 slots: LongTensor [batch_size], where the transitions are stored, for `update_priorities`,
+                 weights: Tensor [batch_size], importance sampling weights, None if not prioritized
+        """
+        size = len(self)
+        if not self.prioritized:
+            slots = torch.randint(size, (batch_size,), device=self.device)
+            weights = None
+        else:
+            # one value from each of `batch_size` equal parts of the total priority
+            total = self.tree.total()
+            bounds = np.linspace(0., total, batch_size + 1)
+            found = np.minimum(self.tree.find(np.random.uniform(bounds[:-1], bounds[1:])), size - 1)
+            probs = self.tree.get(found) / total
+            weights = (size * probs) ** -self.beta
+            weights = torch.as_tensor(weights / weights.max(), dtype=torch.float32, device=self.device)
+            self.beta = min(1., self.beta + self.beta_increment)
+            slots = torch.from_numpy(found).to(self.device)
+        batch = Transition(*[tensor.index_select(0, slots) for tensor in self.tensors])
+        return batch, slots, weights
+
+    def update_priorities(self, slots, td_errors):
+        """set the priorities of the sampled transitions `slots` from their new TD errors"""
+        priorities = np.abs(torch.as_tensor(td_errors).detach().cpu().numpy()) + self.eps
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(torch.as_tensor(slots).cpu().numpy(), priorities ** self.alpha)
+
+    def get_batch(self, batch_size=None):
+        if batch_size is None:
+            return Transition(*[tensor[:len(self)] for tensor in self.tensors])
+        return self.sample(batch_size)[0]
+
+    def __len__(self):
+        return self.num_warm_start + self.num_ring
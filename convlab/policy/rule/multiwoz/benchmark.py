@@ -0,0 +1,128 @@
+"""
+Measure the speed of the agenda-based user simulator on the dialogue act level.
+
+    python -m convlab.policy.rule.multiwoz.benchmark --num_dialogues 1000 --seed 0
+
+The user talks to a random system that answers with acts about the domains and values the user mentioned. Goals
+are sampled before timing and every dialogue is seeded, so the printed digest of the dialogues is the same for
+every implementation of the agenda that behaves the same: run it before and after a change and compare the digests
+as well as the turns/s.
+"""
+import hashlib
+import json
+import random
+import time
+from argparse import ArgumentParser
+from copy import deepcopy
+
+import numpy as np
+
+MAX_TURNS = 20
+
+
+class RandomSystem:
+    """
+    System that answers with random acts. It draws from its own random generator, so it does not change the random
+    state the user simulator sees.
+    """
+    INTENTS = ['inform', 'request', 'recommend', 'select', 'nooffer', 'nobook', 'offerbook', 'offerbooked', 'book']
+    GENERAL_INTENTS = ['reqmore', 'welcome', 'bye', 'greet']
+    FREE_VALUES = ['09:15', '12:30', '17:45', '1', '2', '5', '0', 'zero', 'none', 'yes', 'no', 'centre', 'cheap',
+                   'the lucky star', 'cambridge', '3 minutes']
+
+    def __init__(self):
+        from convlab.util import relative_import_module_from_unified_datasets
+        ontology = relative_import_module_from_unified_datasets('multiwoz21', 'preprocess.py', 'ontology')
+        self.slots = {domain: list(info['slots']) for domain, info in ontology['domains'].items() if info['slots']}
+        self.values = {(domain, slot): slot_info['possible_values']
+                       for domain, info in ontology['domains'].items()
+                       for slot, slot_info in info['slots'].items() if slot_info.get('possible_values')}
+        self.rng = random.Random()
+
+    def init_session(self, seed):
+        self.rng.seed(seed)
+
+    def response(self, user_act):
+        rng = self.rng
+        informed = {}
+        for intent, domain, slot, value in user_act:
+            if domain in self.slots:
+                informed.setdefault(domain, {})
+                if intent == 'inform' and slot:
+                    informed[domain][slot] = value
+        domains = list(informed) or list(self.slots)
+
+        sys_act = []
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.1:
+                sys_act.append([rng.choice(self.GENERAL_INTENTS), 'general', '', ''])
+                continue
+            domain = rng.choice(domains)
+            intent = rng.choice(self.INTENTS)
+            slot = rng.choice(self.slots[domain])
+            if intent == 'request':
+                value = ''
+            elif slot in informed.get(domain, {}) and rng.random() < 0.5:
+                value = informed[domain][slot]
+            else:
+                value = rng.choice(self.values.get((domain, slot), self.FREE_VALUES))
+            sys_act.append([intent, domain, slot, value])
+        return sys_act
+
+
+def run_benchmark(user_policy, num_dialogues, seed=0, max_turns=MAX_TURNS):
+    """
+    Let `user_policy` talk to a RandomSystem on `num_dialogues` goals sampled with `seed`.
+    Returns:
+        stats (dict): number of turns, turns/s of the user policy and a digest of the dialogues
+    """
+    from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import Goal
+
+    random.seed(seed)
+    np.random.seed(seed)
+    goals = [Goal(user_policy.goal_generator) for _ in range(num_dialogues)]
+    system = RandomSystem()
+
+    digest = hashlib.md5()
+    turns = 0
+    user_time = 0.
+    for i, goal in enumerate(goals):
+        random.seed(seed + i)
+        np.random.seed(seed + i)
+        system.init_session(seed + i)
+        start = time.perf_counter()
+        user_policy.init_session(goal=deepcopy(goal))
+        user_act = user_policy.predict([])
+        user_time += time.perf_counter() - start
+        dialogue = [user_act]
+        for _ in range(max_turns):
+            sys_act = system.response(user_act)
+            start = time.perf_counter()
+            user_act = user_policy.predict(sys_act)
+            terminated = user_policy.is_terminated()
+            user_time += time.perf_counter() - start
+            dialogue += [sys_act, user_act]
+            turns += 1
+            if terminated:
+                break
+        digest.update(json.dumps([dialogue, user_policy.goal.domain_goals], sort_keys=True).encode('utf-8'))
+
+    return {'dialogues': num_dialogues, 'turns': turns, 'turns/s': turns / user_time, 'digest': digest.hexdigest()}
+
+
+def main():
+    from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import UserPolicyAgendaMultiWoz
+
+    parser = ArgumentParser()
+    parser.add_argument('--num_dialogues', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max_turns', type=int, default=MAX_TURNS)
+    args = parser.parse_args()
+
+    stats = run_benchmark(UserPolicyAgendaMultiWoz(), args.num_dialogues, args.seed, args.max_turns)
+    print(f"{stats['dialogues']} dialogues, {stats['turns']} turns, {stats['turns/s']:.1f} turns/s")
+    print(f"digest: {stats['digest']}")
+
+
+if __name__ == '__main__':
+    main()
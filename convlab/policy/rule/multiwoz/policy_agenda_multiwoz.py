@@ -12,6 +12,8 @@ import os
 import random
 import re
 import logging
+from collections import Counter
+from functools import lru_cache
 
 from convlab.policy.policy import Policy
 from convlab.task.multiwoz.goal_generator import GoalGenerator
@@ -65,12 +67,28 @@ REF_SYS_DA_M['taxi']['car'] = 'car type'
 BOOK_SLOT = ['people', 'day', 'stay', 'time']
 
 
+@lru_cache(maxsize=None)
+def _sys_act_in(act):
+    """lower-cased system act and the slot mapping of its domain, None if the domain is unknown"""
+    (dom, intent) = act.lower().split('-')
+    return act.lower(), dom, intent, REF_SYS_DA_M.get(dom)
+
+
+@lru_cache(maxsize=None)
+def _usr_act_out(act):
+    """capitalized user act and the slot mapping of its domain"""
+    (dom, intent) = act.split('-')
+    return dom.capitalize() + '-' + intent.capitalize(), REF_USR_DA_M[dom.capitalize()]
+
+
 class UserPolicyAgendaMultiWoz(Policy):
     """ The rule-based user policy model by agenda. Derived from the UserPolicy class """
 
     # load stand value
     with open(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir, os.pardir, 'data/multiwoz/value_set.json')) as f:
         stand_value_dict = json.load(f)
+    # (domain, slot) -> standard values with their lower-cased forms, built on first use
+    _value_tables = {}
 
     def __init__(self):
         """
@@ -189,12 +207,10 @@ class UserPolicyAgendaMultiWoz(Policy):
         for act in action.keys():
             if '-' in act:
                 if 'general' not in act:
-                    (dom, intent) = act.split('-')
-                    new_act = dom.capitalize() + '-' + intent.capitalize()
+                    new_act, slot_map = _usr_act_out(act)
                     new_action[new_act] = []
                     for pairs in action[act]:
-                        slot = REF_USR_DA_M[dom.capitalize()].get(
-                            pairs[0], None)
+                        slot = slot_map.get(pairs[0], None)
                         if pairs[0] == 'none' and pairs[1] == 'none':
                             new_action[new_act].append(['none', 'none'])
                         elif pairs[0] == 'choice' and pairs[1] == 'any':
@@ -225,8 +241,8 @@ class UserPolicyAgendaMultiWoz(Policy):
                 continue
 
             if 'general' not in act:
-                (dom, intent) = act.lower().split('-')
-                if dom in REF_SYS_DA_M.keys():
+                act_lower, dom, intent, slot_map = _sys_act_in(act)
+                if slot_map is not None:
                     new_list = []
                     for pairs in action[act]:
                         if (not isinstance(pairs, list) and not isinstance(pairs, tuple)) or \
@@ -235,56 +251,78 @@ class UserPolicyAgendaMultiWoz(Policy):
                             logging.debug('illegal pairs: {}'.format(pairs))
                             continue
 
-                        if REF_SYS_DA_M[dom].get(pairs[0].lower(), None) is not None:
-                            new_list.append([REF_SYS_DA_M[dom][pairs[0].lower()],
-                                             cls._normalize_value(dom, intent, REF_SYS_DA_M[dom][pairs[0].lower()], pairs[1])])
+                        slot = slot_map.get(pairs[0].lower(), None)
+                        if slot is not None:
+                            new_list.append([slot, cls._normalize_value(dom, intent, slot, pairs[1])])
 
                     if len(new_list) > 0:
-                        new_action[act.lower()] = new_list
+                        new_action[act_lower] = new_list
             else:
                 new_action[act.lower()] = action[act]
 
         return new_action
 
+    @classmethod
+    def _value_table(cls, domain, slot):
+        """
+        Standard values of a slot, None if the slot has no standard values.
+        Returns:
+            (value set, value_list, value_list with normalized whitespace) where value_list is sorted.
+        """
+        key = (domain, slot)
+        if key not in cls._value_tables:
+            table = None
+            if domain in cls.stand_value_dict and slot in cls.stand_value_dict[domain]:
+                value_list = cls.stand_value_dict[domain][slot]
+                low_value_list = [item.lower() for item in value_list]
+                value_list = sorted(list(set(value_list) | set(low_value_list)))
+                table = (set(value_list), value_list, [' '.join(val.split()) for val in value_list])
+            cls._value_tables[key] = table
+        return cls._value_tables[key]
+
     @classmethod
     def _normalize_value(cls, domain, intent, slot, value):
         if intent == 'request':
             return DEF_VAL_UNK
 
-        if domain not in cls.stand_value_dict.keys():
-            return value
-
-        if slot not in cls.stand_value_dict[domain]:
+        table = cls._value_table(domain, slot)
+        if table is None:
             return value
 
         if slot in ['parking', 'internet'] and value == 'none':
             return 'yes'
 
-        value_list = cls.stand_value_dict[domain][slot]
-        low_value_list = [item.lower() for item in value_list]
-        value_list = sorted(list(set(value_list) | set(low_value_list)))
-        if value not in value_list:
-            normalized_v = simple_fuzzy_match(value_list, value)
-            if normalized_v is not None:
-                return normalized_v
-            # try some transformations
-            cand_values = transform_value(value)
-            for cv in cand_values:
-                _nv = simple_fuzzy_match(value_list, cv)
-                if _nv is not None:
-                    return _nv
-            if check_if_time(value):
-                return value
-            if value in ['none']:
-                logging.debug(
-                    'Value [none] invalid! (Lexicalisation Error) (slot: %s domain: %s)' % (slot, domain))
-                return 'none'
-            if slot in ['phone']:
-                return value
-
-            logging.debug('Value not found in standard value set: [%s] (slot: %s domain: %s)' % (
-                value, slot, domain))
+        if value not in table[0]:
+            return _match_value(domain, slot, value, cls)
+        return value
+
+
+@lru_cache(maxsize=10000)
+def _match_value(domain, slot, value, policy_cls):
+    # normalize a value that is not a standard value of the slot, results are cached as the system mostly
+    # repeats the same values
+    _, value_list, norm_value_list = policy_cls._value_table(domain, slot)
+    normalized_v = _fuzzy_match(norm_value_list, value)
+    if normalized_v is not None:
+        return normalized_v
+    # try some transformations
+    cand_values = transform_value(value)
+    for cv in cand_values:
+        _nv = _fuzzy_match(norm_value_list, cv)
+        if _nv is not None:
+            return _nv
+    if check_if_time(value):
         return value
+    if value in ['none']:
+        logging.debug(
+            'Value [none] invalid! (Lexicalisation Error) (slot: %s domain: %s)' % (slot, domain))
+        return 'none'
+    if slot in ['phone']:
+        return value
+
+    logging.debug('Value not found in standard value set: [%s] (slot: %s domain: %s)' % (
+        value, slot, domain))
+    return value
 
 
 def transform_value(value):
@@ -299,18 +337,20 @@ def transform_value(value):
 
 
 def simple_fuzzy_match(value_list, value):
-    # check contain relation
+    return _fuzzy_match([' '.join(val.split()) for val in value_list], value)
+
+
+def _fuzzy_match(norm_value_list, value):
+    # check contain relation, norm_value_list holds the candidates with normalized whitespace
     v0 = ' '.join(value.split())
     v0N = ''.join(value.split())
-    for val in value_list:
-        v1 = ' '.join(val.split())
+    for v1 in norm_value_list:
         if v0 in v1 or v1 in v0 or v0N in v1 or v1 in v0N:
             return v1
     value = value.lower()
     v0 = ' '.join(value.split())
     v0N = ''.join(value.split())
-    for val in value_list:
-        v1 = ' '.join(val.split())
+    for v1 in norm_value_list:
         if v0 in v1 or v1 in v0 or v0N in v1 or v1 in v0N:
             return v1
     return None
@@ -327,21 +367,20 @@ def check_if_time(value):
     return True
 
 
+@lru_cache(maxsize=10000)
+def _clock_value(value):
+    # '13:45' -> 1345, raises for values that are no time
+    parts = value.split(':')
+    return int(parts[0]) * 100 + int(parts[1])
+
+
 def check_constraint(slot, val_usr, val_sys):
     try:
         if slot == 'arriveBy':
-            val1 = int(val_usr.split(':')[0]) * \
-                100 + int(val_usr.split(':')[1])
-            val2 = int(val_sys.split(':')[0]) * \
-                100 + int(val_sys.split(':')[1])
-            if val1 < val2:
+            if _clock_value(val_usr) < _clock_value(val_sys):
                 return True
         elif slot == 'leaveAt':
-            val1 = int(val_usr.split(':')[0]) * \
-                100 + int(val_usr.split(':')[1])
-            val2 = int(val_sys.split(':')[0]) * \
-                100 + int(val_sys.split(':')[1])
-            if val1 > val2:
+            if _clock_value(val_usr) > _clock_value(val_sys):
                 return True
         else:
             if val_usr != val_sys:
@@ -445,13 +484,18 @@ class Agenda(object):
         """
 
         def random_sample(data, minimum=0, maximum=1000):
-            return random.sample(data, random.randint(min(len(data), minimum), min(len(data), maximum)))
+            return random.sample(list(data), random.randint(min(len(data), minimum), min(len(data), maximum)))
 
         self.CLOSE_ACT = 'general-bye'
         self.HELLO_ACT = 'general-greet'
         self.__cur_push_num = 0
         self.domains = {}
         self.__stack = []
+        # number of stack items per (diaact, slot), per diaact and per (diaact, slot is a booking slot), so that
+        # membership checks do not scan the stack
+        self.__slot_count = Counter()
+        self.__diaact_count = Counter()
+        self.__book_count = Counter()
 
         # there is a 'bye' action at the bottom of the stack
         self.__push(self.CLOSE_ACT)
@@ -611,6 +655,9 @@ class Agenda(object):
     def close_session(self):
         """ Clear up all actions """
         self.__stack = []
+        self.__slot_count.clear()
+        self.__diaact_count.clear()
+        self.__book_count.clear()
         self.__cur_push_num = 0
         self.__push(self.CLOSE_ACT)
 
@@ -835,14 +882,19 @@ class Agenda(object):
                 self.cur_domain = domain
 
     def _remove_item(self, diaact, slot=DEF_VAL_UNK):
-        for idx in range(len(self.__stack)):
-            if 'general' in diaact:
-                if self.__stack[idx]['diaact'] == diaact:
-                    self.__stack.remove(self.__stack[idx])
+        if 'general' in diaact:
+            if not self.__diaact_count[diaact]:
+                return
+            for idx, item in enumerate(self.__stack):
+                if item['diaact'] == diaact:
+                    self.__delete(idx)
                     break
-            else:
-                if self.__stack[idx]['diaact'] == diaact and self.__stack[idx]['slot'] == slot:
-                    self.__stack.remove(self.__stack[idx])
+        else:
+            if not self.__slot_count[(diaact, slot)]:
+                return
+            for idx, item in enumerate(self.__stack):
+                if item['diaact'] == diaact and item['slot'] == slot:
+                    self.__delete(idx)
                     break
 
     def _push_item(self, diaact, slot=DEF_VAL_NUL, value=DEF_VAL_NUL):
@@ -851,32 +903,28 @@ class Agenda(object):
         self.__cur_push_num += 1
 
     def _check_item(self, diaact, slot=None):
-        for idx in range(len(self.__stack)):
-            if slot is None:
-                if self.__stack[idx]['diaact'] == diaact:
-                    return True
-            else:
-                if self.__stack[idx]['diaact'] == diaact and self.__stack[idx]['slot'] == slot:
-                    return True
-        return False
+        if slot is None:
+            return self.__diaact_count[diaact] > 0
+        return self.__slot_count[(diaact, slot)] > 0
 
     def _check_reqt(self, domain):
-        for idx in range(len(self.__stack)):
-            if self.__stack[idx]['diaact'] == domain + '-request':
-                return True
-        return False
+        return self.__diaact_count[domain + '-request'] > 0
 
     def _check_reqt_info(self, domain):
-        for idx in range(len(self.__stack)):
-            if self.__stack[idx]['diaact'] == domain + '-inform' and self.__stack[idx]['slot'] not in BOOK_SLOT:
-                return True
-        return False
+        return self.__book_count[(domain + '-inform', False)] > 0
 
     def _check_book_info(self, domain):
-        for idx in range(len(self.__stack)):
-            if self.__stack[idx]['diaact'] == domain + '-inform' and self.__stack[idx]['slot'] in BOOK_SLOT:
-                return True
-        return False
+        return self.__book_count[(domain + '-inform', True)] > 0
+
+    def __count(self, item, num):
+        self.__slot_count[(item['diaact'], item['slot'])] += num
+        self.__diaact_count[item['diaact']] += num
+        self.__book_count[(item['diaact'], item['slot'] in BOOK_SLOT)] += num
+
+    def __delete(self, idx):
+        item = self.__stack.pop(idx)
+        self.__count(item, -1)
+        return item
 
     def __check_next_diaact_slot(self):
         if len(self.__stack) > 0:
@@ -902,7 +950,9 @@ class Agenda(object):
                     elif slot == 'area':
                         item['value'] = 'same area as the {}'.format(
                             diaact.split('-')[0])
-        self.__stack.append({'diaact': diaact, 'slot': slot, 'value': value})
+        item = {'diaact': diaact, 'slot': slot, 'value': value}
+        self.__stack.append(item)
+        self.__count(item, 1)
 
     def __pop(self, initiative=1):
         diaacts = []
@@ -913,7 +963,7 @@ class Agenda(object):
         if p_diaact.split('-')[1] == 'inform' and p_slot in BOOK_SLOT:
             for _ in range(10 if self.__cur_push_num == 0 else self.__cur_push_num):
                 try:
-                    item = self.__stack.pop(-1)
+                    item = self.__delete(-1)
                     diaacts.append(item['diaact'])
                     slots.append(item['slot'])
                     values.append(item['value'])
@@ -936,7 +986,7 @@ class Agenda(object):
                 num2pop = self.__cur_push_num
             for _ in range(num2pop):
                 try:
-                    item = self.__stack.pop(-1)
+                    item = self.__delete(-1)
                     diaacts.append(item['diaact'])
                     slots.append(item['slot'])
                     values.append(item['value'])
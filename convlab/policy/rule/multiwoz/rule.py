@@ -1,11 +1,8 @@
 # -*- coding: utf-8 -*-
-import torch
 from convlab.policy.policy import Policy
 from convlab.policy.rule.multiwoz.rule_based_multiwoz_bot import RuleBasedMultiwozBot
 from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import UserPolicyAgendaMultiWoz
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-
 
 class RulePolicy(Policy):
 
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Check that every backend of the evaluation engine gives the same per-goal results as the dialogue loop
+custom_util.evaluate ran before the engine existed.
+
+    python -m pytest convlab/policy/test_eval_engine.py
+    python -m convlab.policy.test_eval_engine
+"""
+import os
+from copy import deepcopy
+
+from convlab.policy.eval_engine import EvaluationEngine, build_backend
+from convlab.util.custom_util import create_goals, env_config, get_config, set_seed
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ppo', 'configs', 'RuleUser-Semantic-RuleDST.json')
+NUM_DIALOGUES = 8
+KEYS = ['complete', 'success', 'success_strict', 'total_return', 'evaluator_return', 'turns']
+
+
+def build_sess():
+    """a RuleDST + PPO system (randomly initialised with seed 0, no vectoriser state) and the agenda user"""
+    from convlab.policy.ppo import PPO
+    conf = get_config(CONFIG, [])
+    policy_sys = PPO(is_train=False, seed=0, vectorizer=conf['vectorizer_sys_activated'])
+    _, sess = env_config(conf, policy_sys)
+    return sess
+
+
+def build_goals(num_goals=NUM_DIALOGUES):
+    from convlab.task.multiwoz.goal_generator import GoalGenerator
+    goal_generator = GoalGenerator()
+    goals = []
+    for seed in range(1000, 1000 + num_goals):
+        set_seed(seed)
+        goals.append(create_goals(goal_generator, 1, False, None)[0])
+    return goals
+
+
+def old_loop(sess, goals):
+    """the loop of custom_util.evaluate before the evaluation engine, dialogue with seed 1000 + i on goals[-1 - i]"""
+    goals = deepcopy(goals)
+    results = []
+    for seed in range(1000, 1000 + len(goals)):
+        set_seed(seed)
+        sess.init_session(goal=goals.pop())
+        sys_response = [] if sess.sys_agent.nlg is None else ''
+        turns = 0
+        evaluator_return = 0.
+        complete, success, success_strict = 0, 0, 0
+        for _ in range(40):
+            sys_response, user_response, session_over, reward = sess.next_turn(sys_response)
+            turns += 1
+            evaluator_return += sess.evaluator.get_reward(session_over)
+            if session_over is True:
+                sess.evaluator.task_success()
+                complete = sess.evaluator.complete
+                success = sess.evaluator.success
+                success_strict = sess.evaluator.success_strict
+                break
+        results.append({'complete': complete, 'success': success, 'success_strict': success_strict,
+                        'total_return': (80 if success_strict else -40) - turns,
+                        'evaluator_return': evaluator_return, 'turns': turns})
+    return results
+
+
+def run_backend(sess, goals, backend):
+    engine = EvaluationEngine(build_backend(sess, backend, num_workers=2, batch_size=3))
+    try:
+        # the order of eval_policy and custom_util.evaluate
+        return engine.run(goals[::-1])
+    finally:
+        engine.close()
+
+
+def test_backends_match_old_loop(backends=('inprocess', 'pool', 'batched')):
+    sess = build_sess()
+    goals = build_goals()
+    expected = old_loop(sess, goals)
+    for backend in backends:
+        results = run_backend(sess, goals, backend)
+        assert len(results) == len(expected), backend
+        for i, (result, old) in enumerate(zip(results, expected)):
+            assert {key: result[key] for key in KEYS} == old, f'{backend} backend, dialogue {i}'
+
+
+if __name__ == '__main__':
+    test_backends_match_old_loop()
+    print('all backends match the old evaluation loop')
@@ -3,6 +3,7 @@ import os
 import random
 from copy import deepcopy
 
+import numpy as np
 import torch
 from convlab.policy.policy import Policy
 from convlab.policy.tus.multiwoz.transformer import TransformerActionPrediction
@@ -72,6 +73,41 @@ class UserActionPolicy(Policy):
                 return False
 
     def predict(self, sys_dialog_act, mode="max"):
+        return self.predict_batch([self], [sys_dialog_act], mode)[0]
+
+    @staticmethod
+    def predict_batch(users, sys_dialog_acts, mode="max"):
+        """
+        Predict the actions of several users, e.g. of parallel dialogues, with one forward pass of the model of the
+        first user, which the users have to share.
+        Args:
+            users (list): UserActionPolicy
+            sys_dialog_acts (list): the system action of each user
+        Returns:
+            the user action of each user
+        """
+        actions = [None] * len(users)
+        features, masks, pending = [], [], []
+        for i, (user, sys_dialog_act) in enumerate(zip(users, sys_dialog_acts)):
+            inputs = user._prepare_input(sys_dialog_act)
+            if inputs is None:
+                actions[i] = [["bye", "general", "none", "none"]]
+            else:
+                features.append(inputs[0])
+                masks.append(inputs[1])
+                pending.append(i)
+        if not pending:
+            return actions
+
+        feature = torch.from_numpy(np.stack(features)).to(DEVICE)
+        mask = torch.from_numpy(np.stack(masks)).to(DEVICE)
+        with torch.no_grad():
+            usr_output = users[pending[0]].user.forward(feature, mask)
+        for row, i in enumerate(pending):
+            actions[i] = users[i]._respond(usr_output[row:row + 1], mode)
+        return actions
+
+    def _prepare_input(self, sys_dialog_act):
         # update goal
         self.predict_action_list = self.goal.action_list(sys_dialog_act)
         cur_state = self.goal.update(action=sys_dialog_act, char="system")
@@ -79,7 +115,7 @@ class UserActionPolicy(Policy):
 
         # need better way to handle this
         if self._no_offer(sys_dialog_act):
-            return [["bye", "general", "none", "none"]]
+            return None
 
         # update constraint
         self.time_step += 2
@@ -91,12 +127,11 @@ class UserActionPolicy(Policy):
             pre_state=self.sys_history_state,
             sys_action=sys_dialog_act,
             usr_action=self.pre_usr_act)
-        feature = torch.tensor([feature], dtype=torch.float).to(DEVICE)
-        mask = torch.tensor([mask], dtype=torch.bool).to(DEVICE)
 
         self.sys_history_state = cur_state
+        return feature, mask
 
-        usr_output = self.user.forward(feature, mask)
+    def _respond(self, usr_output, mode="max"):
         usr_action = self.transform_usr_act(
             usr_output, self.predict_action_list, mode)
         domains = [act[1] for act in usr_action]
@@ -2,6 +2,7 @@ import json
 import os
 from collections import Counter
 
+import numpy as np
 import torch
 from convlab.policy.tus.unify.Goal import Goal
 from convlab.policy.tus.unify.util import parse_dialogue_act, parse_user_goal, metadata2state, int2onehot, create_goal, split_slot_name
@@ -109,15 +110,70 @@ class TUSDataManager(Dataset):
         for label in feature["label"]:
             label_distribution += Counter(label)
         print(label_distribution)
-        feature["input"] = torch.tensor(feature["input"], dtype=torch.float)
+        feature["input"] = torch.from_numpy(np.stack(feature["input"]))
         feature["label"] = torch.tensor(feature["label"], dtype=torch.long)
-        feature["mask"] = torch.tensor(feature["mask"], dtype=torch.bool)
+        feature["mask"] = torch.from_numpy(np.stack(feature["mask"]))
         feature["domain"] = torch.tensor(feature["domain"], dtype=torch.float)
         for feat_type in ["input", "label", "mask", "domain"]:
             print("{}: {}".format(feat_type, feature[feat_type].shape))
         return feature
 
 
+class FeatureWindow:
+    """
+    The slot features of the last `window` turns of a session, in a ring buffer preallocated with the first turn,
+    and the model input packed from them: the turns from the newest to the oldest, each after a special token (CLS
+    for the newest, SEP for the others), cut or zero padded to window * num_token tokens.
+    """
+
+    def __init__(self, window, num_token):
+        self.window = window
+        self.max_len = window * num_token
+        self.turns = None  # [window, max_len - 1, feat_dim]
+        self.lengths = [0] * window
+        self.num_turns = 0
+        self.input = None  # [max_len, feat_dim]
+        self.filled = 0
+
+    def __len__(self):
+        return min(self.num_turns, self.window)
+
+    def _allocate(self, feat_dim):
+        self.turns = np.zeros((self.window, self.max_len - 1, feat_dim), dtype=np.float32)
+        self.input = np.zeros((self.max_len, feat_dim), dtype=np.float32)
+
+    def push(self, feature, feat_dim):
+        """store the features (one per slot) of a new turn over the oldest one"""
+        if self.turns is None:
+            self._allocate(feat_dim)
+        index = self.num_turns % self.window
+        # slots beyond max_len - 1 never fit in the input
+        length = min(len(feature), self.max_len - 1)
+        if length:
+            self.turns[index, :length] = feature[:length]
+        self.lengths[index] = length
+        self.num_turns += 1
+
+    def pack(self, cls_token, sep_token):
+        """the model input [max_len, feat_dim], only valid until the next call"""
+        if self.input is None:
+            self._allocate(len(cls_token))
+        pos = 0
+        for age in range(len(self)):
+            if pos >= self.max_len:
+                break
+            index = (self.num_turns - 1 - age) % self.window
+            self.input[pos] = cls_token if age == 0 else sep_token
+            pos += 1
+            length = min(self.lengths[index], self.max_len - pos)
+            self.input[pos:pos + length] = self.turns[index, :length]
+            pos += length
+        # clear what is left of the previous input
+        self.input[pos:self.filled] = 0
+        self.filled = pos
+        return self.input
+
+
 class Feature:
     def __init__(self, config):
         self.config = config
@@ -138,7 +194,10 @@ class Feature:
         self.requirements = {}  # slot: fulfill
         self.pre_usr = []
         self.all_slot = None
-        self.user_feat_hist = []
+        self.user_feat_hist = FeatureWindow(self.config["window"], self.config["num_token"])
+        self.special_tokens = None
+        self.goal_feat_cache = {}
+        self.turn_action = None
         for slot in usr:
             if usr[slot] != "?":
                 self.constrains[slot] = NOT_MENTIONED
@@ -159,7 +218,10 @@ class Feature:
 
         cur = metadata2state(cur_state)
         pre = {}
-        if pre_state != None:
+        if pre_state is cur_state:
+            # the goal status is updated in place, so the previous state may be the current one
+            pre = cur
+        elif pre_state != None:
             pre = metadata2state(pre_state)
         if not self.pre_usr and not state_vectorize:
             self.pre_usr = [0] * len(all_slot)
@@ -167,46 +229,44 @@ class Feature:
         usr_act_feat = self.get_user_action_feat(
             all_slot, user_goal, usr_action)
 
+        self.turn_action = self.prepare_action(sys_action)
         for slot in all_slot:
             feat = self.slot_feature(
                 slot, usr, cur, pre, sys_action, usr_act_feat)
             feature.append(feat)
+        self.turn_action = None
 
         if not state_vectorize:
-            self.user_feat_hist.append(feature)
+            self.user_feat_hist.push(feature, len(self._special_tokens()[0]))
 
-        feature, mask = self.pad_feature(max_memory=self.config["window"])
+        feature, mask = self.pad_feature()
 
         return feature, mask
 
-    def slot_feature(self, slot, user_goal, current_state, previous_state, sys_action, usr_action):
-        pass
+    def prepare_action(self, sys_action):
+        """what slot_feature needs of the system action of a turn, computed once for all slots"""
+        return None
 
-    def pad_feature(self, max_memory=5):
-        feature = []
-        num_feat = len(self.user_feat_hist)
+    def _special_tokens(self):
+        if self.special_tokens is None:
+            self.special_tokens = (self.slot_feature("CLS", {}, {}, {}, [], []),
+                                   self.slot_feature("SEP", {}, {}, {}, [], []))
+        return self.special_tokens
 
-        feat_dim = len(self.user_feat_hist[0][0])
-
-        for feat_index in range(num_feat - 1, max(num_feat - 1 - max_memory, -1), -1):
-            if feat_index == num_feat - 1:
-                special_token = self.slot_feature(
-                    "CLS", {}, {}, {}, [], [])
-            else:
-                special_token = self.slot_feature(
-                    "SEP", {}, {}, {}, [], [])
-            feature += [special_token]
-            feature += self.user_feat_hist[feat_index]
-
-        max_len = max_memory * self.config["num_token"]
-        if len(feature) < max_len:
-            padding = [[0] * feat_dim] * (max_len - len(feature))
-            feature += padding
-            mask = [False] * len(feature) + [True] * (max_len - len(feature))
-        else:
-            mask = [False] * max_len
+    def slot_feature(self, slot, user_goal, current_state, previous_state, sys_action, usr_action):
+        pass
 
-        return feature[:max_len], mask[:max_len]
+    def pad_feature(self):
+        """
+        the features of the last turns, packed by the feature window of the session (of config["window"] turns)
+        Returns:
+            feature: float32 array [window * num_token, feat_dim]
+            mask: bool array [window * num_token], the padding is not masked
+        """
+        cls_token, sep_token = self._special_tokens()
+        feature = self.user_feat_hist.pack(cls_token, sep_token).copy()
+        mask = np.zeros(len(feature), dtype=np.bool_)
+        return feature, mask
 
     def domain_label(self, user_goal, dialog_act):
         labels = [0] * self.config["out_dim"]
@@ -310,28 +370,26 @@ class BinaryFeature(Feature):
         super().__init__(config)
 
     def slot_feature(self, slot, user_goal, current_state, previous_state, sys_action, usr_action):
+        goal_value = user_goal.get(slot, NOT_MENTIONED)
+        goal_feat, id_feat = self._goal_feature(slot, goal_value, user_goal)
         feat = []
         feat += self._special_token(slot)
         feat += self._value_representation(
             slot, current_state.get(slot, NOT_MENTIONED))
-        feat += self._value_representation(
-            slot, user_goal.get(slot, NOT_MENTIONED))
-        feat += self._is_constrain_request(slot, user_goal)
+        feat += goal_feat
         feat += self._is_fulfill(slot, user_goal)
         if self.config.get("conflict", True):
             feat += self._conflict_check(user_goal, current_state, slot)
         if self.config.get("domain_feat", False):
             # feat += self.domain_feat(slot)
-            if slot in ["CLS", "SEP"]:
-                feat += [0] * (self.goal.max_domain_len +
-                               self.goal.max_slot_len)
-            else:
-                domain_feat, slot_feat = self.goal.get_slot_id(slot)
-                feat += domain_feat + slot_feat
+            feat += id_feat
         feat += self._first_mention_detection(
             previous_state, current_state, slot)
-        feat += self._just_mention(slot, sys_action)
-        feat += self._action_representation(slot, sys_action)
+        if self.turn_action is not None and self.turn_action[0] is sys_action:
+            feat += self._prepared_action_representation(slot, self.turn_action)
+        else:
+            feat += self._just_mention(slot, sys_action)
+            feat += self._action_representation(slot, sys_action)
         # need change from 0 to domain predictor
         if slot in ["CLS", "SEP"]:
             feat += [0] * self.config["out_dim"]
@@ -339,6 +397,55 @@ class BinaryFeature(Feature):
             feat += usr_action[slot]
         return feat
 
+    def _goal_feature(self, slot, goal_value, user_goal):
+        """
+        the features of a slot given by the user goal, cached per session by slot and goal value: the value
+        representation of the goal and is_constrain/is_request, and the domain and slot id features
+        """
+        key = (slot, goal_value)
+        if key not in self.goal_feat_cache:
+            goal_feat = self._value_representation(slot, goal_value) + self._is_constrain_request(slot, user_goal)
+            if slot in ["CLS", "SEP"]:
+                id_feat = [0] * (self.goal.max_domain_len + self.goal.max_slot_len)
+            elif self.config.get("domain_feat", False):
+                domain_feat, slot_feat = self.goal.get_slot_id(slot)
+                id_feat = domain_feat + slot_feat
+            else:
+                id_feat = []
+            self.goal_feat_cache[key] = (goal_feat, id_feat)
+        return self.goal_feat_cache[key]
+
+    def prepare_action(self, sys_action):
+        """
+        group the system action of a turn once for all slots:
+        (action, slots it just mentioned, general intent vector, domain -> [(intent, slot, value)])
+        """
+        if not sys_action:
+            return None
+        mentioned = set()
+        gen_vec = [0] * len(self.general_intent)
+        domain_acts = {}
+        for intent, domain, slot, value in sys_action:
+            if domain in sys_action:
+                mentioned.add(f"{domain}-{slot}")
+            if domain == "general":
+                self._update_general_action(gen_vec, intent)
+            else:
+                domain_acts.setdefault(domain, []).append((intent, slot, value))
+        return sys_action, mentioned, gen_vec, domain_acts
+
+    def _prepared_action_representation(self, feature_slot, turn_action):
+        """_just_mention and _action_representation of a slot from the prepared system action"""
+        _, mentioned, gen_vec, domain_acts = turn_action
+        if feature_slot in ["CLS", "SEP"]:
+            return [0] + self._action_representation(feature_slot, None)
+        feat = [1] if feature_slot in mentioned else [0]
+        intent2act = {intent: [0] * 3 for intent in self.intents}
+        feature_domain, _ = split_slot_name(feature_slot)
+        for intent, slot, value in domain_acts.get(feature_domain, []):
+            self._update_intent2act(feature_slot, intent2act, feature_domain, intent, slot, value)
+        return feat + self._concatenate_action_vector(intent2act, list(gen_vec))
+
     def get_user_action_feat(self, all_slot, user_goal, usr_act):
         if usr_act:
             usr_label = self.generate_label(
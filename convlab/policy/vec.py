@@ -1,5 +1,54 @@
 # -*- coding: utf-8 -*-
 """Vector Interface"""
+import numpy as np
+
+
+def fill_rows(items, dims, fill, sparse=False, outs=None, chunk_size=1024):
+    """write the vectors of a batch of items into the rows of [N x dim] arrays
+
+    Args:
+        items (list):
+            items to vectorize, e.g. dialog states
+        dims (list of int):
+            dimension of every output
+        fill (function):
+            fill(item, *rows) writes the vectors of an item into zero-initialised rows, one row per output
+        sparse (bool):
+            return scipy.sparse.csr_matrix outputs, built chunk by chunk so that no dense [N x dim] array is needed
+        outs (list):
+            preallocated [N x dim] arrays to fill instead of new ones (None entries are allocated), ignored if sparse
+        chunk_size (int):
+            rows vectorized at a time when sparse
+    Returns:
+        outputs (list):
+            one [N x dim] array (or csr_matrix) per dim
+    """
+    num = len(items)
+    if not sparse:
+        outs = list(outs) if outs is not None else [None] * len(dims)
+        for i, dim in enumerate(dims):
+            if outs[i] is None:
+                outs[i] = np.zeros((num, dim))
+            else:
+                outs[i][:] = 0.
+        for i, item in enumerate(items):
+            fill(item, *[out[i] for out in outs])
+        return outs
+
+    from scipy import sparse as sp
+    buffers = [np.zeros((min(chunk_size, num), dim)) for dim in dims]
+    chunks = [[] for _ in dims]
+    for start in range(0, num, chunk_size):
+        chunk = items[start:start + chunk_size]
+        for buffer in buffers:
+            buffer[:] = 0.
+        for i, item in enumerate(chunk):
+            fill(item, *[buffer[i] for buffer in buffers])
+        for buffer, output_chunks in zip(buffers, chunks):
+            output_chunks.append(sp.csr_matrix(buffer[:len(chunk)]))
+    return [sp.vstack(output_chunks, format='csr') if output_chunks else sp.csr_matrix((0, dim))
+            for output_chunks, dim in zip(chunks, dims)]
+
 
 
 class Vector():
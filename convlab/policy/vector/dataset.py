@@ -1,7 +1,17 @@
+import numpy as np
+import torch
 import torch.utils.data as data
 
 
+def _to_tensor(item):
+    # rows of (memory-mapped) numpy arrays are copied, so they can be collated and moved to the device
+    if isinstance(item, np.ndarray):
+        return torch.from_numpy(np.array(item, dtype=np.float32))
+    return item
+
+
 class ActDataset(data.Dataset):
+    """states, actions and action masks, given as tensors or as numpy arrays such as np.memmap"""
     def __init__(self, s_s, a_s, m_s):
         self.s_s = s_s
         self.m_s = m_s
@@ -9,9 +19,9 @@ class ActDataset(data.Dataset):
         self.num_total = len(s_s)
     
     def __getitem__(self, index):
-        s = self.s_s[index]
-        m = self.m_s[index]
-        a = self.a_s[index]
+        s = _to_tensor(self.s_s[index])
+        m = _to_tensor(self.m_s[index])
+        a = _to_tensor(self.a_s[index])
         return s, a, m
     
     def __len__(self):
@@ -46,9 +56,9 @@ class ActStateDataset(data.Dataset):
         self.num_total = len(s_s)
     
     def __getitem__(self, index):
-        s = self.s_s[index]
-        a = self.a_s[index]
-        next_s = self.next_s[index]
+        s = _to_tensor(self.s_s[index])
+        a = _to_tensor(self.a_s[index])
+        next_s = _to_tensor(self.next_s[index])
         return s, a, next_s
     
     def __len__(self):
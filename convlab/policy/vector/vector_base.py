@@ -5,8 +5,9 @@ import numpy as np
 import logging
 import json
 
+from contextlib import contextmanager
 from copy import deepcopy
-from convlab.policy.vec import Vector
+from convlab.policy.vec import Vector, fill_rows
 from convlab.util.custom_util import flatten_acts, timeout
 from convlab.util.multiwoz.lexicalize import delexicalize_da, flat_da, deflat_da, lexicalize_da
 from convlab.util import load_ontology, load_database, load_dataset
@@ -50,6 +51,8 @@ class VectorBase(Vector):
         self.use_none = use_none
         self.requestable = ['request']
         self.informable = ['inform', 'recommend']
+        # number of DB entities per query, shared between states while set (see shared_db_counts)
+        self.db_count_cache = None
 
         self.load_attributes()
         self.get_state_dim()
@@ -207,6 +210,44 @@ class VectorBase(Vector):
         """
         raise NotImplementedError
 
+    def state_vectorize_into(self, state, state_vec, mask):
+        """write the vector and action mask of a state into zero-initialised rows, see state_vectorize"""
+        state_vec[:], mask[:] = self.state_vectorize(state)
+
+    def state_vectorize_batch(self, states, sparse=False, out=None, mask_out=None):
+        """vectorize a batch of states, DB queries with the same constraints are only run once
+        Args:
+            states (list):
+                Dialog states
+            sparse (bool):
+                return scipy.sparse.csr_matrix instead of dense arrays
+            out (np.array):
+                optional preallocated [N x state_dim] array to fill
+            mask_out (np.array):
+                optional preallocated [N x da_dim] array to fill
+        Returns:
+            state_vecs ([N x state_dim] np.array):
+                Dialog state vectors
+            masks ([N x da_dim] np.array):
+                Action masks
+        """
+        with self.shared_db_counts():
+            state_vecs, masks = fill_rows(states, [self.state_dim, self.da_dim], self.state_vectorize_into,
+                                          sparse, [out, mask_out])
+        return state_vecs, masks
+
+    @contextmanager
+    def shared_db_counts(self):
+        """share the number of DB entities between states with the same constraints while in this context"""
+        if self.db_count_cache is not None:
+            yield
+            return
+        self.db_count_cache = {}
+        try:
+            yield
+        finally:
+            self.db_count_cache = None
+
     def add_values_to_act(self, domain, intent, slot, system):
         '''
         The ontology does not contain information about the value of an act. This method will add the value and
@@ -316,6 +357,37 @@ class VectorBase(Vector):
             return []
         return self.db.query(domain, state, topk=10)
 
+    def db_query_key(self, domain):
+        """
+        key of everything dbquery_domain depends on, None if the result must not be shared
+        Args:
+            domain string:
+                domain to query
+        Returns:
+            key tuple:
+                hashable key or None
+        """
+        if domain == 'taxi':
+            # taxi entities are sampled
+            return None
+        return domain, tuple(self.state.get(domain, {}).items())
+
+    def count_entities(self, domain):
+        """number of entities dbquery_domain returns, looked up in db_count_cache when it is set"""
+        if self.db_count_cache is None:
+            return len(self.dbquery_domain(domain))
+        key = self.db_query_key(domain)
+        try:
+            if key is not None and key in self.db_count_cache:
+                return self.db_count_cache[key]
+        except TypeError:
+            # unhashable values in the state
+            key = None
+        num = len(self.dbquery_domain(domain))
+        if key is not None:
+            self.db_count_cache[key] = num
+        return num
+
     def find_nooffer_slot(self, domain):
         """
         Function used to find which user constraint results in no entities being found
@@ -355,15 +427,35 @@ class VectorBase(Vector):
         return 'none'
 
     def action_vectorize(self, action):
-        action = delexicalize_da(action, self.requestable)
-        #action = flat_da(action)
         act_vec = np.zeros(self.da_dim)
+        self.action_vectorize_into(action, act_vec)
+        return act_vec
 
+    def action_vectorize_into(self, action, act_vec):
+        """write the vector of an action into a zero-initialised row"""
+        action = delexicalize_da(action, self.requestable)
+        #action = flat_da(action)
         for da in action:
             da = tuple([a.lower() for a in da])
             if da in self.act2vec:
                 act_vec[self.act2vec[da]] = 1.
-        return act_vec
+
+    def action_vectorize_batch(self, actions, sparse=False, out=None):
+        """
+        vectorize a batch of actions
+        Args:
+            actions (list):
+                Dialog acts
+            sparse (bool):
+                return a scipy.sparse.csr_matrix instead of a dense array
+            out (np.array):
+                optional preallocated [N x da_dim] array to fill
+        Returns:
+            act_vecs ([N x da_dim] np.array):
+                Action vectors
+        """
+        act_vecs, = fill_rows(actions, [self.da_dim], self.action_vectorize_into, sparse, [out])
+        return act_vecs
 
     def action_devectorize(self, action_vec):
         """
@@ -507,10 +599,10 @@ class VectorBase(Vector):
         pointer_vector = np.zeros(6 * len(self.db_domains))
         number_entities_dict = {}
         for domain in self.db_domains:
-            entities = self.dbquery_domain(domain)
-            number_entities_dict[domain] = len(entities)
+            num_entities = self.count_entities(domain)
+            number_entities_dict[domain] = num_entities
             pointer_vector = self.one_hot_vector(
-                len(entities), domain, pointer_vector)
+                num_entities, domain, pointer_vector)
 
         return pointer_vector, number_entities_dict
 
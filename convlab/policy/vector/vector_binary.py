@@ -5,12 +5,31 @@ from convlab.util.multiwoz.lexicalize import delexicalize_da, flat_da
 from .vector_base import VectorBase
 
 
+def freeze(value):
+    """hashable, comparable snapshot of a (nested) state entry, later in-place changes of the state don't affect it"""
+    if isinstance(value, dict):
+        return tuple((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if hasattr(value, 'tolist'):
+        # numpy arrays and tensors
+        return freeze(value.tolist())
+    return value
+
+
 class VectorBinary(VectorBase):
 
     def __init__(self, dataset_name='multiwoz21', character='sys', use_masking=False, manually_add_entity_names=True,
-                 seed=0, **kwargs):
+                 seed=0, incremental=False, **kwargs):
+        """
+        Args:
+            incremental: if true, state_vectorize only rebuilds the parts of the state vector whose inputs changed
+                since the last call (see state_vectorize_incremental)
+        """
 
         super().__init__(dataset_name, character, use_masking, manually_add_entity_names, seed)
+        self.incremental = incremental
+        self.previous_vectorization = None
 
     def get_state_dim(self):
         self.belief_state_dim = 0
@@ -34,6 +53,95 @@ class VectorBinary(VectorBase):
             state_vec (np.array):
                 Dialog state vector
         """
+        if self.incremental and "booked" in state and self.db is not None:
+            return self.state_vectorize_incremental(state)
+        state_vec = np.zeros(self.state_dim)
+        mask = np.zeros(self.da_dim)
+        self.state_vectorize_into(state, state_vec, mask)
+        return state_vec, mask
+
+    def segment_inputs(self, state):
+        """parts of the state the user act, system act, belief state and booked sub-vectors depend on"""
+        return {'user_act': state['user_action'] if self.character == 'sys' else state['system_action'],
+                'system_act': state['system_action'] if self.character == 'sys' else state['user_action'],
+                'belief_state': state['belief_state'],
+                'booked': state['booked']}
+
+    def reset_incremental(self):
+        """forget the previous state, the next call of state_vectorize_incremental rebuilds the whole vector"""
+        self.previous_vectorization = None
+
+    def state_vectorize_incremental(self, state):
+        """vectorize a state by updating the vectorization of the previous state (e.g. the previous turn of the
+        dialogue). Sub-vectors are only rebuilt if their inputs changed, the DB is only queried for domains whose
+        constraints changed and the mask is only recomputed if the belief state or a DB count changed.
+
+        Args:
+            state (dict):
+                Dialog state, it has to contain 'booked'
+        Returns:
+            state_vec (np.array):
+                Dialog state vector, the same as the one of state_vectorize
+            mask (np.array):
+                Action mask
+        """
+        self.state = state['belief_state']
+        previous = self.previous_vectorization
+        if previous is None:
+            previous = self.previous_vectorization = {'state_vec': np.zeros(self.state_dim),
+                                                      'mask': np.zeros(self.da_dim), 'inputs': {}, 'db': {}}
+        state_vec = previous['state_vec']
+
+        inputs = {name: freeze(value) for name, value in self.segment_inputs(state).items()}
+        changed = {name for name, value in inputs.items()
+                   if name not in previous['inputs'] or previous['inputs'][name] != value}
+        previous['inputs'] = inputs
+
+        i = 0
+        if 'user_act' in changed:
+            state_vec[i:i + self.da_opp_dim] = self.vectorize_user_act(state)
+        i += self.da_opp_dim
+        if 'system_act' in changed:
+            state_vec[i:i + self.da_dim] = self.vectorize_system_act(state)
+        i += self.da_dim
+        if 'belief_state' in changed:
+            belief_state, _ = self.vectorize_belief_state(state, self.init_domain_active_dict())
+            state_vec[i:i + self.belief_state_dim] = belief_state
+        i += self.belief_state_dim
+        if 'booked' in changed:
+            state_vec[i:i + len(self.db_domains)] = self.vectorize_booked(state)
+        i += len(self.db_domains)
+
+        degree = state_vec[i:i + 6 * len(self.db_domains)]
+        number_entities_dict = {}
+        counts_changed = False
+        for domain in self.db_domains:
+            key = self.db_query_key(domain)
+            cached = previous['db'].get(domain)
+            if key is not None and cached is not None and cached[0] == key:
+                number_entities_dict[domain] = cached[1]
+                continue
+            num_entities = self.count_entities(domain)
+            number_entities_dict[domain] = num_entities
+            if cached is None or cached[1] != num_entities:
+                self.one_hot_vector(num_entities, domain, degree)
+                counts_changed = True
+            previous['db'][domain] = (key, num_entities)
+        i += 6 * len(self.db_domains)
+
+        state_vec[i] = 1. if state['terminated'] else 0.
+        assert i + 1 == self.state_dim
+
+        mask = previous['mask']
+        if self.use_mask and ('belief_state' in changed or counts_changed):
+            mask[:] = self.get_mask(None, number_entities_dict)
+            mask[mask != 0] = -sys.maxsize
+
+        # the buffers are updated by the next call
+        return state_vec.copy(), mask.copy()
+
+    def state_vectorize_into(self, state, state_vec, mask):
+        """write the vector and action mask of a state into zero-initialised rows, see state_vectorize"""
         self.state = state['belief_state']
         domain_active_dict = self.init_domain_active_dict()
 
@@ -58,18 +166,15 @@ class VectorBinary(VectorBase):
             number_entities_dict = {}
         final = 1. if state['terminated'] else 0.
 
-        state_vec = np.r_[opp_act_vec, last_act_vec,
-                          belief_state, book, degree, final]
-        assert len(state_vec) == self.state_dim
+        i = 0
+        for part in [opp_act_vec, last_act_vec, belief_state, book, degree, [final]]:
+            state_vec[i:i + len(part)] = part
+            i += len(part)
+        assert i == self.state_dim
 
         if self.use_mask:
-            mask = self.get_mask(domain_active_dict, number_entities_dict)
-            for i in range(self.da_dim):
-                mask[i] = -int(bool(mask[i])) * sys.maxsize
-        else:
-            mask = np.zeros(self.da_dim)
-
-        return state_vec, mask
+            mask[:] = self.get_mask(domain_active_dict, number_entities_dict)
+            mask[mask != 0] = -sys.maxsize
 
     def get_mask(self, domain_active_dict, number_entities_dict):
         #domain_mask = self.compute_domain_mask(domain_active_dict)
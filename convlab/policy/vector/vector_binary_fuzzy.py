@@ -8,9 +8,9 @@ from .vector_binary import VectorBinary
 class VectorBinaryFuzzy(VectorBinary):
 
     def __init__(self, dataset_name='multiwoz21', character='sys', use_masking=False, manually_add_entity_names=True,
-                 seed=0):
+                 seed=0, incremental=False):
 
-        super().__init__(dataset_name, character, use_masking, manually_add_entity_names, seed)
+        super().__init__(dataset_name, character, use_masking, manually_add_entity_names, seed, incremental)
 
     def dbquery_domain(self, domain):
         """
@@ -2,7 +2,7 @@
 import os
 import json
 import numpy as np
-from convlab.policy.vec import Vector
+from convlab.policy.vec import Vector, fill_rows
 from convlab.util.camrest.lexicalize import delexicalize_da, flat_da, deflat_da, lexicalize_da
 from convlab.util.camrest.dbquery import Database
 
@@ -25,6 +25,8 @@ class CamrestVector(Vector):
         with open(voc_opp_file) as f:
             self.da_voc_opp = f.read().splitlines()
         self.character = character
+        # number of DB entities per constraints, shared between states during state_vectorize_batch
+        self.db_count_cache = None
         self.generate_dict()
 
     def generate_dict(self):
@@ -55,8 +57,14 @@ class CamrestVector(Vector):
 
     def pointer(self, turn):
         constraint = turn.items()
-        entities = self.db.query(constraint)
-        pointer_vector = self.one_hot_vector(len(entities))
+        if self.db_count_cache is None:
+            num_entities = len(self.db.query(constraint))
+        else:
+            key = tuple(constraint)
+            if key not in self.db_count_cache:
+                self.db_count_cache[key] = len(self.db.query(constraint))
+            num_entities = self.db_count_cache[key]
+        pointer_vector = self.one_hot_vector(num_entities)
 
         return pointer_vector
 
@@ -88,25 +96,31 @@ class CamrestVector(Vector):
         Returns:
             state_vec (np.array): Dialog state vector
         """
+        state_vec = np.zeros(self.state_dim)
+        self.state_vectorize_into(state, state_vec)
+        return state_vec
+
+    def state_vectorize_into(self, state, state_vec):
+        """write the vector of a state into a zero-initialised row, see state_vectorize"""
         self.state = state['belief_state']
 
         action = state['user_action'] if self.character == 'sys' else state['system_action']
         opp_action = delexicalize_da(action, self.requestable)
         opp_action = flat_da(opp_action)
-        opp_act_vec = np.zeros(self.da_opp_dim)
         for da in opp_action:
             if da in self.opp2vec:
-                opp_act_vec[self.opp2vec[da]] = 1.
+                state_vec[self.opp2vec[da]] = 1.
+        offset = self.da_opp_dim
 
         action = state['system_action'] if self.character == 'sys' else state['user_action']
         action = delexicalize_da(action, self.requestable)
         action = flat_da(action)
-        last_act_vec = np.zeros(self.da_dim)
         for da in action:
             if da in self.act2vec:
-                last_act_vec[self.act2vec[da]] = 1.
+                state_vec[offset + self.act2vec[da]] = 1.
+        offset += self.da_dim
 
-        inform = np.zeros(self.inform_dim)
+        inform = state_vec[offset:offset + self.inform_dim]
         for slot, value in state['belief_state'].items():
             p = 1
             key = slot + '-' + str(p)
@@ -117,13 +131,30 @@ class CamrestVector(Vector):
                     break
             else:
                 inform[self.inform2vec[key]] = 1.
+        offset += self.inform_dim
 
-        degree = self.pointer(state['belief_state'])
+        state_vec[offset:offset + 6] = self.pointer(state['belief_state'])
+        offset += 6
 
-        final = 1. if state['terminated'] else 0.
+        state_vec[offset] = 1. if state['terminated'] else 0.
 
-        state_vec = np.r_[opp_act_vec, last_act_vec, inform, degree, final]
-        return state_vec
+    def state_vectorize_batch(self, states, sparse=False, out=None):
+        """vectorize a batch of states into a [N x state_dim] array, DB queries with the same constraints are
+        only run once
+
+        Args:
+            states (list): Dialog states
+            sparse (bool): return a scipy.sparse.csr_matrix instead of a dense array
+            out (np.array): optional preallocated [N x state_dim] array to fill
+        Returns:
+            state_vecs ([N x state_dim] np.array): Dialog state vectors
+        """
+        self.db_count_cache = {}
+        try:
+            state_vecs, = fill_rows(states, [self.state_dim], self.state_vectorize_into, sparse, [out])
+        finally:
+            self.db_count_cache = None
+        return state_vecs
 
     def action_devectorize(self, action_vec):
         """recover an action
@@ -145,10 +176,27 @@ class CamrestVector(Vector):
         return action
 
     def action_vectorize(self, action):
+        act_vec = np.zeros(self.da_dim)
+        self.action_vectorize_into(action, act_vec)
+        return act_vec
+
+    def action_vectorize_into(self, action, act_vec):
+        """write the vector of an action into a zero-initialised row"""
         action = delexicalize_da(action, self.requestable)
         action = flat_da(action)
-        act_vec = np.zeros(self.da_dim)
         for da in action:
             if da in self.act2vec:
                 act_vec[self.act2vec[da]] = 1.
-        return act_vec
+
+    def action_vectorize_batch(self, actions, sparse=False, out=None):
+        """vectorize a batch of actions into a [N x da_dim] array
+
+        Args:
+            actions (list): Dialog acts
+            sparse (bool): return a scipy.sparse.csr_matrix instead of a dense array
+            out (np.array): optional preallocated [N x da_dim] array to fill
+        Returns:
+            act_vecs ([N x da_dim] np.array): Action vectors
+        """
+        act_vecs, = fill_rows(actions, [self.da_dim], self.action_vectorize_into, sparse, [out])
+        return act_vecs
@@ -1,7 +1,7 @@
 import os
 import json
 import numpy as np
-from convlab.policy.vec import Vector
+from convlab.policy.vec import Vector, fill_rows
 from convlab.util.crosswoz.state import default_state
 from convlab.util.crosswoz.lexicalize import delexicalize_da, lexicalize_da
 from convlab.util.crosswoz.dbquery import Database
@@ -12,6 +12,8 @@ class CrossWozVector(Vector):
         self.sys_da_voc = json.load(open(sys_da_voc_json))
         self.usr_da_voc = json.load(open(usr_da_voc_json))
         self.database = Database()
+        # DB results per query, shared between states during state_vectorize_batch
+        self.db_res_cache = None
         
         self.generate_dict()
         
@@ -39,49 +41,75 @@ class CrossWozVector(Vector):
         self.state_dim = self.sys_da_dim + self.usr_da_dim + self.belief_state_dim + self.db_res_dim + 1 # terminated
 
     def state_vectorize(self, state):
+        state_vec = np.zeros(self.state_dim)
+        self.state_vectorize_into(state, state_vec)
+        return state_vec
+
+    def state_vectorize_into(self, state, state_vec):
+        """write the vector of a state into a zero-initialised row"""
         self.belief_state = state['belief_state']
         self.cur_domain = state['cur_domain']
 
         da = state['user_action']
         da = delexicalize_da(da)
-        usr_act_vec = np.zeros(self.usr_da_dim)
         for a in da:
             if a in self.usr_da2id:
-                usr_act_vec[self.usr_da2id[a]] = 1.
+                state_vec[self.usr_da2id[a]] = 1.
+        offset = self.usr_da_dim
 
         da = state['system_action']
         da = delexicalize_da(da)
-        sys_act_vec = np.zeros(self.sys_da_dim)
         for a in da:
             if a in self.sys_da2id:
-                sys_act_vec[self.sys_da2id[a]] = 1.
-                
-        belief_state_vec = np.zeros(self.belief_state_dim)
-        i = 0
+                state_vec[offset + self.sys_da2id[a]] = 1.
+        offset += self.sys_da_dim
+
+        i = offset
         for domain, svs in state['belief_state'].items():
             for slot, value in svs.items():                
                 if value:
-                    belief_state_vec[i] = 1.
+                    state_vec[i] = 1.
                 i += 1
+        offset += self.belief_state_dim
 
-        self.db_res = self.database.query(state['belief_state'], state['cur_domain'])
+        self.db_res = self.query(state['belief_state'], state['cur_domain'])
         db_res_num = len(self.db_res)
-        db_res_vec = np.zeros(4)
         if db_res_num == 0:
-            db_res_vec[0] = 1.
+            state_vec[offset] = 1.
         elif db_res_num == 1:
-            db_res_vec[1] = 1.
+            state_vec[offset + 1] = 1.
         elif 1 < db_res_num < 5:
-            db_res_vec[2] = 1.
+            state_vec[offset + 2] = 1.
         else:
-            db_res_vec[3] = 1.
-            
-        terminated = 1. if state['terminated'] else 0.
-            
-        # print('state dim', self.state_dim)
-        state_vec = np.r_[usr_act_vec, sys_act_vec, belief_state_vec, db_res_vec, terminated]
-        # print('actual state vec dim', len(state_vec))
-        return state_vec
+            state_vec[offset + 3] = 1.
+        offset += self.db_res_dim
+
+        state_vec[offset] = 1. if state['terminated'] else 0.
+
+    def query(self, belief_state, cur_domain):
+        """query the database, results are looked up in db_res_cache when it is set"""
+        if self.db_res_cache is None:
+            return self.database.query(belief_state, cur_domain)
+        # only the constraints of the current domain are used
+        key = (cur_domain, tuple(belief_state[cur_domain].items()) if cur_domain else ())
+        if key not in self.db_res_cache:
+            self.db_res_cache[key] = self.database.query(belief_state, cur_domain)
+        return self.db_res_cache[key]
+
+    def state_vectorize_batch(self, states, sparse=False, out=None):
+        """
+        vectorize a batch of states into a [N x state_dim] array, DB queries with the same constraints are only run once
+        :param states: list of dialog states
+        :param sparse: return a scipy.sparse.csr_matrix instead of a dense array
+        :param out: optional preallocated [N x state_dim] array to fill
+        :return: state vectors
+        """
+        self.db_res_cache = {}
+        try:
+            state_vecs, = fill_rows(states, [self.state_dim], self.state_vectorize_into, sparse, [out])
+        finally:
+            self.db_res_cache = None
+        return state_vecs
     
     def action_devectorize(self, action_vec):
         """
@@ -97,12 +125,26 @@ class CrossWozVector(Vector):
         return lexicalized_da
     
     def action_vectorize(self, da):
-        da = delexicalize_da(da)
         sys_act_vec = np.zeros(self.sys_da_dim)
+        self.action_vectorize_into(da, sys_act_vec)
+        return sys_act_vec
+
+    def action_vectorize_into(self, da, sys_act_vec):
+        da = delexicalize_da(da)
         for a in da:
             if a in self.sys_da2id:
                 sys_act_vec[self.sys_da2id[a]] = 1.
-        return sys_act_vec
+
+    def action_vectorize_batch(self, das, sparse=False, out=None):
+        """
+        vectorize a batch of system actions into a [N x sys_da_dim] array
+        :param das: list of dialog acts
+        :param sparse: return a scipy.sparse.csr_matrix instead of a dense array
+        :param out: optional preallocated [N x sys_da_dim] array to fill
+        :return: action vectors
+        """
+        act_vecs, = fill_rows(das, [self.sys_da_dim], self.action_vectorize_into, sparse, [out])
+        return act_vecs
 
 
 if __name__ == '__main__':
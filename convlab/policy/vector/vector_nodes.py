@@ -4,6 +4,7 @@ import numpy as np
 import logging
 
 from convlab.util.multiwoz.lexicalize import delexicalize_da, flat_da
+from convlab.policy.vec import fill_rows
 from .vector_base import VectorBase
 
 
@@ -76,13 +77,40 @@ class VectorNodes(VectorBase):
 
         if self.use_mask:
             mask = self.get_mask(domain_active_dict, number_entities_dict)
-            for i in range(self.da_dim):
-                mask[i] = -int(bool(mask[i])) * sys.maxsize
+            mask[mask != 0] = -sys.maxsize
         else:
             mask = np.zeros(self.da_dim)
 
         return np.zeros(1), mask
 
+    def state_vectorize_batch(self, states, sparse=False, out=None, mask_out=None):
+        """vectorize a batch of states, DB queries with the same constraints are only run once
+
+        Args:
+            states (list):
+                Dialog states
+            sparse (bool):
+                return the masks as scipy.sparse.csr_matrix
+            out:
+                unused, the state is a graph and not a vector
+            mask_out (np.array):
+                optional preallocated [N x da_dim] array to fill
+        Returns:
+            kg_infos (list):
+                graph nodes of every state
+            masks ([N x da_dim] np.array):
+                Action masks
+        """
+        kg_infos = []
+
+        def fill(state, mask_row):
+            _, mask_row[:] = self.state_vectorize(state)
+            kg_infos.append(self.kg_info)
+
+        with self.shared_db_counts():
+            masks, = fill_rows(states, [self.da_dim], fill, sparse, [mask_out])
+        return kg_infos, masks
+
     def get_mask(self, domain_active_dict, number_entities_dict):
         #domain_mask = self.compute_domain_mask(domain_active_dict)
         entity_mask = self.compute_entity_mask(number_entities_dict)
@@ -19,7 +19,8 @@ class VectorUncertainty(VectorBinary):
                  use_confidence_scores: bool = True,
                  confidence_thresholds: dict = None,
                  use_state_total_uncertainty: bool = False,
-                 use_state_knowledge_uncertainty: bool = False):
+                 use_state_knowledge_uncertainty: bool = False,
+                 incremental: bool = False):
         """
         Args:
             dataset_name: Name of environment dataset
@@ -31,6 +32,7 @@ class VectorUncertainty(VectorBinary):
             confidence_thresholds: If true confidence thresholds are used in database querying
             use_state_total_uncertainty: If true state entropy is added to the state vector
             use_state_knowledge_uncertainty: If true state mutual information is added to the state vector
+            incremental: If true only the parts of the state vector whose inputs changed are rebuilt
         """
 
         self.use_confidence_scores = use_confidence_scores
@@ -39,7 +41,8 @@ class VectorUncertainty(VectorBinary):
         if confidence_thresholds is not None:
             self.setup_uncertain_query(confidence_thresholds)
 
-        super().__init__(dataset_name, character, use_masking, manually_add_entity_names, seed)
+        super().__init__(dataset_name, character, use_masking, manually_add_entity_names, seed,
+                         incremental=incremental)
 
     def get_state_dim(self):
         self.belief_state_dim = 0
@@ -55,6 +58,14 @@ class VectorUncertainty(VectorBinary):
         self.state_dim = self.da_opp_dim + self.da_dim + self.belief_state_dim + \
             len(self.db_domains) + 6 * len(self.db_domains) + 1
 
+    def segment_inputs(self, state):
+        inputs = super().segment_inputs(state)
+        # confidence scores weight the user act and belief state features and filter the DB constraints
+        inputs['user_act'] = (inputs['user_act'], state.get('belief_state_probs'))
+        inputs['belief_state'] = (inputs['belief_state'], state.get('belief_state_probs'), state.get('entropy'),
+                                  state.get('mutual_information'), state.get('active_domains'))
+        return inputs
+
     # Add thresholds for db_queries
     def setup_uncertain_query(self, confidence_thresholds):
         self.use_confidence_scores = True
@@ -71,6 +82,16 @@ class VectorUncertainty(VectorBinary):
             entities list:
                 list of entities of the specified domain
         """
+        constraints = self.query_constraints(domain)
+        return self.db.query(domain, constraints.items(), topk=10)
+
+    def db_query_key(self, domain):
+        if domain == 'taxi':
+            return None
+        return domain, tuple(self.query_constraints(domain).items())
+
+    def query_constraints(self, domain):
+        """user constraints of a domain whose confidence is above the threshold"""
         # Get all user constraints
         constraints = {slot: value for slot, value in self.state[domain].items()
                        if slot and value not in ['dontcare',
@@ -88,7 +109,7 @@ class VectorUncertainty(VectorBinary):
             # Filter out constraints for which confidence is lower than threshold
             constraints = {slot: value for slot, value in constraints.items() if probs[slot] >= threshold[slot]}
 
-        return self.db.query(domain, constraints.items(), topk=10)
+        return constraints
 
     def vectorize_user_act(self, state):
         """Return confidence scores for the user actions"""
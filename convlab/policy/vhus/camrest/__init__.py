@@ -1 +1,6 @@
-from convlab.policy.vhus.camrest.vhus import UserPolicyVHUS
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'UserPolicyVHUS': 'convlab.policy.vhus.camrest.vhus',
+})
+__all__ = ['UserPolicyVHUS']
@@ -1 +1,6 @@
-from convlab.policy.vhus.multiwoz.vhus import UserPolicyVHUS
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'UserPolicyVHUS': 'convlab.policy.vhus.multiwoz.vhus',
+})
+__all__ = ['UserPolicyVHUS']
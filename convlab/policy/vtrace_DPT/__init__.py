@@ -1 +1,6 @@
-from convlab.policy.vtrace_DPT.vtrace import VTRACE
\ No newline at end of file
+from convlab.util.lazy_import import lazy_getattr
+
+__getattr__ = lazy_getattr(__name__, {
+    'VTRACE': 'convlab.policy.vtrace_DPT.vtrace',
+})
+__all__ = ['VTRACE']
@@ -18,7 +18,7 @@ from convlab.policy.vtrace_DPT.multiprocessing_helper import get_queues, start_p
     terminate_processes
 from convlab.task.multiwoz.goal_generator import GoalGenerator
 from convlab.util.custom_util import set_seed, init_logging, save_config, move_finished_training, env_config, \
-    eval_policy, log_start_args, save_best, load_config_file, create_goals, get_config
+    eval_policy, close_eval_engines, log_start_args, save_best, load_config_file, create_goals, get_config
 from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.dirname(
@@ -172,7 +172,11 @@ if __name__ == '__main__':
         online_metric_queue = mp.SimpleQueue()
         processes = start_processes(train_processes, queues, episode_queues, env, policy_sys, seed,
                                     online_metric_queue)
-    goal_generator = GoalGenerator()
+    if conf['model'].get('goal_bank'):
+        from convlab.task.multiwoz.goal_bank import load_goal_bank
+        goal_bank = load_goal_bank(conf['model']['goal_bank'])
+    else:
+        goal_bank, goal_generator = None, GoalGenerator()
 
     num_dialogues = 0
     new_dialogues = conf['model']["new_dialogues"]
@@ -182,8 +186,11 @@ if __name__ == '__main__':
 
     while num_dialogues < total_dialogues:
 
-        goals = create_goals(goal_generator, new_dialogues, single_domains=single_domains,
-                             allowed_domains=allowed_domains)
+        if goal_bank is not None:
+            goals = goal_bank.sample(new_dialogues, single_domains=single_domains, allowed_domains=allowed_domains)
+        else:
+            goals = create_goals(goal_generator, new_dialogues, single_domains=single_domains,
+                                 allowed_domains=allowed_domains)
         if train_processes > 1:
             time_now, metrics = submit_jobs(new_dialogues, queues, episode_queues, train_processes, memory, goals,
                                             online_metric_queue)
@@ -213,6 +220,7 @@ if __name__ == '__main__':
 
     logging.info("End of Training: " +
                  time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime()))
+    close_eval_engines(sess)
 
     if train_processes > 1:
         terminate_processes(processes, queues)
@@ -0,0 +1,169 @@
+"""
+Goal bank: a pool of user goals generated once by the GoalGenerator and stored in a gzipped json file, so that
+evaluation and training draw goals without loading the goal model or querying the database.
+
+    python -m convlab.task.multiwoz.goal_bank generate --num_goals 100000 --seed 0 --output goal_bank.json.gz
+    python -m convlab.task.multiwoz.goal_bank info goal_bank.json.gz
+
+File format:
+    {"version": 1, "seed": 0, "goal_model_path": ..., "goals": [user goal, ...],
+     "index": {"hotel-train": [goal ids], ...}}
+where a user goal is the dict returned by GoalGenerator.get_user_goal and the index maps every domain combination
+(sorted domains joined by "-") to the ids of its goals.
+
+A GoalBank can stand in for a GoalGenerator, e.g. as `goal_generator` of the agenda user policy or in
+`create_goals`, it then returns random goals of the bank.
+"""
+import gzip
+import json
+import random
+from argparse import ArgumentParser
+from copy import deepcopy
+from functools import lru_cache
+
+import numpy as np
+
+GOAL_BANK_VERSION = 1
+
+
+def domain_combination(domains):
+    return '-'.join(sorted(domains))
+
+
+class _FixedGoal:
+    # makes Goal(...) build the given user goal instead of sampling one
+    def __init__(self, user_goal):
+        self.user_goal = user_goal
+
+    def get_user_goal(self):
+        user_goal = deepcopy(self.user_goal)
+        user_goal['domain_ordering'] = tuple(user_goal['domain_ordering'])
+        return user_goal
+
+
+class GoalBank:
+    def __init__(self, goals, index=None, seed=None, goal_model_path=None):
+        """
+        Args:
+            goals: list of user goals as returned by GoalGenerator.get_user_goal
+            index: domain combination -> goal ids, built from the goals if not given
+        """
+        self.user_goals = goals
+        self.seed = seed
+        self.goal_model_path = goal_model_path
+        if index is None:
+            index = {}
+            for goal_id, goal in enumerate(goals):
+                index.setdefault(domain_combination(goal['domain_ordering']), []).append(goal_id)
+        self.index = index
+        self._candidates = {}
+
+    def __len__(self):
+        return len(self.user_goals)
+
+    @classmethod
+    def generate(cls, num_goals, seed=0, goal_generator=None):
+        """sample `num_goals` goals with random and numpy seeded by `seed`"""
+        if goal_generator is None:
+            from convlab.task.multiwoz.goal_generator import GoalGenerator
+            goal_generator = GoalGenerator()
+        random.seed(seed)
+        np.random.seed(seed)
+        goals = []
+        for _ in range(num_goals):
+            goal = goal_generator.get_user_goal()
+            goal['domain_ordering'] = list(goal['domain_ordering'])
+            goals.append(goal)
+        return cls(goals, seed=seed, goal_model_path=getattr(goal_generator, 'goal_model_path', None))
+
+    def save(self, path):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump({'version': GOAL_BANK_VERSION, 'seed': self.seed, 'goal_model_path': self.goal_model_path,
+                       'goals': self.user_goals, 'index': self.index}, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != GOAL_BANK_VERSION:
+            raise ValueError(f"{path} is a goal bank of version {data.get('version')}, "
+                             f"expected {GOAL_BANK_VERSION}")
+        return cls(data['goals'], data['index'], data['seed'], data['goal_model_path'])
+
+    def candidates(self, single_domains=False, allowed_domains=None):
+        """ids of the goals that satisfy the filters of `create_goals`, in bank order"""
+        key = (single_domains, None if allowed_domains is None else frozenset(allowed_domains))
+        if key not in self._candidates:
+            ids = []
+            for combination, goal_ids in self.index.items():
+                domains = combination.split('-')
+                if single_domains and len(domains) > 1:
+                    continue
+                if allowed_domains is not None and not set(domains).issubset(set(allowed_domains)):
+                    continue
+                ids += goal_ids
+            if not ids:
+                raise ValueError(f"No goal in the bank with single_domains={single_domains}, "
+                                 f"allowed_domains={allowed_domains}")
+            self._candidates[key] = sorted(ids)
+        return self._candidates[key]
+
+    def goal(self, goal_id):
+        """the user goal `goal_id` as a Goal of the agenda user policy"""
+        from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import Goal
+        return Goal(_FixedGoal(self.user_goals[goal_id]))
+
+    def goals(self, num_goals, single_domains=False, allowed_domains=None, offset=0):
+        """
+        the first `num_goals` matching goals from `offset` on, the same every time, e.g. for evaluation.
+        Raises a ValueError if the bank has fewer matching goals, rather than repeating goals.
+        """
+        ids = self.candidates(single_domains, allowed_domains)
+        if offset + num_goals > len(ids):
+            raise ValueError(f"{num_goals} goals from offset {offset} requested, but the bank has only {len(ids)} "
+                             f"goals with single_domains={single_domains}, allowed_domains={allowed_domains}")
+        return [self.goal(ids[offset + i]) for i in range(num_goals)]
+
+    def sample(self, num_goals, single_domains=False, allowed_domains=None):
+        """`num_goals` random matching goals, drawn with `random`"""
+        ids = self.candidates(single_domains, allowed_domains)
+        return [self.goal(ids[random.randrange(len(ids))]) for _ in range(num_goals)]
+
+    def get_user_goal(self):
+        # GoalGenerator interface
+        return _FixedGoal(self.user_goals[random.randrange(len(self.user_goals))]).get_user_goal()
+
+
+@lru_cache(maxsize=None)
+def load_goal_bank(path):
+    """load a goal bank once per process"""
+    return GoalBank.load(path)
+
+
+def main():
+    parser = ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate = subparsers.add_parser('generate', help='sample a goal bank')
+    generate.add_argument('--num_goals', type=int, default=100000)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--goal_model_path', type=str, default=None, help='goal model of the GoalGenerator')
+    generate.add_argument('--output', type=str, required=True, help='path of the .json.gz file')
+    info = subparsers.add_parser('info', help='show the number of goals per domain combination')
+    info.add_argument('path', type=str)
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        from convlab.task.multiwoz.goal_generator import GoalGenerator
+        goal_generator = GoalGenerator(**({'goal_model_path': args.goal_model_path} if args.goal_model_path else {}))
+        bank = GoalBank.generate(args.num_goals, args.seed, goal_generator)
+        bank.save(args.output)
+        print(f"saved {len(bank)} goals in {len(bank.index)} domain combinations to {args.output}")
+    else:
+        bank = GoalBank.load(args.path)
+        print(f"{len(bank)} goals, seed {bank.seed}, goal model {bank.goal_model_path}")
+        for combination, goal_ids in sorted(bank.index.items(), key=lambda item: -len(item[1])):
+            print(f"{len(goal_ids):8d}  {combination}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ import pickle
 import random
 from collections import Counter
 from copy import deepcopy
+from itertools import accumulate
 
 from pprint import pprint
 import numpy as np
@@ -141,6 +142,17 @@ def nomial_sample(counter: Counter):
     return list(counter.keys())[np.argmax(np.random.multinomial(1, list(counter.values())))]
 
 
+def compile_distribution(dist):
+    """
+    Compile a {value: probability or count} distribution into (values, probabilities, cumulative weights).
+    The probabilities give the same draws as `nomial_sample(dist)` and the cumulative weights the same as
+    `random.choices(values, weights)`, without rebuilding the lists on every draw.
+    """
+    values = list(dist.keys())
+    weights = list(dist.values())
+    return values, np.array(weights, dtype=float), list(accumulate(weights))
+
+
 class GoalGenerator:
     """User goal generator."""
 
@@ -176,6 +188,7 @@ class GoalGenerator:
             print('Building goal model is done')
         if domain_ordering_dist is not None:
             self.domain_ordering_dist = domain_ordering_dist
+        self._compile_goal_model()
         np.random.seed(seed)
         random.seed(seed)
         # remove some slot
@@ -192,6 +205,52 @@ class GoalGenerator:
         # pprint(self.slots_num_dist)
         # pprint(self.slots_combination_dist)
 
+    def _compile_goal_model(self):
+        """
+        Compile the distributions of the goal model for sampling, and reset the caches of DB lookups. Call it again
+        after changing a distribution of a loaded generator.
+        """
+        self.domain_ordering_table = compile_distribution(self.domain_ordering_dist)
+        self.slot_value_tables = {}
+        for domain, scopes in self.ind_slot_value_dist.items():
+            for scope in ['info', 'book']:
+                for slot, dist in scopes.get(scope, {}).items():
+                    self.slot_value_tables[(domain, scope, slot)] = compile_distribution(dist)
+        self.slots_combination_tables = {}
+        for domain, scopes in self.slots_combination_dist.items():
+            for scope, dist in scopes.items():
+                self.slots_combination_tables[(domain, scope)] = compile_distribution(dist)
+        self._query_cache = {}
+
+    def _sample_value(self, domain, scope, slot):
+        values, probs, _ = self.slot_value_tables[(domain, scope, slot)]
+        return values[np.argmax(np.random.multinomial(1, probs))]
+
+    def _sample_slots(self, domain, scope):
+        values, _, cum_weights = self.slots_combination_tables[(domain, scope)]
+        return random.choices(values, cum_weights=cum_weights)[0]
+
+    def _query(self, domain, info):
+        """entities matching `info`, cached as the goal model queries the same constraints over and over"""
+        if domain == 'taxi':
+            # taxi results are random, don't touch the random state by caching them
+            return self.db.query(domain, info.items())
+        key = (domain, tuple(sorted(info.items())))
+        if key not in self._query_cache:
+            self._query_cache[key] = self.db.query(domain, info.items())
+        return self._query_cache[key]
+
+    def sample_goals(self, num_goals, seed=None):
+        """
+        Sample `num_goals` user goals as returned by `get_user_goal`.
+        Args:
+            seed: if given, random and numpy are seeded with it first, so the same seed gives the same goals
+        """
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+        return [self.get_user_goal() for _ in range(num_goals)]
+
     def _build_goal_model(self):
         dialogs = json.load(open(self.corpus_path))
 
@@ -355,16 +414,13 @@ class GoalGenerator:
             # inform
             if 'info' in cnt_slot:
                 if self.sample_info_from_trainset:
-                    slots = random.choices(list(self.slots_combination_dist[domain]['info'].keys()),
-                                           list(self.slots_combination_dist[domain]['info'].values()))[0]
+                    slots = self._sample_slots(domain, 'info')
                     for slot in slots:
-                        domain_goal['info'][slot] = nomial_sample(
-                            cnt_slot_value['info'][slot])
+                        domain_goal['info'][slot] = self._sample_value(domain, 'info', slot)
                 else:
                     for slot in cnt_slot['info']:
                         if random.random() < cnt_slot['info'][slot] + pro_correction['info']:
-                            domain_goal['info'][slot] = nomial_sample(
-                                cnt_slot_value['info'][slot])
+                            domain_goal['info'][slot] = self._sample_value(domain, 'info', slot)
 
                 if domain in ['hotel', 'restaurant', 'attraction'] and 'name' in domain_goal['info'] and len(
                         domain_goal['info']) > 1:
@@ -386,11 +442,9 @@ class GoalGenerator:
                         domain_goal['info']:
                     if random.random() < (cnt_slot['info']['arriveBy'] / (
                             cnt_slot['info']['arriveBy'] + cnt_slot['info']['leaveAt'])):
-                        domain_goal['info']['arriveBy'] = nomial_sample(
-                            cnt_slot_value['info']['arriveBy'])
+                        domain_goal['info']['arriveBy'] = self._sample_value(domain, 'info', 'arriveBy')
                     else:
-                        domain_goal['info']['leaveAt'] = nomial_sample(
-                            cnt_slot_value['info']['leaveAt'])
+                        domain_goal['info']['leaveAt'] = self._sample_value(domain, 'info', 'leaveAt')
 
                 if domain in ['train']:
                     random_train = random.choice(self.train_database)
@@ -398,12 +452,10 @@ class GoalGenerator:
                     domain_goal['info']['destination'] = random_train['destination']
 
                 if domain in ['taxi'] and 'departure' not in domain_goal['info']:
-                    domain_goal['info']['departure'] = nomial_sample(
-                        cnt_slot_value['info']['departure'])
+                    domain_goal['info']['departure'] = self._sample_value(domain, 'info', 'departure')
 
                 if domain in ['taxi'] and 'destination' not in domain_goal['info']:
-                    domain_goal['info']['destination'] = nomial_sample(
-                        cnt_slot_value['info']['destination'])
+                    domain_goal['info']['destination'] = self._sample_value(domain, 'info', 'destination')
 
                 if domain in ['taxi'] and \
                         'departure' in domain_goal['info'] and \
@@ -411,11 +463,9 @@ class GoalGenerator:
                         domain_goal['info']['departure'] == domain_goal['info']['destination']:
                     if random.random() < (cnt_slot['info']['departure'] / (
                             cnt_slot['info']['departure'] + cnt_slot['info']['destination'])):
-                        domain_goal['info']['departure'] = nomial_sample(
-                            cnt_slot_value['info']['departure'])
+                        domain_goal['info']['departure'] = self._sample_value(domain, 'info', 'departure')
                     else:
-                        domain_goal['info']['destination'] = nomial_sample(
-                            cnt_slot_value['info']['destination'])
+                        domain_goal['info']['destination'] = self._sample_value(domain, 'info', 'destination')
                 if domain_goal['info'] == {}:
                     continue
             # request
@@ -445,29 +495,23 @@ class GoalGenerator:
 
                 for slot in cnt_slot['book']:
                     if random.random() < cnt_slot['book'][slot] + pro_correction['book']:
-                        domain_goal['book'][slot] = nomial_sample(
-                            cnt_slot_value['book'][slot])
+                        domain_goal['book'][slot] = self._sample_value(domain, 'book', slot)
 
                 # makes sure that there are all necessary slots for booking
                 if domain == 'restaurant' and 'time' not in domain_goal['book']:
-                    domain_goal['book']['time'] = nomial_sample(
-                        cnt_slot_value['book']['time'])
+                    domain_goal['book']['time'] = self._sample_value(domain, 'book', 'time')
 
                 if domain == 'hotel' and 'stay' not in domain_goal['book']:
-                    domain_goal['book']['stay'] = nomial_sample(
-                        cnt_slot_value['book']['stay'])
+                    domain_goal['book']['stay'] = self._sample_value(domain, 'book', 'stay')
 
                 if domain in ['hotel', 'restaurant'] and 'day' not in domain_goal['book']:
-                    domain_goal['book']['day'] = nomial_sample(
-                        cnt_slot_value['book']['day'])
+                    domain_goal['book']['day'] = self._sample_value(domain, 'book', 'day')
 
                 if domain in ['hotel', 'restaurant'] and 'people' not in domain_goal['book']:
-                    domain_goal['book']['people'] = nomial_sample(
-                        cnt_slot_value['book']['people'])
+                    domain_goal['book']['people'] = self._sample_value(domain, 'book', 'people')
 
                 if domain == 'train' and len(domain_goal['book']) <= 0:
-                    domain_goal['book']['people'] = nomial_sample(
-                        cnt_slot_value['book']['people'])
+                    domain_goal['book']['people'] = self._sample_value(domain, 'book', 'people')
 
             # always give user optional second booking criteria in case the system outputs fail booking by chance
             if 'book' in domain_goal:
@@ -546,12 +590,12 @@ class GoalGenerator:
             #                 domain_goal['fail_book']['day'] = days[(days.index(domain_goal['book']['day']) + 1) % 7]
 
             # fail_info
-            if 'info' in domain_goal and len(self.db.query(domain, domain_goal['info'].items())) == 0:
+            if 'info' in domain_goal and len(self._query(domain, domain_goal['info'])) == 0:
                 num_trial = 0
                 while num_trial < 100:
                     adjusted_info = self._adjust_info(
                         domain, domain_goal['info'])
-                    if len(self.db.query(domain, adjusted_info.items())) > 0:
+                    if len(self._query(domain, adjusted_info)) > 0:
                         if domain == 'train':
                             domain_goal['info'] = adjusted_info
                         else:
@@ -566,7 +610,7 @@ class GoalGenerator:
                     continue
 
             if 'reqt' in domain_goal and domain in ['train', 'hotel', 'restaurant', 'attraction']:
-                entities = self.db.query(domain, domain_goal['info'].items())
+                entities = self._query(domain, domain_goal['info'])
                 for req in domain_goal['reqt']:
                     keep = True
                     for ent in entities:
@@ -590,7 +634,8 @@ class GoalGenerator:
     def get_user_goal(self):
         domain_ordering = ()
         while len(domain_ordering) <= 0:
-            domain_ordering = nomial_sample(self.domain_ordering_dist)
+            values, probs, _ = self.domain_ordering_table
+            domain_ordering = values[np.argmax(np.random.multinomial(1, probs))]
         # domain_ordering = ('restaurant',)
 
         user_goal = {dom: self._get_domain_goal(
@@ -632,7 +677,7 @@ class GoalGenerator:
             adjusted_restaurant_goal = deepcopy(
                 user_goal['restaurant']['info'])
             adjusted_restaurant_goal['area'] = user_goal['attraction']['info']['area']
-            if len(self.db.query('restaurant', adjusted_restaurant_goal.items())) > 0 and random.random() < 0.5:
+            if len(self._query('restaurant', adjusted_restaurant_goal)) > 0 and random.random() < 0.5:
                 user_goal['restaurant']['info']['area'] = user_goal['attraction']['info']['area']
 
         # match day and people of restaurant and hotel
@@ -663,9 +708,9 @@ class GoalGenerator:
                     (days.index(user_goal['hotel']['book']['day']) + int(
                         user_goal['hotel']['book']['stay'])) % 7]
             # In case, we have no query results with adjusted train goal, we simply drop the train goal.
-            if len(self.db.query('train', user_goal['train']['info'].items())) == 0:
+            if len(self._query('train', user_goal['train']['info'])) == 0:
                 del user_goal['train']
-                domain_ordering = tuple(list(domain_ordering).remove('train'))
+                domain_ordering = tuple(domain for domain in domain_ordering if domain != 'train')
 
         user_goal['domain_ordering'] = domain_ordering
 
@@ -675,8 +720,7 @@ class GoalGenerator:
         # adjust one of the slots of the info
         adjusted_info = deepcopy(info)
         slot = random.choice(list(info.keys()))
-        adjusted_info[slot] = random.choice(
-            list(self.ind_slot_value_dist[domain]['info'][slot].keys()))
+        adjusted_info[slot] = random.choice(self.slot_value_tables[(domain, 'info', slot)][0])
         return adjusted_info
 
     def build_message(self, user_goal, boldify=null_boldify):
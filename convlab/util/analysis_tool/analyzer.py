@@ -1,4 +1,9 @@
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+from copy import deepcopy
 from convlab.dialog_agent import BiSession, PipelineAgent
 from convlab.evaluator.multiwoz_eval import MultiWozEvaluator
 from pprint import pprint
@@ -10,6 +15,103 @@ from convlab.util.analysis_tool.helper import Reporter
 from tqdm import tqdm, trange
 import logging
 
+_worker_analyzer = None
+_worker_agents = None
+_worker_sessions = {}
+
+
+def _init_worker(analyzer, sys_agents):
+    global _worker_analyzer, _worker_agents
+    _worker_analyzer = analyzer
+    _worker_agents = sys_agents
+    _worker_sessions.clear()
+
+
+def _simulate(job):
+    model_name, dialog_id, goal_seed, goal = job
+    if model_name not in _worker_sessions:
+        _worker_sessions[model_name] = _worker_analyzer.build_sess(_worker_agents[model_name])
+    return _worker_analyzer.simulate_dialog(_worker_sessions[model_name], dialog_id, goal_seed, goal)
+
+
+def _simulate_with_name(job):
+    return job[0], _simulate(job)
+
+
+def _to_json(obj):
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _load_record(line):
+    record = json.loads(line)
+    # the reporter counts bad / missing informs as dict keys
+    for domain_record in record['domains']:
+        inform = domain_record['inform']
+        domain_record['inform'] = inform[:3] + [[tuple(da) for da in das] for das in inform[3:]]
+    return record
+
+
+def _torch_modules(obj, prefix, depth=2, seen=None):
+    """(path, module) of the torch modules among the attributes of `obj`, looking `depth` objects deep"""
+    seen = set() if seen is None else seen
+    if obj is None or id(obj) in seen or not hasattr(obj, '__dict__'):
+        return
+    seen.add(id(obj))
+    if isinstance(obj, torch.nn.Module):
+        yield prefix, obj
+        return
+    if depth == 0:
+        return
+    for name, value in sorted(vars(obj).items()):
+        yield from _torch_modules(value, f'{prefix}.{name}', depth - 1, seen)
+
+
+def agent_fingerprint(agent):
+    """hash of the classes of the modules of a pipeline agent and the weights of their torch models"""
+    digest = hashlib.sha1()
+    for name in ['nlu', 'dst', 'policy', 'nlg']:
+        component = getattr(agent, name, None)
+        digest.update(f'{name}:{type(component).__module__}.{type(component).__qualname__};'.encode('utf-8'))
+        for path, module in _torch_modules(component, name):
+            for key, tensor in module.state_dict().items():
+                digest.update(f'{path}.{key};'.encode('utf-8'))
+                digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def goal_hash(goal):
+    """hash of a user goal from `sample_goals` or a goal bank, None for goals sampled by the user simulator"""
+    if goal is None:
+        return None
+    value = vars(goal) if hasattr(goal, '__dict__') else goal
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _read_store(store_path, goal_seeds, goal_hashes, fingerprint):
+    """
+    load the records of a dialogue store that belong to the goal set `goal_seeds` / `goal_hashes` and to the
+    system and user agents with `fingerprint`, by dialogue id
+    """
+    records = {}
+    if not os.path.exists(store_path):
+        return records
+    with open(store_path) as f:
+        for line in f:
+            try:
+                record = _load_record(line)
+            except ValueError:
+                continue
+            dialog_id = record['dialog_id']
+            if dialog_id < len(goal_seeds) and record['goal_seed'] == goal_seeds[dialog_id] \
+                    and record.get('goal_hash') == goal_hashes[dialog_id] \
+                    and record.get('fingerprint') == fingerprint:
+                records[dialog_id] = record
+    return records
+
 
 class Analyzer:
     def __init__(self, user_agent, dataset='multiwoz'):
@@ -59,10 +161,217 @@ class Analyzer:
         pprint(sess.evaluator.goal)
         print('=' * 100)
 
-    def comprehensive_analyze(self, sys_agent, model_name, total_dialog=100):
-        sess = self.build_sess(sys_agent)
+    def simulate_dialog(self, sess, dialog_id, goal_seed, goal=None):
+        """
+        Run one dialogue with everything seeded by `goal_seed`, so the result does not depend on which process
+        runs it or on the dialogues simulated before.
+
+        Args:
+            sess: the session built by `build_sess`
+            dialog_id: index of the dialogue in the goal set
+            goal_seed: seed of random, numpy and torch for this dialogue
+            goal: a user goal from `sample_goals`, None lets the user simulator sample one
+        Returns:
+            record (dict): json serialisable summary of the dialogue, as stored by `comprehensive_analyze`
+        """
+        flog = io.StringIO()
+        sys_response = '' if self.user_agent.nlu else []
+        random.seed(goal_seed)
+        np.random.seed(goal_seed)
+        torch.manual_seed(goal_seed)
+        if goal is None:
+            sess.init_session()
+        else:
+            # the goal is updated during the dialogue, keep the shared one intact
+            sess.init_session(goal=deepcopy(goal))
+
+        usr_da_list = []
+        failed_da_sys = []
+        failed_da_usr = []
+        last_sys_da = None
+
+        step = 0
 
-        goal_seeds = [random.randint(1, 100000) for _ in range(total_dialog)]
+        for i in range(40):
+            sys_response, user_response, session_over, reward = sess.next_turn(
+                sys_response)
+
+            print('-'*16, file=flog)
+            print('Turn Number:', i, file=flog)
+            print('User:', user_response, file=flog)
+            print('System:', sys_response, file=flog)
+            print('DST state:', sess.sys_agent.state_return()
+                  ['dst_state'], file=flog)
+
+            step += 2
+
+            if hasattr(sess.sys_agent, "get_in_da") and isinstance(sess.sys_agent.get_in_da(), list) \
+                    and sess.user_agent.get_out_da() != [] \
+                    and sess.user_agent.get_out_da() != sess.sys_agent.get_in_da():
+                for da1 in sess.user_agent.get_out_da():
+                    for da2 in sess.sys_agent.get_in_da():
+                        if da1 != da2 and da1 is not None and da2 is not None and (da1, da2) not in failed_da_sys:
+                            failed_da_sys.append((da1, da2))
+
+            if isinstance(last_sys_da, list) \
+                    and last_sys_da is not None and last_sys_da != [] and sess.user_agent.get_in_da() != last_sys_da:
+                for da1 in last_sys_da:
+                    for da2 in sess.user_agent.get_in_da():
+                        if da1 != da2 and da1 is not None and da2 is not None and (da1, da2) not in failed_da_usr:
+                            failed_da_usr.append((da1, da2))
+
+            last_sys_da = sess.sys_agent.get_out_da() if hasattr(
+                sess.sys_agent, "get_out_da") else None
+            usr_da_list.append(sess.user_agent.get_out_da())
+
+            if session_over:
+                break
+
+        task_success = sess.evaluator.task_success()
+        if task_success:
+            print('Dialogue succesfully completed!', file=flog)
+        else:
+            print('Dialogue NOT completed succesfully!', file=flog)
+
+        domain_set = []
+        for da in sess.evaluator.usr_da_array:
+            if da.split('-')[0] != 'general' and da.split('-')[0] not in domain_set:
+                domain_set.append(da.split('-')[0])
+
+        cycle_start = []
+        for da in usr_da_list:
+            if len(da) == 1 and da[0][2] == 'general':
+                continue
+
+            if usr_da_list.count(da) > 1 and da not in cycle_start:
+                cycle_start.append(da)
+
+        domain_turn = []
+        for da in usr_da_list:
+            if len(da) > 0 and da[0] is not None and len(da[0]) > 2:
+                domain_turn.append(da[0][1].lower())
+
+        domains = []
+        for domain in domain_set:
+            domain_success = sess.evaluator.domain_success(domain)
+            if domain_success is not None:
+                domains.append({'domain': domain, 'success': domain_success,
+                                'inform': sess.evaluator.domain_reqt_inform_analyze(domain)})
+
+        record = {
+            'dialog_id': dialog_id,
+            'goal_seed': goal_seed,
+            'success': task_success,
+            'complete': sess.evaluator.complete,
+            'book_rate': sess.evaluator.book_rate(),
+            'inform': sess.evaluator.inform_F1(),
+            'percentage': sess.evaluator.final_goal_analyze(),
+            'goal': sess.evaluator.goal,
+            'step': step,
+            'domains': domains,
+            'failed_da_sys': failed_da_sys,
+            'failed_da_usr': failed_da_usr,
+            'cycle_start': cycle_start,
+            'domain_turn': domain_turn,
+            'log': flog.getvalue()
+        }
+        # round trip through json, so that fresh and stored records look the same
+        return _load_record(json.dumps(record, default=_to_json))
+
+    def sample_goals(self, goal_seeds):
+        """
+        Precompute the goal set shared by all models, the goal of dialogue j is sampled with `goal_seeds[j]`.
+        """
+        goals = []
+        for goal_seed in goal_seeds:
+            random.seed(goal_seed)
+            np.random.seed(goal_seed)
+            torch.manual_seed(goal_seed)
+            self.user_agent.init_session()
+            goals.append(deepcopy(self.user_agent.policy.policy.goal))
+        return goals
+
+    def iter_dialogs(self, jobs, sys_agents, num_workers=1):
+        """
+        Simulate dialogues in `num_workers` processes, yielding the records in the order they finish.
+
+        Args:
+            jobs: list of (model_name, dialog_id, goal_seed, goal)
+            sys_agents: dict, model name -> sys agent
+            num_workers: num of processes, 1 runs in this process
+        """
+        if num_workers == 1 or len(jobs) <= 1:
+            _init_worker(self, sys_agents)
+            for job in jobs:
+                yield job[0], _simulate(job)
+            return
+
+        with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(self, sys_agents)) as pool:
+            for model_name, record in pool.imap_unordered(_simulate_with_name, jobs):
+                yield model_name, record
+
+    def collect_records(self, sys_agents, goal_seeds, goals=None, num_workers=1, resume=False):
+        """
+        Simulate the dialogues of every model on the same goal set and store them in results/<model>/dialogues.jsonl.
+
+        With `resume`, dialogues already in the store with the same id, goal seed and goal, and simulated with the
+        same system and user agents (see `agent_fingerprint`), are loaded instead of simulated again, so a report
+        over one more model or more dialogues only simulates what is missing.
+
+        Returns:
+            dict, model name -> list of records ordered by dialogue id
+        """
+        goal_hashes = [goal_hash(None if goals is None else goals[j]) for j in range(len(goal_seeds))]
+        user_fingerprint = agent_fingerprint(self.user_agent)
+        stores, records, fingerprints, jobs = {}, {}, {}, []
+        for model_name in sys_agents:
+            fingerprints[model_name] = agent_fingerprint(sys_agents[model_name]) + '-' + user_fingerprint
+            output_dir = os.path.join('results', model_name)
+            os.makedirs(output_dir, exist_ok=True)
+            store_path = os.path.join(output_dir, 'dialogues.jsonl')
+            records[model_name] = _read_store(store_path, goal_seeds, goal_hashes, fingerprints[model_name]) \
+                if resume else {}
+            # rewrite what is kept, this also drops a line cut short by an interrupted run
+            stores[model_name] = open(store_path, 'w')
+            for dialog_id in sorted(records[model_name]):
+                stores[model_name].write(json.dumps(records[model_name][dialog_id]) + '\n')
+            stores[model_name].flush()
+            jobs += [(model_name, j, goal_seed, None if goals is None else goals[j])
+                     for j, goal_seed in enumerate(goal_seeds) if j not in records[model_name]]
+
+        try:
+            for model_name, record in tqdm(self.iter_dialogs(jobs, sys_agents, num_workers), total=len(jobs),
+                                           desc="dialogue"):
+                record['goal_hash'] = goal_hashes[record['dialog_id']]
+                record['fingerprint'] = fingerprints[model_name]
+                stores[model_name].write(json.dumps(record) + '\n')
+                stores[model_name].flush()
+                records[model_name][record['dialog_id']] = record
+        finally:
+            for store in stores.values():
+                store.close()
+
+        return {model_name: [records[model_name][j] for j in range(len(goal_seeds))] for model_name in sys_agents}
+
+    def comprehensive_analyze(self, sys_agent, model_name, total_dialog=100, goal_seeds=None, goals=None,
+                              num_workers=1, resume=False):
+        """
+        Args:
+            goal_seeds: list of per dialogue seeds, drawn from `random` if not given
+            goals: list of goals from `sample_goals`, None lets the user simulator sample them
+            num_workers: num of processes simulating dialogues
+            resume: reuse the dialogues stored by a previous run with the same goal seeds, goals and agents
+        """
+        if resume and goal_seeds is None:
+            raise ValueError('resume needs fixed goal_seeds, random ones never match the stored dialogues')
+        if goal_seeds is None:
+            goal_seeds = [random.randint(1, 100000) for _ in range(total_dialog)]
+        records = self.collect_records({model_name: sys_agent}, goal_seeds[:total_dialog], goals,
+                                       num_workers, resume)[model_name]
+        return self.report_records(records, sys_agent, model_name)
+
+    def report_records(self, records, sys_agent, model_name):
+        total_dialog = len(records)
         precision = []
         recall = []
         f1 = []
@@ -83,89 +392,25 @@ class Analyzer:
             datefmt="%m/%d/%Y %H:%M:%S",
             level=logging.INFO,
         )
-        if not os.path.exists('results'):
-            os.mkdir('results')
         output_dir = os.path.join('results', model_name)
-        if not os.path.exists(output_dir):
-            os.mkdir(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
         f = open(os.path.join(output_dir, 'res.txt'), 'w')
 
         flog = open(os.path.join(output_dir, 'log.txt'), 'w')
 
-        for j in tqdm(range(total_dialog), desc="dialogue"):
+        for j, record in enumerate(records):
             print('='*64, file=flog)
             print('Dialogue ID:', j, file=flog)
-            sys_response = '' if self.user_agent.nlu else []
-            random.seed(goal_seeds[0])
-            np.random.seed(goal_seeds[0])
-            torch.manual_seed(goal_seeds[0])
-            goal_seeds.pop(0)
-            sess.init_session()
+            flog.write(record['log'])
 
-            usr_da_list = []
-            failed_da_sys = []
-            failed_da_usr = []
-            last_sys_da = None
-
-            step = 0
-
-            # print('init goal:',file=f)
-            # # print(sess.evaluator.goal, file=f)
-            # # pprint(sess.evaluator.goal)
-            # print(sess.user_agent.policy.policy.goal.domain_goals, file=f)
-            # print('-' * 50,file=f)
-
-            for i in range(40):
-                sys_response, user_response, session_over, reward = sess.next_turn(
-                    sys_response)
-
-                print('-'*16, file=flog)
-                print('Turn Number:', i, file=flog)
-                # print('user in', sess.user_agent.get_in_da(),file=flog)
-                # print('user out', sess.user_agent.get_out_da(),file=flog)
-                #
-                # print('sys in', sess.sys_agent.get_in_da(),file=flog)
-                # print('sys out', sess.sys_agent.get_out_da(),file=flog)
-                print('User:', user_response, file=flog)
-                print('System:', sys_response, file=flog)
-                print('DST state:', sess.sys_agent.state_return()
-                      ['dst_state'], file=flog)
-
-                step += 2
-
-                if hasattr(sess.sys_agent, "get_in_da") and isinstance(sess.sys_agent.get_in_da(), list) \
-                        and sess.user_agent.get_out_da() != [] \
-                        and sess.user_agent.get_out_da() != sess.sys_agent.get_in_da():
-                    for da1 in sess.user_agent.get_out_da():
-                        for da2 in sess.sys_agent.get_in_da():
-                            if da1 != da2 and da1 is not None and da2 is not None and (da1, da2) not in failed_da_sys:
-                                failed_da_sys.append((da1, da2))
-
-                if isinstance(last_sys_da, list) \
-                        and last_sys_da is not None and last_sys_da != [] and sess.user_agent.get_in_da() != last_sys_da:
-                    for da1 in last_sys_da:
-                        for da2 in sess.user_agent.get_in_da():
-                            if da1 != da2 and da1 is not None and da2 is not None and (da1, da2) not in failed_da_usr:
-                                failed_da_usr.append((da1, da2))
-
-                last_sys_da = sess.sys_agent.get_out_da() if hasattr(
-                    sess.sys_agent, "get_out_da") else None
-                usr_da_list.append(sess.user_agent.get_out_da())
-
-                if session_over:
-                    break
-
-            task_success = sess.evaluator.task_success()
-            task_complete = sess.evaluator.complete
-            book_rate = sess.evaluator.book_rate()
-            stats = sess.evaluator.inform_F1()
+            task_success = record['success']
+            task_complete = record['complete']
+            book_rate = record['book_rate']
+            stats = record['inform']
+            percentage = record['percentage']
+            goal = record['goal']
+            step = record['step']
 
-            if task_success:
-                print('Dialogue succesfully completed!', file=flog)
-            else:
-                print('Dialogue NOT completed succesfully!', file=flog)
-
-            percentage = sess.evaluator.final_goal_analyze()
             if task_success:
                 suc_num += 1
                 turn_suc_num += step
@@ -178,15 +423,14 @@ class Analyzer:
             if book_rate is not None:
                 match.append(book_rate)
 
-            if len(sess.evaluator.goal) > 0:
-                num_domains += len(sess.evaluator.goal)
-                num_domains_satisfying_constraints += len(
-                    sess.evaluator.goal) * percentage
+            if len(goal) > 0:
+                num_domains += len(goal)
+                num_domains_satisfying_constraints += len(goal) * percentage
             num_dialogs_satisfying_constraints += (percentage == 1)
             if (j+1) % 100 == 0:
                 logger.info("model name %s", model_name)
                 logger.info("dialogue %d", j+1)
-                logger.info(sess.evaluator.goal)
+                logger.info(goal)
                 logger.info('task complete: %.3f', complete_num/(j+1))
                 logger.info('task success: %.3f', suc_num/(j+1))
                 logger.info('book rate: %.3f', np.mean(match))
@@ -197,31 +441,13 @@ class Analyzer:
                              (1 if num_domains == 0 else (num_domains_satisfying_constraints / num_domains)))
                 logging.info("percentage of dialogs that satisfy the database constraints: %.3f" % (
                     num_dialogs_satisfying_constraints / (j + 1)))
-            domain_set = []
-            for da in sess.evaluator.usr_da_array:
-                if da.split('-')[0] != 'general' and da.split('-')[0] not in domain_set:
-                    domain_set.append(da.split('-')[0])
 
             turn_num += step
 
-            da_list = usr_da_list
-            cycle_start = []
-            for da in usr_da_list:
-                if len(da) == 1 and da[0][2] == 'general':
-                    continue
-
-                if usr_da_list.count(da) > 1 and da not in cycle_start:
-                    cycle_start.append(da)
-
-            domain_turn = []
-            for da in usr_da_list:
-                if len(da) > 0 and da[0] is not None and len(da[0]) > 2:
-                    domain_turn.append(da[0][1].lower())
-
-            for domain in domain_set:
-                domain_success = sess.evaluator.domain_success(domain)
-                if domain_success is not None:
-                    reporter.record(domain, domain_success, sess.evaluator.domain_reqt_inform_analyze(domain), failed_da_sys, failed_da_usr, cycle_start, domain_turn)
+            for domain_record in record['domains']:
+                reporter.record(domain_record['domain'], domain_record['success'], domain_record['inform'],
+                                record['failed_da_sys'], record['failed_da_usr'], record['cycle_start'],
+                                record['domain_turn'])
 
         tmp = 0 if suc_num == 0 else turn_suc_num / suc_num
         print("=" * 100)
@@ -263,22 +489,38 @@ class Analyzer:
 
         return complete_num/total_dialog, suc_num/total_dialog, np.mean(precision), np.mean(recall), np.mean(f1), np.mean(match), turn_num / total_dialog
 
-    def compare_models(self, agent_list, model_name, total_dialog=100):
+    def compare_models(self, agent_list, model_name, total_dialog=100, seed=None, num_workers=1, resume=False,
+                       goal_bank=None):
+        """
+        Evaluate every model on one precomputed goal set. The dialogues of all models are simulated in the same
+        pool of `num_workers` processes, and with `resume` (which needs a fixed `seed`) dialogues stored by an
+        earlier run on the same goals with the same agents are reused, so adding a model to the comparison only
+        simulates the new model.
+        With `goal_bank` (path of a goal bank file) the goal set is the first `total_dialog` goals of the bank.
+        """
         if len(agent_list) != len(model_name):
             return
         if len(agent_list) <= 0:
             return
-
-        seed = random.randint(1, 100000)
+        if resume and seed is None:
+            raise ValueError('resume needs a fixed seed, the goal set of a random seed never matches the stored '
+                             'dialogues')
+
+        if seed is None:
+            seed = random.randint(1, 100000)
+        rng = random.Random(seed)
+        goal_seeds = [rng.randint(1, 100000) for _ in range(total_dialog)]
+        if goal_bank is not None:
+            from convlab.task.multiwoz.goal_bank import load_goal_bank
+            goals = load_goal_bank(goal_bank).goals(total_dialog)
+        else:
+            goals = self.sample_goals(goal_seeds)
+        records = self.collect_records(dict(zip(model_name, agent_list)), goal_seeds, goals, num_workers, resume)
 
         y0, y1, y2, y3, y4, y5, y6 = [], [], [], [], [], [], []
         for i in range(len(agent_list)):
-            random.seed(seed)
-            np.random.seed(seed)
-            torch.manual_seed(seed)
-            # print(model_name[i], total_dialog)
-            complete, suc, pre, rec, f1, match, turn = self.comprehensive_analyze(
-                agent_list[i], model_name[i], total_dialog)
+            complete, suc, pre, rec, f1, match, turn = self.report_records(
+                records[model_name[i]], agent_list[i], model_name[i])
             y0.append(complete)
             y1.append(suc)
             y2.append(pre)
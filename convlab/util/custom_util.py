@@ -6,18 +6,7 @@ import time
 import json
 import zipfile
 import numpy as np
-import torch
-from tensorboardX import SummaryWriter
-from convlab.task.multiwoz.goal_generator import GoalGenerator
 from convlab.util.file_util import cached_path
-from convlab.policy.evaluate_distributed import evaluate_distributed
-from convlab.util.train_util_neo import init_logging_nunu
-from convlab.dialog_agent.agent import PipelineAgent
-from convlab.dialog_agent.session import BiSession
-from convlab.dialog_agent.env import Environment
-from convlab.dst.rule.multiwoz import RuleDST
-from convlab.policy.rule.multiwoz import RulePolicy
-from convlab.evaluator.multiwoz_eval import MultiWozEvaluator
 from convlab.util import load_dataset
 
 import shutil
@@ -30,8 +19,18 @@ slot_mapping = {"pricerange": "price range", "post": "postcode", "arriveBy": "ar
 sys.path.append(os.path.dirname(os.path.dirname(
     os.path.dirname(os.path.abspath(__file__)))))
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-device = DEVICE
+# torch, tensorboardX and the dialogue components are imported where they are used, so that light-weight
+# helpers such as flatten_acts can be imported without them
+
+
+def __getattr__(name):
+    # DEVICE and device are resolved on first access, as they need torch
+    if name in ('DEVICE', 'device'):
+        import torch
+        value = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        globals()['DEVICE'] = globals()['device'] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class timeout:
@@ -108,6 +107,7 @@ def save_config(terminal_args, config_file_args, config_save_path, policy_config
 
 
 def set_seed(seed):
+    import torch
     random.seed(seed)
     np.random.seed(seed)
     torch.manual_seed(seed)
@@ -118,6 +118,8 @@ def set_seed(seed):
 
 
 def init_logging(root_dir, mode):
+    from tensorboardX import SummaryWriter
+    from convlab.util.train_util_neo import init_logging_nunu
     current_time = time.strftime("%Y-%m-%d-%H-%M-%S", time.localtime())
     dir_path = os.path.join(root_dir, f'experiments/experiment_{current_time}')
     # init_logging_nunu(dir_path)
@@ -127,7 +129,7 @@ def init_logging(root_dir, mode):
     config_save_path = os.path.join(dir_path, 'configs')
     os.makedirs(config_save_path, exist_ok=True)
     logger = logging.getLogger()
-    logging.info(f"Visible device: {device}")
+    logging.info(f"Visible device: {__getattr__('device')}")
     tb_writer = SummaryWriter(os.path.join(dir_path, f'TB_summary'))
     return logger, tb_writer, current_time, save_path, config_save_path, dir_path, log_save_path
 
@@ -158,59 +160,89 @@ def save_best(policy_sys, best_complete_rate, best_success_rate, best_return, co
     return best_complete_rate, best_success_rate, best_return
 
 
+# evaluation goals of eval_policy, they are the same for every call with the same config
+_eval_goals = {}
+
+
+def eval_goals(conf, single_domain_goals=False, allowed_domains=None):
+    """
+    The goals of eval_policy: the first num_eval_dialogues matching goals of the goal bank in conf['model']['goal_bank']
+    if there is one, otherwise goals of a GoalGenerator sampled with seeds 1000, 1001, ...
+    """
+    num_goals = conf['model']['num_eval_dialogues']
+    goal_bank = conf['model'].get('goal_bank')
+    key = (num_goals, goal_bank, single_domain_goals, None if allowed_domains is None else tuple(allowed_domains))
+    if key not in _eval_goals:
+        if goal_bank:
+            from convlab.task.multiwoz.goal_bank import load_goal_bank
+            goals = load_goal_bank(goal_bank).goals(num_goals, single_domain_goals, allowed_domains)
+        else:
+            from convlab.task.multiwoz.goal_generator import GoalGenerator
+            goal_generator = GoalGenerator()
+            goals = []
+            for seed in range(1000, 1000 + num_goals):
+                set_seed(seed)
+                goal = create_goals(goal_generator, 1,
+                                    single_domain_goals, allowed_domains)
+                goals.append(goal[0])
+        _eval_goals[key] = goals
+    # goals are copied per dialogue by the evaluation engine, the cached ones stay untouched
+    return _eval_goals[key]
+
+
+# evaluation engines kept between calls of eval_policy, so that pool workers stay warm during training,
+# closed by close_eval_engines
+_eval_engines = {}
+
+
+def close_eval_engines(sess=None):
+    """close the evaluation engines eval_policy keeps for `sess`, or all of them, e.g. at the end of training"""
+    for key in list(_eval_engines):
+        if sess is None or key[0] == id(sess):
+            _eval_engines.pop(key).close()
+
+
 def eval_policy(conf, policy_sys, env, sess, save_eval, log_save_path, single_domain_goals=False, allowed_domains=None):
+    from convlab.policy.eval_engine import EvaluationEngine, build_backend, summarize
     policy_sys.is_train = False
 
-    goal_generator = GoalGenerator()
-    goals = []
-    for seed in range(1000, 1000 + conf['model']['num_eval_dialogues']):
-        set_seed(seed)
-        goal = create_goals(goal_generator, 1,
-                            single_domain_goals, allowed_domains)
-        goals.append(goal[0])
+    goals = eval_goals(conf, single_domain_goals, allowed_domains)
 
     if conf['model']['process_num'] == 1 or save_eval:
-        complete_rate, success_rate, success_rate_strict, avg_return, turns, \
-            avg_actions, task_success, book_acts, inform_acts, request_acts, \
-            select_acts, offer_acts, recommend_acts = evaluate(sess,
-                                                               num_dialogues=conf['model']['num_eval_dialogues'],
-                                                               sys_semantic_to_usr=conf['model'][
-                                                                   'sys_semantic_to_usr'],
-                                                               save_flag=save_eval, save_path=log_save_path, goals=goals)
-
-        total_acts = book_acts + inform_acts + request_acts + \
-            select_acts + offer_acts + recommend_acts
+        backend = conf['model'].get('eval_backend', 'inprocess')
     else:
-        complete_rate, success_rate, success_rate_strict, avg_return, turns, \
-            avg_actions, task_success, book_acts, inform_acts, request_acts, \
-            select_acts, offer_acts, recommend_acts = \
-            evaluate_distributed(sess, list(range(1000, 1000 + conf['model']['num_eval_dialogues'])),
-                                 conf['model']['process_num'], goals)
-        total_acts = book_acts + inform_acts + request_acts + \
-            select_acts + offer_acts + recommend_acts
-
-        task_success_gathered = {}
-        for task_dict in task_success:
-            for key, value in task_dict.items():
-                if key not in task_success_gathered:
-                    task_success_gathered[key] = []
-                task_success_gathered[key].append(value)
-        task_success = task_success_gathered
+        backend = conf['model'].get('eval_backend', 'pool')
+    if save_eval and backend != 'inprocess':
+        raise ValueError(f"save_eval needs the inprocess eval_backend, the {backend} backend does not collect the "
+                         f"saves of the system agent")
+    key = (id(sess), backend, save_eval)
+    if key not in _eval_engines:
+        _eval_engines[key] = EvaluationEngine(build_backend(
+            sess, backend, num_workers=conf['model']['process_num'],
+            batch_size=conf['model'].get('eval_batch_size', 8),
+            sys_semantic_to_usr=conf['model']['sys_semantic_to_usr'],
+            **({'collect_saves': True} if save_eval else {})))
+    engine = _eval_engines[key]
+    # the dialogue with seed 1000 + i runs on the i-th goal from the end, like evaluate
+    results = engine.run(goals[::-1])
+    if save_eval:
+        import torch
+        eval_save = {f'Conversation {i}': result['agent_saves'] for i, result in enumerate(results)}
+        torch.save(eval_save, os.path.join(log_save_path, 'evaluate_INFO.pt'))
+    summary, task_success = summarize(results)
 
     policy_sys.is_train = True
 
-    mean_complete, err_complete = np.average(complete_rate), np.std(
-        complete_rate) / np.sqrt(len(complete_rate))
-    mean_success, err_success = np.average(success_rate), np.std(
-        success_rate) / np.sqrt(len(success_rate))
-    mean_success_strict, err_success_strict = np.average(success_rate_strict), np.std(
-        success_rate_strict) / np.sqrt(len(success_rate_strict))
-    mean_return, err_return = np.average(avg_return), np.std(
-        avg_return) / np.sqrt(len(avg_return))
-    mean_turns, err_turns = np.average(
-        turns), np.std(turns) / np.sqrt(len(turns))
-    mean_actions, err_actions = np.average(avg_actions), np.std(
-        avg_actions) / np.sqrt(len(avg_actions))
+    def mean_err(key):
+        values = [result[key] for result in results]
+        return np.average(values), np.std(values) / np.sqrt(len(values))
+
+    mean_complete, err_complete = mean_err('complete')
+    mean_success, err_success = mean_err('success')
+    mean_success_strict, err_success_strict = mean_err('success_strict')
+    mean_return, err_return = mean_err('total_return')
+    mean_turns, err_turns = mean_err('turns')
+    mean_actions, err_actions = mean_err('avg_actions')
 
     logging.info(f"Complete: {mean_complete}+-{round(err_complete, 2)}, "
                  f"Success: {mean_success}+-{round(err_success, 2)}, "
@@ -218,9 +250,9 @@ def eval_policy(conf, policy_sys, env, sess, save_eval, log_save_path, single_do
                  f"Average Return: {mean_return}+-{round(err_return, 2)}, "
                  f"Turns: {mean_turns}+-{round(err_turns, 2)}, "
                  f"Average Actions: {mean_actions}+-{round(err_actions, 2)}, "
-                 f"Book Actions: {book_acts/total_acts}, Inform Actions: {inform_acts/total_acts}, "
-                 f"Request Actions: {request_acts/total_acts}, Select Actions: {select_acts/total_acts}, "
-                 f"Offer Actions: {offer_acts/total_acts}, Recommend Actions: {recommend_acts/total_acts}")
+                 f"Book Actions: {summary['book_acts']}, Inform Actions: {summary['inform_acts']}, "
+                 f"Request Actions: {summary['request_acts']}, Select Actions: {summary['select_acts']}, "
+                 f"Offer Actions: {summary['offer_acts']}, Recommend Actions: {summary['recommend_acts']}")
 
     for key in task_success:
         logging.info(
@@ -232,15 +264,19 @@ def eval_policy(conf, policy_sys, env, sess, save_eval, log_save_path, single_do
             "avg_return": mean_return,
             "turns": mean_turns,
             "avg_actions": mean_actions,
-            "book_acts": book_acts/total_acts,
-            "inform_acts": inform_acts/total_acts,
-            "request_acts": request_acts/total_acts,
-            "select_acts": select_acts/total_acts,
-            "offer_acts": offer_acts/total_acts,
-            "recommend_acts": recommend_acts/total_acts}
+            "book_acts": summary['book_acts'],
+            "inform_acts": summary['inform_acts'],
+            "request_acts": summary['request_acts'],
+            "select_acts": summary['select_acts'],
+            "offer_acts": summary['offer_acts'],
+            "recommend_acts": summary['recommend_acts']}
 
 
 def env_config(conf, policy_sys, check_book_constraints=True):
+    from convlab.dialog_agent.agent import PipelineAgent
+    from convlab.dialog_agent.session import BiSession
+    from convlab.dialog_agent.env import Environment
+    from convlab.evaluator.multiwoz_eval import MultiWozEvaluator
     nlu_sys = conf['nlu_sys_activated']
     dst_sys = conf['dst_sys_activated']
     sys_nlg = conf['sys_nlg_activated']
@@ -258,6 +294,11 @@ def env_config(conf, policy_sys, check_book_constraints=True):
         except:
             logging.info('Uncertainty threshold not set.')
 
+    # the agenda user simulator samples its training goals from the goal bank
+    if conf['model'].get('goal_bank') and hasattr(getattr(policy_usr, 'policy', None), 'goal_generator'):
+        from convlab.task.multiwoz.goal_bank import load_goal_bank
+        policy_usr.policy.goal_generator = load_goal_bank(conf['model']['goal_bank'])
+
     simulator = PipelineAgent(nlu_usr, dst_usr, policy_usr, usr_nlg, 'user')
     system_pipeline = PipelineAgent(nlu_sys, dst_sys, policy_sys, sys_nlg,
                                     'sys')  # , return_semantic_acts=conf['model']['sys_semantic_to_usr'])
@@ -273,6 +314,12 @@ def env_config(conf, policy_sys, check_book_constraints=True):
 
 
 def create_env(args, policy_sys):
+    from convlab.dialog_agent.agent import PipelineAgent
+    from convlab.dialog_agent.session import BiSession
+    from convlab.dialog_agent.env import Environment
+    from convlab.dst.rule.multiwoz import RuleDST
+    from convlab.policy.rule.multiwoz import RulePolicy
+    from convlab.evaluator.multiwoz_eval import MultiWozEvaluator
     if args.use_setsumbt_tracker:
         from convlab.nlu.jointBERT.multiwoz import BERTNLU
         from convlab.nlg.template.multiwoz import TemplateNLG
@@ -331,110 +378,33 @@ def create_env(args, policy_sys):
 
 
 def evaluate(sess, num_dialogues=400, sys_semantic_to_usr=False, save_flag=False, save_path=None, goals=None):
-    eval_save = {}
-    turn_counter_dict = {}
-    turn_counter = 0.0
-
-    task_success = {'All_user_sim': [], 'All_evaluator': [], "All_evaluator_strict": [],
-                    'total_return': [], 'turns': [], 'avg_actions': [],
-                    'total_booking_acts': [], 'total_inform_acts': [], 'total_request_acts': [],
-                    'total_select_acts': [], 'total_offer_acts': [], 'total_recommend_acts': []}
-    dial_count = 0
-    for seed in range(1000, 1000 + num_dialogues):
-        set_seed(seed)
-        goal = goals.pop()
-        sess.init_session(goal=goal)
-        sys_response = [] if sess.sys_agent.nlg is None else ''
-        sys_response = [] if sys_semantic_to_usr else sys_response
-        avg_actions = 0
-        total_return = 0.0
-        turns = 0
-        book = 0
-        inform = 0
-        request = 0
-        select = 0
-        offer = 0
-        recommend = 0
-        # this 40 represents the max turn of dialogue
-        for i in range(40):
-            sys_response, user_response, session_over, reward = sess.next_turn(
-                sys_response)
-
-            if len(sys_response) not in turn_counter_dict:
-                turn_counter_dict[len(sys_response)] = 1
-            else:
-                turn_counter_dict[len(sys_response)] += 1
-
-            acts = sess.sys_agent.dst.state['system_action']
-            for intent, domain, _, _ in acts:
-                if intent.lower() == 'book':
-                    book += 1
-                if intent.lower() == 'inform':
-                    inform += 1
-                if intent.lower() == 'request':
-                    request += 1
-                if intent.lower() == 'select':
-                    select += 1
-                if intent.lower() == 'offerbook':
-                    offer += 1
-                if intent.lower() == 'recommend':
-                    recommend += 1
-            avg_actions += len(acts)
-            turn_counter += 1
-            turns += 1
-            total_return += reward
-
-            if session_over is True:
-                task_succ = sess.evaluator.task_success()
-                complete = sess.evaluator.complete
-                task_succ = sess.evaluator.success
-                task_succ_strict = sess.evaluator.success_strict
-                break
-        else:
-            complete = 0
-            task_succ = 0
-            task_succ_strict = 0
-
-        for key in sess.evaluator.goal:
-            if key not in task_success:
-                task_success[key] = []
-            else:
-                task_success[key].append(task_succ_strict)
-
-        task_success['All_user_sim'].append(complete)
-        task_success['All_evaluator'].append(task_succ)
-        task_success['All_evaluator_strict'].append(task_succ_strict)
-        total_return = 80 if task_succ_strict else -40
-        total_return -= turns
-        task_success['total_return'].append(total_return)
-        task_success['turns'].append(turns)
-        task_success['avg_actions'].append(avg_actions / turns)
-
-        task_success['total_booking_acts'].append(book)
-        task_success['total_inform_acts'].append(inform)
-        task_success['total_request_acts'].append(request)
-        task_success['total_select_acts'].append(select)
-        task_success['total_offer_acts'].append(offer)
-        task_success['total_offer_acts'].append(offer)
-        task_success['total_recommend_acts'].append(recommend)
-
-        # print(agent_sys.agent_saves)
-        eval_save['Conversation {}'.format(str(dial_count))] = [
-            i for i in sess.sys_agent.agent_saves]
-        sess.sys_agent.agent_saves.clear()
-        dial_count += 1
-        # print('length of dict ' + str(len(eval_save)))
+    """run `num_dialogues` dialogues in this process, on goals[-1 - i] with seed 1000 + i"""
+    from convlab.policy.eval_engine import EvaluationEngine, InProcessBackend
+    engine = EvaluationEngine(InProcessBackend(sess, sys_semantic_to_usr=sys_semantic_to_usr, collect_saves=save_flag))
+    results = engine.run(goals[::-1][:num_dialogues])
+
+    task_success = {'All_user_sim': [result['complete'] for result in results],
+                    'All_evaluator': [result['success'] for result in results],
+                    'All_evaluator_strict': [result['success_strict'] for result in results],
+                    'total_return': [result['total_return'] for result in results],
+                    'turns': [result['turns'] for result in results],
+                    'avg_actions': [result['avg_actions'] for result in results]}
+    for result in results:
+        for key in result['domains']:
+            task_success.setdefault(key, []).append(result['success_strict'])
 
     if save_flag:
+        import torch
+        eval_save = {f'Conversation {i}': result['agent_saves'] for i, result in enumerate(results)}
         torch.save(eval_save, os.path.join(save_path, 'evaluate_INFO.pt'))
-    # save dialogue_info and clear mem
+
+    def average_acts(key):
+        return np.average([result[f'{key}_acts'] for result in results])
 
     return task_success['All_user_sim'], task_success['All_evaluator'], task_success['All_evaluator_strict'], \
         task_success['total_return'], task_success['turns'], task_success['avg_actions'], task_success, \
-        np.average(task_success['total_booking_acts']), np.average(task_success['total_inform_acts']), \
-        np.average(task_success['total_request_acts']), np.average(task_success['total_select_acts']), \
-        np.average(task_success['total_offer_acts']), np.average(
-            task_success['total_recommend_acts'])
+        average_acts('book'), average_acts('inform'), average_acts('request'), average_acts('select'), \
+        average_acts('offer'), average_acts('recommend')
 
 
 def model_downloader(download_dir, model_path):
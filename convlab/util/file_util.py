@@ -2,10 +2,11 @@ from pathlib import Path
 import zipfile
 import json
 import os
-from convlab.util.allennlp_file_utils import cached_path as allennlp_cached_path
 
 
 def cached_path(file_path, cached_dir=None):
+    # imported here since it pulls in boto3 and requests
+    from convlab.util.allennlp_file_utils import cached_path as allennlp_cached_path
     print('Load from', file_path)
     if not cached_dir:
         cached_dir = str(Path(Path.home() / '.convlab') / "cache")
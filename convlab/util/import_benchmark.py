@@ -0,0 +1,67 @@
+"""
+Measure how long importing parts of convlab takes in a fresh interpreter, and which heavy dependencies get loaded.
+
+    python -m convlab.util.import_benchmark
+    python -m convlab.util.import_benchmark "from convlab.dst.rule.multiwoz import RuleDST" --repeat 5
+"""
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+HEAVY_MODULES = ['torch', 'transformers', 'tensorflow', 'sentence_transformers', 'datasets', 'openai', 'litellm',
+                 'boto3', 'spacy', 'tensorboardX', 'nltk']
+
+DEFAULT_STATEMENTS = [
+    'import convlab',
+    'import convlab.policy.vector.vector_base',
+    'from convlab.dst.rule.multiwoz import RuleDST',
+    'from convlab.policy.rule.multiwoz.policy_agenda_multiwoz import UserPolicyAgendaMultiWoz',
+    'from convlab.dst.rule.multiwoz import RuleDST\n'
+    'from convlab.policy.rule.multiwoz import RulePolicy\n'
+    'from convlab.dialog_agent import PipelineAgent',
+    'import convlab.base_models.llm',
+    'from convlab.util.custom_util import set_seed, flatten_acts',
+]
+
+_SNIPPET = '''
+import json, sys, time
+start = time.perf_counter()
+exec(compile({statement!r}, '<benchmark>', 'exec'))
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_import(statement, repeat=3):
+    """Run `statement` in `repeat` fresh interpreters, return the best wall time and the heavy modules it loaded."""
+    best, heavy = None, []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _SNIPPET.format(statement=statement, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        if best is None or result['seconds'] < best:
+            best = result['seconds']
+        heavy = result['heavy']
+    return best, heavy
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('statements', nargs='*', default=DEFAULT_STATEMENTS, help='import statements to time')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters per statement, the best is kept')
+    args = parser.parse_args()
+
+    for statement in args.statements:
+        try:
+            seconds, heavy = time_import(statement, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print(f'{statement!r} failed:\n{e.stderr}')
+            continue
+        print(f"{seconds:8.3f}s  {'; '.join(statement.splitlines())}")
+        if heavy:
+            print(f"           loads {', '.join(heavy)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""
+Helpers to defer imports until an attribute is first used (PEP 562).
+
+Package ``__init__`` files re-export model classes whose modules pull in torch, transformers and friends. With
+``lazy_getattr`` the re-exports stay available as before, but the module is only imported on first access, so
+importing e.g. ``convlab.policy.rule.multiwoz`` no longer loads every model of the package tree.
+"""
+import importlib
+import sys
+
+
+def lazy_getattr(package_name, attr_to_module):
+    """Build a module-level ``__getattr__`` resolving re-exported names on first access.
+
+    :param package_name: ``__name__`` of the package defining the re-exports
+    :param attr_to_module: maps an exported name to the module defining it, or to a (module, attribute) pair
+                           when the attribute is exported under another name
+    :return: a function to assign to the package's ``__getattr__``
+    """
+    def __getattr__(name):
+        if name not in attr_to_module:
+            raise AttributeError(f"module {package_name!r} has no attribute {name!r}")
+        target = attr_to_module[name]
+        module_name, attr = (target, name) if isinstance(target, str) else target
+        value = getattr(importlib.import_module(module_name), attr)
+        # cache on the package, so that later accesses don't go through __getattr__
+        setattr(sys.modules[package_name], name, value)
+        return value
+
+    return __getattr__
+
@@ -1,24 +1,17 @@
 """
 """
-import json
-import os
 import random
-from fuzzywuzzy import fuzz
-from itertools import chain
 from copy import deepcopy
 
+from convlab.util.multiwoz.entity_store import get_entity_store, query_table
+
 
 class Database(object):
     def __init__(self):
         super(Database, self).__init__()
-        # loading databases
-        domains = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'taxi', 'police']
-        self.dbs = {}
-        for domain in domains:
-            with open(os.path.join(os.path.dirname(
-                    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
-                    'data/multiwoz/db/{}_db.json'.format(domain))) as f:
-                self.dbs[domain] = json.load(f)
+        # loading databases, shared by all Database objects of the process
+        self.tables = get_entity_store('multiwoz')
+        self.dbs = {domain: table.entities for domain, table in self.tables.items()}
 
     def query(self, domain, constraints, ignore_open=False, soft_contraints=(), fuzzy_match_ratio=60):
         """Returns the list of entities for a given domain
@@ -41,49 +34,7 @@ class Database(object):
                 return [deepcopy(x) for x in self.dbs['hospital'] if x['department'].lower() == department.strip().lower()]
         constraints = list(map(lambda ele: ele if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), constraints))
 
-        found = []
-        for i, record in enumerate(self.dbs[domain]):
-            constraints_iterator = zip(constraints, [False] * len(constraints))
-            soft_contraints_iterator = zip(soft_contraints, [True] * len(soft_contraints))
-            for (key, val), fuzzy_match in chain(constraints_iterator, soft_contraints_iterator):
-                if val == "" or val == "dont care" or val == 'not mentioned' or val == "don't care" or val == "dontcare" or val == "do n't care":
-                    pass
-                else:
-                    try:
-                        record_keys = [k.lower() for k in record]
-                        if key.lower() not in record_keys:
-                            continue
-                        if key == 'leaveAt':
-                            val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
-                            val2 = int(record['leaveAt'].split(':')[0]) * 100 + int(record['leaveAt'].split(':')[1])
-                            if val1 > val2:
-                                break
-                        elif key == 'arriveBy':
-                            val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
-                            val2 = int(record['arriveBy'].split(':')[0]) * 100 + int(record['arriveBy'].split(':')[1])
-                            if val1 < val2:
-                                break
-                        # elif ignore_open and key in ['destination', 'departure', 'name']:
-                        elif ignore_open and key in ['destination', 'departure']:
-                            continue
-                        elif record[key].strip() == '?':
-                            # '?' matches any constraint
-                            continue
-                        else:
-                            if not fuzzy_match:
-                                if val.strip().lower() != record[key].strip().lower():
-                                    break
-                            else:
-                                if fuzz.partial_ratio(val.strip().lower(), record[key].strip().lower()) < fuzzy_match_ratio:
-                                    break
-                    except:
-                        continue
-            else:
-                res = deepcopy(record)
-                res['Ref'] = '{0:08d}'.format(i)
-                found.append(res)
-
-        return found
+        return query_table(self.tables[domain], constraints, ignore_open, soft_contraints, fuzzy_match_ratio)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,205 @@
+"""
+Entity store shared by the MultiWOZ database implementations.
+
+Database files are loaded once per process, on first use, and are never modified by the queries afterwards, so
+all Database objects of a process use the same entities and workers forked after loading do not read them again.
+Each domain gets an EntityTable with indexes from attribute values to entity ids, built on first use. The query
+functions keep their own matching rules and only use the indexes to skip entities that can not match.
+"""
+import json
+import os
+import threading
+from itertools import chain
+
+from fuzzywuzzy import fuzz
+
+DB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                      'data/multiwoz/db')
+DOMAINS = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'taxi', 'police']
+DONTCARE_VALUES = ["", "dont care", 'not mentioned', "don't care", "dontcare", "do n't care"]
+
+_lock = threading.RLock()
+_tables = {}
+_stores = {}
+
+
+def _normalize(value):
+    return value.strip().lower()
+
+
+def copy_entity(value):
+    """Deep copy of a json value (dicts, lists and scalars), faster than copy.deepcopy."""
+    if isinstance(value, dict):
+        return {k: copy_entity(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_entity(v) for v in value]
+    return value
+
+
+class EntityTable:
+    """
+    The entities of one domain as loaded from json, with indexes built on first use:
+        - per attribute, the ids of the entities by normalized (stripped, lower-cased) value
+        - the lower-cased attribute names of every entity
+    Tables that are no list of entities (e.g. the taxi database) are kept as they are and have no index.
+    """
+
+    def __init__(self, entities):
+        self.entities = entities
+        self._indexes = {}
+        self._lower_keys = None
+
+    def __len__(self):
+        return len(self.entities)
+
+    def index(self, attribute):
+        """
+        Returns:
+            values (dict): normalized value -> ids of the entities with that value of `attribute`
+            wildcard (list): ids of the entities without a string value of `attribute` or with value '?'
+        """
+        if attribute not in self._indexes:
+            with _lock:
+                values, wildcard = {}, []
+                for idx, entity in enumerate(self.entities):
+                    value = entity.get(attribute) if isinstance(entity, dict) else None
+                    if not isinstance(value, str) or value.strip() == '?':
+                        wildcard.append(idx)
+                    else:
+                        values.setdefault(_normalize(value), []).append(idx)
+                self._indexes[attribute] = (values, wildcard)
+        return self._indexes[attribute]
+
+    def lower_keys(self, idx):
+        if self._lower_keys is None:
+            with _lock:
+                self._lower_keys = [frozenset(k.lower() for k in entity) for entity in self.entities]
+        return self._lower_keys[idx]
+
+    def candidates(self, constraints):
+        """
+        Ids, in order, of the entities that can match all (attribute, value) pairs of `constraints`: the value of
+        the attribute equals the value up to case and surrounding spaces, or is in the wildcard of the index.
+        Constraints whose value is no string are ignored.
+        """
+        ids = None
+        for attribute, value in constraints:
+            if not isinstance(value, str) or not isinstance(attribute, str):
+                continue
+            values, wildcard = self.index(attribute)
+            matched = values.get(_normalize(value), ())
+            matched = set(chain(matched, wildcard)) if wildcard else set(matched)
+            ids = matched if ids is None else ids & matched
+            if not ids:
+                return []
+        if ids is None:
+            return range(len(self.entities))
+        return sorted(ids)
+
+
+def load_table(path, lower=False):
+    """
+    The EntityTable of a json database file, loaded once per process.
+    Args:
+        path (str): path of the json file
+        lower (bool): lower-case the whole file (keys and values) before parsing it
+    """
+    key = (os.path.abspath(path), lower)
+    if key not in _tables:
+        with _lock:
+            if key not in _tables:
+                with open(path) as f:
+                    text = f.read()
+                _tables[key] = EntityTable(json.loads(text.lower() if lower else text))
+    return _tables[key]
+
+
+def get_entity_store(name='multiwoz', loader=None):
+    """
+    Domain -> EntityTable of the database `name`, loaded once per process.
+    Args:
+        name (str): 'multiwoz' for the databases in data/multiwoz/db, any other name needs a `loader`
+        loader (callable): returns domain -> entities (json), called on first use of `name`
+    """
+    if name not in _stores:
+        with _lock:
+            if name not in _stores:
+                if loader is None:
+                    if name != 'multiwoz':
+                        raise ValueError(f'no loader for the entity store {name}')
+                    tables = {domain: load_table(os.path.join(DB_DIR, f'{domain}_db.json')) for domain in DOMAINS}
+                else:
+                    tables = {domain: EntityTable(entities) for domain, entities in loader().items()}
+                _stores[name] = tables
+    return _stores[name]
+
+
+def hard_constraints(constraints, ignore_open=False, dontcare_values=DONTCARE_VALUES):
+    """the constraints `match_entity` compares by equality, used to select the candidates of a query"""
+    return [(key, val) for key, val in constraints if val not in dontcare_values and key not in ['leaveAt', 'arriveBy']
+            and not (ignore_open and key in ['destination', 'departure'])]
+
+
+def match_entity(record, record_keys, constraints, soft_contraints=(), ignore_open=False, fuzzy_match_ratio=60,
+                 dontcare_values=DONTCARE_VALUES):
+    """
+    Whether `record` satisfies the hard `constraints` and the fuzzy `soft_contraints` of a MultiWOZ query.
+    Args:
+        record_keys: the lower-cased attribute names of `record`
+    """
+    constraints_iterator = zip(constraints, [False] * len(constraints))
+    soft_contraints_iterator = zip(soft_contraints, [True] * len(soft_contraints))
+    for (key, val), fuzzy_match in chain(constraints_iterator, soft_contraints_iterator):
+        if val in dontcare_values:
+            pass
+        else:
+            try:
+                if key.lower() not in record_keys:
+                    continue
+                if key == 'leaveAt':
+                    val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
+                    val2 = int(record['leaveAt'].split(':')[0]) * 100 + int(record['leaveAt'].split(':')[1])
+                    if val1 > val2:
+                        return False
+                elif key == 'arriveBy':
+                    val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
+                    val2 = int(record['arriveBy'].split(':')[0]) * 100 + int(record['arriveBy'].split(':')[1])
+                    if val1 < val2:
+                        return False
+                # elif ignore_open and key in ['destination', 'departure', 'name']:
+                elif ignore_open and key in ['destination', 'departure']:
+                    continue
+                elif record[key].strip() == '?':
+                    # '?' matches any constraint
+                    continue
+                else:
+                    if not fuzzy_match:
+                        if val.strip().lower() != record[key].strip().lower():
+                            return False
+                    else:
+                        if fuzz.partial_ratio(val.strip().lower(), record[key].strip().lower()) < fuzzy_match_ratio:
+                            return False
+            except:
+                continue
+    return True
+
+
+def query_table(table, constraints, ignore_open=False, soft_contraints=(), fuzzy_match_ratio=60, topk=None,
+                dontcare_values=DONTCARE_VALUES):
+    """
+    Copies of the entities of `table` that satisfy the constraints, with their position as 'Ref', in order.
+    Args:
+        topk (int): stop after `topk` entities, all entities if None
+    """
+    found = []
+    ids = table.candidates(hard_constraints(constraints, ignore_open, dontcare_values))
+    for i in ids:
+        record = table.entities[i]
+        if match_entity(record, table.lower_keys(i), constraints, soft_contraints, ignore_open, fuzzy_match_ratio,
+                        dontcare_values):
+            res = copy_entity(record)
+            res['Ref'] = '{0:08d}'.format(i)
+            found.append(res)
+            if len(found) == topk:
+                break
+    return found
@@ -0,0 +1,121 @@
+"""
+Read-only access to the sqlite databases of MultiWOZ behind the database pointers of MDRG, LaRL and LAVA, one
+`{domain}-dbase.db` file per domain holding a table named after the domain.
+
+Connections are opened on first use, one per thread and process, so a SQLiteDB can be created at import time and
+used from several threads and from forked workers. Every database is copied into memory, where each column gets
+an index; the files are never written. Queries bind their values as parameters and are built from the columns
+and operators only, so sqlite3 reuses the prepared statement of every query shape.
+"""
+import os
+import re
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+CACHED_STATEMENTS = 256
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteDB:
+    def __init__(self, db_dir, domains, file_name='{}-dbase.db'):
+        """
+        Args:
+            db_dir (str): directory of the database files, relative paths are resolved now
+            domains (list): domains (and tables) that may be queried
+            file_name (str): file name pattern of the database of a domain
+        """
+        self.db_dir = os.path.abspath(db_dir)
+        self.domains = list(domains)
+        self.file_name = file_name
+        self._local = threading.local()
+        self._columns = {}
+
+    def path(self, domain):
+        return os.path.join(self.db_dir, self.file_name.format(domain))
+
+    def connection(self, domain):
+        """the connection of the current thread to the (in-memory copy of the) database of `domain`"""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            # first use in this thread, or a thread forked from a process that used it
+            local.pid = os.getpid()
+            local.connections = {}
+        if domain not in local.connections:
+            if domain not in self.domains:
+                raise sqlite3.OperationalError(f'no such table: {domain}')
+            local.connections[domain] = self._connect(domain)
+        return local.connections[domain]
+
+    def _connect(self, domain):
+        source = sqlite3.connect(f'file:{pathname2url(self.path(domain))}?mode=ro', uri=True)
+        try:
+            conn = sqlite3.connect(':memory:', cached_statements=CACHED_STATEMENTS)
+            source.backup(conn)
+        finally:
+            source.close()
+        tables = [row[0] for row in conn.execute("select name from sqlite_master where type = 'table'")]
+        for table in tables:
+            for column in [col[1] for col in conn.execute(f'PRAGMA table_info({_quote(table)})')]:
+                conn.execute(f'create index {_quote(f"{table}_{column}_idx")} on {_quote(table)} ({_quote(column)})')
+        conn.execute('analyze')
+        return conn
+
+    def columns(self, domain):
+        """column names of the table of `domain`"""
+        if domain not in self._columns:
+            columns = [col[1] for col in self.connection(domain).execute(f'PRAGMA table_info({_quote(domain)})')]
+            if not columns:
+                raise sqlite3.OperationalError(f'no such table: {domain}')
+            self._columns[domain] = columns
+        return self._columns[domain]
+
+    def _statement(self, domain, constraints, count):
+        # keys name columns as plain sql identifiers: case-insensitively, and unknown ones or ones that are no
+        # identifier (e.g. 'entrance fee') fail
+        columns = {column.lower(): column for column in self.columns(domain) if IDENTIFIER.fullmatch(column)}
+        conditions, params = [], []
+        for key, op, value in constraints:
+            if op not in ('=', '<', '>'):
+                raise ValueError(f'unsupported operator {op}')
+            column = columns.get(key.lower())
+            if column is None:
+                raise sqlite3.OperationalError(f'no such column: {key}')
+            conditions.append(f'{_quote(column)} {op} ?')
+            params.append(value)
+        sql = f"select {'count(*)' if count else '*'} from {_quote(domain)}"
+        if conditions:
+            sql += ' where ' + ' and '.join(conditions)
+        if not count:
+            # the order of a full table scan, whichever index is used
+            sql += ' order by rowid'
+        return sql, params
+
+    def select(self, domain, constraints=()):
+        """
+        Rows of the table of `domain`, in table order, that satisfy all constraints.
+        Args:
+            constraints: list of (column, operator, value), operator one of '=', '<' and '>'
+        """
+        sql, params = self._statement(domain, constraints, count=False)
+        return self.connection(domain).execute(sql, params).fetchall()
+
+    def count(self, domain, constraints=()):
+        """number of rows that `select` would return"""
+        sql, params = self._statement(domain, constraints, count=True)
+        return self.connection(domain).execute(sql, params).fetchone()[0]
+
+    def count_many(self, domain, queries):
+        """`count` of every list of constraints in `queries`, each distinct query is run once"""
+        counts = {}
+        result = []
+        for constraints in queries:
+            key = tuple(tuple(constraint) for constraint in constraints)
+            if key not in counts:
+                counts[key] = self.count(domain, constraints)
+            result.append(counts[key])
+        return result
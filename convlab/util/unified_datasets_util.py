@@ -9,8 +9,6 @@ from abc import ABC, abstractmethod
 from pprint import pprint
 from convlab.util.file_util import cached_path
 import shutil
-from sentence_transformers import SentenceTransformer, util
-import torch
 from tqdm import tqdm
 
 
@@ -479,6 +477,7 @@ def retrieve_utterances(query_turns, turn_pool, top_k, model_name):
     :param model_name: the name of the model you want to use
     :return: A list of dictionaries, with a new key 'retrieve_utterances' that is a list of retrieved turns and similarity scores.
     """
+    from sentence_transformers import SentenceTransformer, util
     embedder = SentenceTransformer(model_name)
     corpus = [turn['utterance'] for turn in turn_pool]
     corpus_embeddings = embedder.encode(corpus, convert_to_tensor=True)
@@ -1,33 +1,42 @@
 import json
 import os
 import random
-from fuzzywuzzy import fuzz
-from itertools import chain
 from zipfile import ZipFile
 from copy import deepcopy
 from convlab.util.unified_datasets_util import BaseDatabase, download_unified_datasets
+from convlab.util.multiwoz.entity_store import get_entity_store, query_table
+
+DOMAINS = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'police']
+DONTCARE_VALUES = ["", "dont care", 'not mentioned', "don't care", "dontcare", "do n't care", "do not care"]
+
+
+def _load_dbs():
+    """extract data.zip and load the database."""
+    data_path = download_unified_datasets('multiwoz21', 'data.zip', os.path.dirname(os.path.abspath(__file__)))
+    archive = ZipFile(data_path)
+    dbs = {}
+    for domain in DOMAINS:
+        with archive.open('data/{}_db.json'.format(domain)) as f:
+            dbs[domain] = json.loads(f.read())
+    # add some missing information
+    dbs['taxi'] = {
+        "taxi_colors": ["black","white","red","yellow","blue","grey"],
+        "taxi_types":  ["toyota","skoda","bmw","honda","ford","audi","lexus","volvo","volkswagen","tesla"],
+        "taxi_phone": ["^[0-9]{10}$"]
+    }
+    dbs['police'][0]['postcode'] = "cb11jg"
+    for entity in dbs['hospital']:
+        entity['postcode'] = "cb20qq"
+        entity['address'] = "Hills Rd, Cambridge"
+    return dbs
 
 
 class Database(BaseDatabase):
     def __init__(self):
-        """extract data.zip and load the database."""
-        data_path = download_unified_datasets('multiwoz21', 'data.zip', os.path.dirname(os.path.abspath(__file__)))
-        archive = ZipFile(data_path)
-        self.domains = ['restaurant', 'hotel', 'attraction', 'train', 'hospital', 'police']
-        self.dbs = {}
-        for domain in self.domains:
-            with archive.open('data/{}_db.json'.format(domain)) as f:
-                self.dbs[domain] = json.loads(f.read())
-        # add some missing information
-        self.dbs['taxi'] = {
-            "taxi_colors": ["black","white","red","yellow","blue","grey"],
-            "taxi_types":  ["toyota","skoda","bmw","honda","ford","audi","lexus","volvo","volkswagen","tesla"],
-            "taxi_phone": ["^[0-9]{10}$"]
-        }
-        self.dbs['police'][0]['postcode'] = "cb11jg"
-        for entity in self.dbs['hospital']:
-            entity['postcode'] = "cb20qq"
-            entity['address'] = "Hills Rd, Cambridge"
+        """load the database, shared by all Database objects of the process."""
+        self.domains = list(DOMAINS)
+        self.tables = get_entity_store('multiwoz21', _load_dbs)
+        self.dbs = {domain: table.entities for domain, table in self.tables.items()}
 
         self.slot2dbattr = {
             'open hours': 'openhours',
@@ -68,49 +77,8 @@ class Database(BaseDatabase):
         state = list(map(lambda ele: (self.slot2dbattr.get(ele[0], ele[0]), ele[1]) if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), state))
         soft_contraints = list(map(lambda ele: (self.slot2dbattr.get(ele[0], ele[0]), ele[1]) if not(ele[0] == 'area' and ele[1] == 'center') else ('area', 'centre'), soft_contraints))
 
-        found = []
-        for i, record in enumerate(self.dbs[domain]):
-            constraints_iterator = zip(state, [False] * len(state))
-            soft_contraints_iterator = zip(soft_contraints, [True] * len(soft_contraints))
-            for (key, val), fuzzy_match in chain(constraints_iterator, soft_contraints_iterator):
-                if val in ["", "dont care", 'not mentioned', "don't care", "dontcare", "do n't care", "do not care"]:
-                    pass
-                else:
-                    try:
-                        if key not in record:
-                            continue
-                        if key == 'leaveAt':
-                            val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
-                            val2 = int(record['leaveAt'].split(':')[0]) * 100 + int(record['leaveAt'].split(':')[1])
-                            if val1 > val2:
-                                break
-                        elif key == 'arriveBy':
-                            val1 = int(val.split(':')[0]) * 100 + int(val.split(':')[1])
-                            val2 = int(record['arriveBy'].split(':')[0]) * 100 + int(record['arriveBy'].split(':')[1])
-                            if val1 < val2:
-                                break
-                        # elif ignore_open and key in ['destination', 'departure', 'name']:
-                        elif ignore_open and key in ['destination', 'departure']:
-                            continue
-                        elif record[key].strip() == '?':
-                            # '?' matches any constraint
-                            continue
-                        else:
-                            if not fuzzy_match:
-                                if val.strip().lower() != record[key].strip().lower():
-                                    break
-                            else:
-                                if fuzz.partial_ratio(val.strip().lower(), record[key].strip().lower()) < fuzzy_match_ratio:
-                                    break
-                    except:
-                        continue
-            else:
-                res = deepcopy(record)
-                res['Ref'] = '{0:08d}'.format(i)
-                found.append(res)
-                if len(found) == topk:
-                    return found
-        return found
+        return query_table(self.tables[domain], state, ignore_open, soft_contraints, fuzzy_match_ratio, topk,
+                           DONTCARE_VALUES)
 
 
 if __name__ == '__main__':
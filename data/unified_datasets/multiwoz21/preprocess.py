@@ -7,7 +7,6 @@ import os
 from tqdm import tqdm
 from collections import Counter
 from pprint import pprint
-from nltk.tokenize import TreebankWordTokenizer, PunktSentenceTokenizer
 
 ontology = {
     "domains": {  # descriptions are adapted from multiwoz22, but is_categorical may be different
@@ -1017,6 +1016,8 @@ def preprocess():
     dataset = 'multiwoz21'
     splits = ['train', 'validation', 'test']
     dialogues_by_split = {split: [] for split in splits}
+    # imported here, the functions used by the agenda policy and the evaluators do not need nltk
+    from nltk.tokenize import TreebankWordTokenizer, PunktSentenceTokenizer
     sent_tokenizer = PunktSentenceTokenizer()
     word_tokenizer = TreebankWordTokenizer()
     booking_remapper = BookingActRemapper(ontology)